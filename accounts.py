@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Comptes expéditeurs multiples: quotas, montée en charge et répartition des contacts
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from datetime import date, datetime, timedelta
+from email.utils import formataddr
+from typing import Dict, List, Optional, Tuple
+
+from smtp_pool import SMTPConnectionPool
+
+logger = logging.getLogger(__name__)
+
+
+class WarmupSchedule:
+    """Plafond journalier croissant d'un compte récent: ``initial`` envois le
+    premier jour, multipliés par ``growth`` chaque jour, jusqu'à ``maximum``."""
+
+    def __init__(self, start_date: date, initial: int = 20, growth: float = 1.5,
+                 maximum: Optional[int] = None):
+        self.start_date = start_date
+        self.initial = initial
+        self.growth = growth
+        self.maximum = maximum
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict]) -> Optional['WarmupSchedule']:
+        if not config:
+            return None
+        return cls(
+            start_date=date.fromisoformat(config['start_date']),
+            initial=config.get('initial', 20),
+            growth=config.get('growth', 1.5),
+            maximum=config.get('max')
+        )
+
+    def daily_cap(self, day: Optional[date] = None) -> Optional[int]:
+        """Plafond du jour (None une fois la montée en charge terminée sans maximum)"""
+        days = max(0, ((day or date.today()) - self.start_date).days)
+        cap = self.initial * self.growth ** days
+        if self.maximum is not None:
+            return int(min(cap, self.maximum))
+        return int(cap) if cap < 1e9 else None
+
+
+class SenderAccount:
+    """Un compte expéditeur: son pool SMTP, son quota de débit, son plafond journalier"""
+
+    def __init__(self, email: str, from_name: str, pool: SMTPConnectionPool, config: Dict,
+                 quota: Optional[Dict] = None, daily_limit: Optional[int] = None,
+                 warmup: Optional[WarmupSchedule] = None):
+        self.email = email
+        self.from_name = from_name
+        self.pool = pool
+        # Configuration complète du compte (pour construire un pool asyncio équivalent)
+        self.config = config
+        self.quota = quota
+        self.daily_limit = daily_limit
+        self.warmup = warmup
+
+        self.throttled_until = 0.0
+        self.assigned = 0
+        self.sent = 0
+        self.failed = 0
+        self.throttles = 0
+        self.failovers_in = 0
+
+    @classmethod
+    def from_config(cls, config: Dict) -> 'SenderAccount':
+        return cls(
+            email=config['email'],
+            from_name=config.get('from_name', ''),
+            pool=SMTPConnectionPool.from_config(config),
+            config=config,
+            quota=config.get('quota'),
+            daily_limit=config.get('daily_limit'),
+            warmup=WarmupSchedule.from_config(config.get('warmup'))
+        )
+
+    @property
+    def from_header(self) -> str:
+        # Seul le nom est encodé (RFC 2047) s'il n'est pas ASCII, jamais l'adresse
+        return formataddr((self.from_name, self.email))
+
+    def daily_cap(self, day: Optional[date] = None) -> Optional[int]:
+        """Plafond du jour: le plus petit de ``daily_limit`` et de la montée en charge"""
+        caps = [c for c in (self.daily_limit, self.warmup.daily_cap(day) if self.warmup else None)
+                if c is not None]
+        return min(caps) if caps else None
+
+    def is_throttled(self, now: Optional[float] = None) -> bool:
+        return (now or time.monotonic()) < self.throttled_until
+
+    def stats(self) -> Dict:
+        return {
+            'assigned': self.assigned,
+            'sent': self.sent,
+            'failed': self.failed,
+            'throttles': self.throttles,
+            'failovers_in': self.failovers_in,
+            'daily_cap': self.daily_cap(),
+            'throttled': self.is_throttled(),
+            'smtp_sessions': self.pool.stats()
+        }
+
+
+class AccountScheduler:
+    """Répartit les contacts entre les comptes expéditeurs.
+
+    Un contact est attribué au compte qui a le plus de quota restant
+    aujourd'hui, puis garde ce compte (attribution persistante): une
+    relance part du même expéditeur. Tant qu'aucun email n'est parti pour
+    ce contact, l'attribution peut basculer vers un autre compte si le
+    sien est limité (erreurs 4xx, plafond atteint, attente de quota
+    supérieure à ``failover_after`` secondes).
+    """
+
+    def __init__(self, accounts: List[SenderAccount], state_path: str = "accounts.sqlite",
+                 failover_after: float = 60.0, throttle_cooldown: float = 300.0):
+        if not accounts:
+            raise ValueError("Au moins un compte expéditeur est requis")
+        self.accounts = accounts
+        self.by_email = {account.email: account for account in accounts}
+        self.failover_after = failover_after
+        self.throttle_cooldown = throttle_cooldown
+        self.failovers = 0
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(state_path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS assignments (
+                contact TEXT PRIMARY KEY,
+                account TEXT NOT NULL,
+                confirmed INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS daily (
+                account TEXT NOT NULL,
+                day TEXT NOT NULL,
+                sent INTEGER NOT NULL,
+                PRIMARY KEY (account, day)
+            );
+        """)
+        self._db.commit()
+
+    @classmethod
+    def from_config(cls, email_config: Dict) -> 'AccountScheduler':
+        """Comptes de ``email.accounts`` (chacun hérite des réglages communs de ``email``),
+        ou le compte unique décrit par ``email``"""
+        shared = {k: v for k, v in email_config.items()
+                  if k not in ('accounts', 'state_path', 'failover_after', 'throttle_cooldown')}
+        entries = email_config.get('accounts') or [{}]
+        accounts = [SenderAccount.from_config({**shared, **entry}) for entry in entries]
+        return cls(
+            accounts,
+            state_path=email_config.get('state_path', "accounts.sqlite"),
+            failover_after=email_config.get('failover_after', 60.0),
+            throttle_cooldown=email_config.get('throttle_cooldown', 300.0)
+        )
+
+    @property
+    def primary(self) -> SenderAccount:
+        return self.accounts[0]
+
+    def rate_rules(self, rate_config: Optional[Dict]) -> Dict:
+        """Section ``rate_limits`` complétée par le ``quota`` de chaque compte
+        (une règle explicite dans ``rate_limits.accounts`` reste prioritaire)"""
+        config = dict(rate_config or {})
+        quotas = {a.email: a.quota for a in self.accounts if a.quota}
+        config['accounts'] = {**quotas, **config.get('accounts', {})}
+        return config
+
+    def sent_today(self, account: SenderAccount) -> int:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT sent FROM daily WHERE account = ? AND day = ?",
+                (account.email, date.today().isoformat())
+            ).fetchone()
+        return row[0] if row else 0
+
+    def remaining_today(self, account: SenderAccount) -> float:
+        cap = account.daily_cap()
+        if cap is None:
+            return float('inf')
+        return max(0, cap - self.sent_today(account))
+
+    def _available(self, account: SenderAccount) -> bool:
+        return not account.is_throttled() and self.remaining_today(account) > 0
+
+    def _best(self, exclude: Tuple[str, ...] = ()) -> Optional[SenderAccount]:
+        """Compte disponible ayant le plus de quota restant, déduction faite des contacts
+        déjà attribués et pas encore envoyés (à égalité, le moins chargé)"""
+        candidates = [a for a in self.accounts if a.email not in exclude and self._available(a)]
+        if not candidates:
+            return None
+        remaining = {a.email: self.remaining_today(a) for a in candidates}
+        # Un compte sans plafond compte comme le plus grand plafond restant
+        finite = [r for r in remaining.values() if r != float('inf')]
+        ceiling = max(finite) if finite else 1e9
+
+        def headroom(account: SenderAccount) -> float:
+            left = remaining[account.email]
+            return (ceiling if left == float('inf') else left) - (account.assigned - account.sent)
+
+        return max(candidates, key=lambda a: (headroom(a), -a.assigned))
+
+    def _lookup(self, contact: str) -> Optional[Tuple[str, bool]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT account, confirmed FROM assignments WHERE contact = ?", (contact,)
+            ).fetchone()
+        return (row[0], bool(row[1])) if row else None
+
+    def _store(self, contact: str, account: SenderAccount):
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO assignments (contact, account, confirmed, updated_at) VALUES (?, ?, 0, ?) "
+                "ON CONFLICT(contact) DO UPDATE SET account = excluded.account, "
+                "updated_at = excluded.updated_at WHERE assignments.confirmed = 0",
+                (contact, account.email, time.time())
+            )
+            self._db.commit()
+            account.assigned += 1
+
+    def assign(self, email: str) -> SenderAccount:
+        """Compte attribué au contact (attribution existante, sinon le meilleur compte)"""
+        contact = email.strip().lower()
+        existing = self._lookup(contact)
+        if existing is not None and existing[0] in self.by_email:
+            account = self.by_email[existing[0]]
+            if existing[1] or self._available(account):
+                return account
+            return self.failover(email, account) or account
+        account = self._best() or min(self.accounts, key=lambda a: a.throttled_until)
+        self._store(contact, account)
+        return account
+
+    def failover(self, email: str, current: SenderAccount) -> Optional[SenderAccount]:
+        """Réattribue le contact à un autre compte disponible, sauf s'il a déjà reçu un email"""
+        alternative = self._alternative(email, current)
+        if alternative is not None:
+            self._reassign(email, current, alternative)
+        return alternative
+
+    def _alternative(self, email: str, current: SenderAccount) -> Optional[SenderAccount]:
+        """Compte de bascule possible pour le contact, sans rien réattribuer"""
+        existing = self._lookup(email.strip().lower())
+        if existing is not None and existing[1]:
+            return None
+        return self._best(exclude=(current.email,))
+
+    def _reassign(self, email: str, current: SenderAccount, alternative: SenderAccount):
+        self._store(email.strip().lower(), alternative)
+        with self._lock:
+            self.failovers += 1
+            alternative.failovers_in += 1
+            current.assigned = max(0, current.assigned - 1)
+        logger.info(f"🔀 {email}: bascule de {current.email} vers {alternative.email}")
+
+    def try_acquire(self, email: str, rate_scheduler) -> Tuple[SenderAccount, float]:
+        """(compte, attente): attente nulle si un jeton a été consommé pour ce compte"""
+        account = self.assign(email)
+        if self.remaining_today(account) <= 0:
+            # Plafond atteint sur tous les comptes: reprise demain
+            tomorrow = datetime.combine(date.today() + timedelta(days=1), datetime.min.time())
+            return account, max(1.0, (tomorrow - datetime.now()).total_seconds())
+        wait = rate_scheduler.try_acquire(email, account=account.email)
+        # wait nul: un jeton vient d'être pris sur ce compte, pas question d'en prendre un second
+        if wait > 0 and wait >= self.failover_after:
+            # Le contact ne change de compte que si l'autre compte enverra plus tôt
+            alternative = self._alternative(email, account)
+            if alternative is not None:
+                alternative_wait = rate_scheduler.try_acquire(email, account=alternative.email)
+                if alternative_wait < wait:
+                    self._reassign(email, account, alternative)
+                    return alternative, alternative_wait
+        return account, wait
+
+    def acquire(self, email: str, rate_scheduler) -> Tuple[SenderAccount, float]:
+        """Bloque jusqu'à ce qu'un compte puisse envoyer au contact; renvoie (compte, attente)"""
+        started = time.monotonic()
+        while True:
+            account, wait = self.try_acquire(email, rate_scheduler)
+            if wait <= 0:
+                waited = time.monotonic() - started
+                rate_scheduler.record_wait(waited)
+                return account, waited
+            if wait > 3600:
+                logger.warning(f"⏳ Plafond journalier atteint pour {account.email}, reprise dans {wait / 3600:.1f}h")
+            time.sleep(min(wait, 600))
+
+    def record_sent(self, account: SenderAccount, email: str):
+        """Compte l'envoi du jour et fige l'attribution du contact"""
+        with self._lock:
+            with self._db:
+                self._db.execute(
+                    "INSERT INTO daily (account, day, sent) VALUES (?, ?, 1) "
+                    "ON CONFLICT(account, day) DO UPDATE SET sent = sent + 1",
+                    (account.email, date.today().isoformat())
+                )
+                self._db.execute(
+                    "UPDATE assignments SET confirmed = 1, account = ? WHERE contact = ?",
+                    (account.email, email.strip().lower())
+                )
+            account.sent += 1
+
+    def record_failure(self, account: SenderAccount, throttled: bool = False):
+        """Compte un échec; un refus temporaire met le compte en pause ``throttle_cooldown`` secondes"""
+        with self._lock:
+            account.failed += 1
+            if throttled:
+                account.throttles += 1
+                account.throttled_until = time.monotonic() + self.throttle_cooldown
+        if throttled:
+            logger.warning(f"🚦 Compte {account.email} limité, en pause {self.throttle_cooldown:.0f}s")
+
+    def stats(self) -> Dict:
+        return {
+            'failovers': self.failovers,
+            'accounts': {
+                account.email: {**account.stats(), 'sent_today': self.sent_today(account)}
+                for account in self.accounts
+            }
+        }
+
+    def close(self):
+        for account in self.accounts:
+            account.pool.close()
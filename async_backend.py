@@ -0,0 +1,501 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Backend asyncio: Serper, OpenRouter et SMTP sur une seule boucle d'événements
+"""
+
+import asyncio
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional
+
+import aiohttp
+import aiosmtplib
+
+from journal import GENERATED, SEARCHED
+from llm_client import extract_content
+from resilience import TransientError, http_error
+from smtp_pool import RECONNECT_CODES, DeliveryUncertain, SMTPSession
+
+logger = logging.getLogger(__name__)
+
+
+class _TrackingAsyncSMTP(aiosmtplib.SMTP):
+    """``aiosmtplib.SMTP`` qui note si la commande DATA a été envoyée pour le message en cours"""
+
+    data_started = False
+
+    async def data(self, message, *args, **kwargs):
+        self.data_started = True
+        return await super().data(message, *args, **kwargs)
+
+
+class AsyncSMTPSession(SMTPSession):
+    """Session SMTP aiosmtplib: mêmes compteurs que ``SMTPSession``, I/O asynchrones"""
+
+    async def connect(self):
+        client = _TrackingAsyncSMTP(hostname=self.host, port=self.port,
+                                    start_tls=self.use_tls, timeout=self.timeout)
+        await client.connect()
+        try:
+            if self.username:
+                await client.login(self.username, self.password)
+        except Exception:
+            client.close()
+            raise
+        self.server = client
+        self.created_at = self.last_used = time.monotonic()
+        self.messages_in_session = 0
+        self.connections += 1
+
+    async def close(self):
+        if self.server is None:
+            return
+        try:
+            await self.server.quit()
+        except Exception:
+            self.server.close()
+        self.server = None
+
+    async def reconnect(self):
+        await self.close()
+        self.reconnects += 1
+        await self.connect()
+
+    async def sendmail(self, from_addr, to_addrs, msg):
+        self.server.data_started = False
+        result = await self.server.sendmail(from_addr, to_addrs, msg)
+        self.last_used = time.monotonic()
+        self.messages_in_session += 1
+        self.messages_sent += 1
+        self.bytes_sent += len(msg)
+        return result
+
+
+def _smtp_error(exc: Exception) -> Exception:
+    """Traduit les erreurs aiosmtplib temporaires (4xx, coupure) en ``TransientError``"""
+    if isinstance(exc, (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPConnectError,
+                        aiosmtplib.SMTPTimeoutError)):
+        return TransientError(str(exc))
+    if isinstance(exc, aiosmtplib.SMTPRecipientsRefused):
+        if exc.recipients and all(400 <= r.code < 500 for r in exc.recipients):
+            return TransientError(str(exc))
+        return exc
+    if isinstance(exc, aiosmtplib.SMTPResponseException) and 400 <= exc.code < 500:
+        return TransientError(str(exc))
+    return exc
+
+
+class AsyncSMTPPool:
+    """Équivalent asyncio de ``SMTPConnectionPool`` (mêmes options de configuration).
+
+    Comme lui, ferme les sessions inactives depuis ``idle_timeout`` secondes
+    (par une tâche de ménage sur la boucle) et ne renvoie jamais un message
+    dont DATA avait commencé quand la connexion a été perdue, au premier
+    essai comme après une reconnexion: ``DeliveryUncertain`` est levée.
+    """
+
+    def __init__(self, host: str, port: int, username: str, password: str,
+                 size: int = 2, max_messages_per_session: int = 100,
+                 idle_timeout: float = 60.0, use_tls: bool = True,
+                 timeout: float = 30):
+        self.max_messages_per_session = max_messages_per_session
+        self.idle_timeout = idle_timeout
+        self._sessions = [
+            AsyncSMTPSession(i, host, port, username, password, use_tls, timeout)
+            for i in range(max(1, size))
+        ]
+        self._idle: asyncio.LifoQueue = asyncio.LifoQueue()
+        for session in self._sessions:
+            self._idle.put_nowait(session)
+        self._reaper: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_config(cls, email_config: Dict) -> 'AsyncSMTPPool':
+        pool_config = email_config.get('pool', {})
+        return cls(
+            host=email_config['smtp_server'],
+            port=email_config['smtp_port'],
+            # "auth": false pour un relais local sans authentification
+            username=email_config['email'] if pool_config.get('auth', True) else '',
+            password=email_config['password'],
+            size=pool_config.get('size', 2),
+            max_messages_per_session=pool_config.get('max_messages_per_session', 100),
+            idle_timeout=pool_config.get('idle_timeout', 60.0),
+            use_tls=pool_config.get('use_tls', True),
+            timeout=pool_config.get('timeout', 30)
+        )
+
+    async def sendmail(self, from_addr: str, to_addr: str, msg) -> None:
+        session = await self._idle.get()
+        try:
+            if session.is_expired(self.max_messages_per_session, self.idle_timeout):
+                await session.close()
+            if not session.connected:
+                await session.connect()
+                self._start_reaper()
+            try:
+                await session.sendmail(from_addr, [to_addr], msg)
+                return
+            except (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPTimeoutError) as e:
+                if session.data_started:
+                    session.errors += 1
+                    await session.close()
+                    raise DeliveryUncertain(f"connexion perdue pendant DATA: {e}") from e
+                if isinstance(e, aiosmtplib.SMTPTimeoutError):
+                    session.errors += 1
+                    await session.close()
+                    raise
+                logger.info(f"🔄 Session SMTP #{session.session_id} déconnectée, reconnexion...")
+            except aiosmtplib.SMTPResponseException as e:
+                if e.code not in RECONNECT_CODES:
+                    session.errors += 1
+                    raise
+                logger.info(f"🔄 Session SMTP #{session.session_id}: {e.code}, reconnexion...")
+            except aiosmtplib.SMTPRecipientsRefused:
+                session.errors += 1
+                raise
+            except Exception:
+                session.errors += 1
+                await session.close()
+                raise
+
+            session.errors += 1
+            try:
+                await session.reconnect()
+                await session.sendmail(from_addr, [to_addr], msg)
+            except Exception as e:
+                # Même règle qu'au premier essai: jamais de renvoi une fois DATA commencé
+                uncertain = (isinstance(e, (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPTimeoutError))
+                             and session.data_started)
+                await session.close()
+                if uncertain:
+                    raise DeliveryUncertain(f"connexion perdue pendant DATA: {e}") from e
+                raise
+        finally:
+            self._idle.put_nowait(session)
+
+    def _start_reaper(self):
+        if not self.idle_timeout or self._reaper is not None:
+            return
+        self._reaper = asyncio.get_running_loop().create_task(self._reap())
+
+    async def _reap(self):
+        """Ferme les sessions inactives depuis ``idle_timeout`` secondes (QUIT propre)"""
+        while True:
+            await asyncio.sleep(max(0.05, self.idle_timeout / 2))
+            idle = []
+            while not self._idle.empty():
+                idle.append(self._idle.get_nowait())
+            expired = [session for session in idle if session.is_expired(0, self.idle_timeout)]
+            # Les autres reprennent leur place; les expirées sont hors du pool le temps du QUIT
+            for session in reversed(idle):
+                if session not in expired:
+                    self._idle.put_nowait(session)
+            for session in expired:
+                logger.debug(f"Session SMTP #{session.session_id} inactive depuis {self.idle_timeout}s, fermeture")
+                await session.close()
+                self._idle.put_nowait(session)
+
+    def stats(self):
+        return [session.stats() for session in self._sessions]
+
+    async def close(self):
+        """Arrête le ménage et ferme les sessions"""
+        reaper, self._reaper = self._reaper, None
+        if reaper is not None:
+            reaper.cancel()
+            try:
+                await reaper
+            except asyncio.CancelledError:
+                pass
+        for session in self._sessions:
+            await session.close()
+
+
+class AsyncEmailBackend:
+    """Exécute les étages d'``EmailAutomationSystem`` en asyncio.
+
+    Les appels Serper et OpenRouter passent par une ``aiohttp.ClientSession``
+    partagée (connexions keep-alive réutilisées par hôte) et l'envoi par un
+    pool aiosmtplib. Jusqu'à ``concurrency`` contacts sont traités en même
+    temps sur la boucle. Le prompt, le parsing, le message MIME, les quotas
+    et le cache de recherche restent ceux du système synchrone.
+
+    Rien de bloquant ne tourne sur la boucle: les écritures d'état (journal,
+    emails, quotas et comptes, résultats, lettres mortes) passent par un
+    unique thread d'écriture, qui garde leur ordre; le rendu MIME et la
+    lecture des contacts passent par ``asyncio.to_thread``.
+    """
+
+    def __init__(self, system, concurrency: int = 100, http_connections: int = 32):
+        self.system = system
+        self.config = system.config
+        self.concurrency = max(1, concurrency)
+        self.http_connections = http_connections
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.smtp_pool: Optional[AsyncSMTPPool] = None
+        # Un pool aiosmtplib par compte expéditeur
+        self.smtp_pools: Dict[str, AsyncSMTPPool] = {}
+        self._inflight_searches: Dict[str, asyncio.Future] = {}
+        self._inbox: Optional[asyncio.Queue] = None
+        self._writer: Optional[ThreadPoolExecutor] = None
+        self.http_requests = 0
+
+    @classmethod
+    def from_config(cls, system) -> 'AsyncEmailBackend':
+        async_config = system.config.get('async', {})
+        return cls(system,
+                   concurrency=async_config.get('concurrency', 100),
+                   http_connections=async_config.get('http_connections', 32))
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.http_connections, keepalive_timeout=30)
+        self.session = aiohttp.ClientSession(connector=connector,
+                                             timeout=aiohttp.ClientTimeout(total=30))
+        self.smtp_pools = {account.email: AsyncSMTPPool.from_config(account.config)
+                           for account in self.system.senders.accounts}
+        self.smtp_pool = self.smtp_pools[self.system.senders.primary.email]
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="async-writer")
+        return self
+
+    async def __aexit__(self, *exc):
+        for pool in self.smtp_pools.values():
+            await pool.close()
+        await self.session.close()
+        self._writer.shutdown(wait=True)
+
+    async def _write(self, func, *args, **kwargs):
+        """Exécute ``func`` (disque, SQLite) sur le thread d'écriture, hors de la boucle"""
+        return await asyncio.get_running_loop().run_in_executor(
+            self._writer, functools.partial(func, *args, **kwargs)
+        )
+
+    async def _fetch_company_info(self, query: str) -> Dict:
+        base_url = self.config['serper'].get('base_url', "https://google.serper.dev")
+        headers = {
+            'X-API-KEY': self.config["serper"]["api_key"],
+            'Content-Type': 'application/json'
+        }
+        payload = {
+            "q": query,
+            "location": self.config["serper"]["location"],
+            "gl": self.config["serper"]["gl"]
+        }
+        self.http_requests += 1
+        try:
+            async with self.session.post(base_url + "/search", json=payload, headers=headers) as res:
+                if res.status != 200:
+                    raise http_error("Serper", res.status, res.headers.get('Retry-After'))
+                return await res.json(content_type=None)
+        except aiohttp.ClientConnectionError as e:
+            raise TransientError(str(e)) from e
+
+    async def search_company_info(self, company_name: str) -> Dict:
+        """Recherche Serper, avec cache et une seule requête en vol par entreprise"""
+        query = f"{company_name} Maroc entreprise société"
+        location, gl = self.config["serper"]["location"], self.config["serper"]["gl"]
+        cache = self.system.search_cache
+        endpoint = self.system.resilience['serper']
+        try:
+            if cache is None:
+                return await endpoint.acall(self._fetch_company_info, query)
+
+            value = await asyncio.to_thread(cache.lookup, query, location, gl)
+            if value is not None:
+                return value
+
+            future = self._inflight_searches.get(query)
+            if future is not None:
+                return await asyncio.shield(future)
+            future = self._inflight_searches[query] = asyncio.get_running_loop().create_future()
+            try:
+                value = await endpoint.acall(self._fetch_company_info, query)
+                await asyncio.to_thread(cache.store, query, location, gl, value)
+                future.set_result(value)
+                return value
+            except Exception as e:
+                future.set_exception(e)
+                # Évite l'avertissement "exception never retrieved" sans demandeur concurrent
+                future.exception()
+                raise
+            finally:
+                self._inflight_searches.pop(query, None)
+
+        except Exception as e:
+            logger.error(f"Erreur lors de la recherche pour {company_name}: {e}")
+            return {"organic": []}
+
+    async def _complete(self, headers: Dict, data: Dict) -> str:
+        self.http_requests += 1
+        started = time.monotonic()
+        try:
+            async with self.session.post(
+                self.config['openrouter']['base_url'] + "/chat/completions",
+                headers=headers, json=data
+            ) as response:
+                if response.status != 200:
+                    raise http_error("OpenRouter", response.status, response.headers.get('Retry-After'))
+                result = await response.json(content_type=None)
+        except aiohttp.ClientConnectionError as e:
+            raise TransientError(str(e)) from e
+        self.system.llm.record(result.get('usage'), time.monotonic() - started)
+        return extract_content(result)
+
+    async def generate_personalized_email(self, company_name: str, Nom_ceo: str, Titre: str,
+                                          search_results: Dict) -> str:
+        """Génère l'email (avec réessais); lève une exception si la génération échoue"""
+        prompt = self.system.build_prompt(company_name, Nom_ceo, Titre, search_results)
+        headers, data = self.system.build_llm_request(prompt)
+        try:
+            content = await self.system.resilience['openrouter'].acall(self._complete, headers, data)
+        except Exception as e:
+            logger.error(f"Erreur lors de la génération d'email pour {company_name}: {e}")
+            raise
+        logger.debug(f"Email généré pour {company_name}")
+        return content
+
+    async def wait_for_quota(self, to_email: str, sender=None):
+        """Attend que les quotas d'envoi autorisent ce destinataire, sans bloquer la boucle;
+        renvoie le compte expéditeur retenu (``sender`` imposé, ou celui attribué au contact)"""
+        scheduler = self.system.rate_scheduler
+        started = time.monotonic()
+        while True:
+            if sender is None:
+                account, wait = await self._write(self.system.senders.try_acquire, to_email, scheduler)
+            else:
+                account = sender
+                wait = await self._write(scheduler.try_acquire, to_email, account=sender.email)
+            if wait <= 0:
+                break
+            await asyncio.sleep(min(wait, 600))
+        scheduler.record_wait(time.monotonic() - started)
+        return account
+
+    async def _sendmail(self, sender: str, to_email: str, msg: bytes):
+        try:
+            await self.smtp_pools[sender].sendmail(sender, to_email, msg)
+        except Exception as e:
+            error = _smtp_error(e)
+            if error is e:
+                raise
+            raise error from e
+
+    async def deliver(self, to_email: str, company_name: str, subject: str, body: str,
+                      cv_path: Optional[str] = None, scheduled: bool = False,
+                      message_id: Optional[str] = None, sender=None):
+        """Version asyncio d'``EmailAutomationSystem.deliver`` (même rendu, même journalisation)"""
+        sender = sender or self.system.senders.primary
+        data, cv_attached = await asyncio.to_thread(
+            self.system.prepare_delivery, to_email, company_name, subject, body,
+            cv_path, scheduled, message_id, sender
+        )
+        metrics = self.system.metrics
+        with metrics.span('smtp'):
+            await self.system.smtp_endpoint(sender).acall(self._sendmail, sender.email, to_email, data)
+        metrics.inc('smtp_bytes_sent_total', len(data), account=sender.email)
+        self.system.log_delivered(to_email, company_name, cv_attached, scheduled)
+
+    async def send_with_failover(self, to_email: str, sender, send):
+        """Version asyncio d'``EmailAutomationSystem.send_with_failover`` (même choix de bascule)"""
+        while True:
+            try:
+                await send(sender)
+            except Exception as e:
+                alternative = await self._write(self.system.failover_after, to_email, sender, e)
+                sender = await self.wait_for_quota(to_email, alternative)
+                continue
+            await self._write(self.system.senders.record_sent, sender, to_email)
+            return sender
+
+    async def send_email(self, to_email: str, company_name: str, subject: str, body: str,
+                         cv_path: Optional[str] = None, scheduled: bool = False,
+                         message_id: Optional[str] = None) -> bool:
+        try:
+            await self.deliver(to_email, company_name, subject, body, cv_path, scheduled, message_id)
+            return True
+        except Exception as e:
+            logger.error(f"❌ Erreur envoi à {to_email} ({company_name}): {e}")
+            return False
+
+    async def process_person(self, person_data: Dict, cv_path: Optional[str] = None,
+                             scheduled: bool = False) -> Dict:
+        """Traite une personne: recherche + génération + envoi"""
+        system = self.system
+        job = system._new_job(person_data, cv_path, scheduled)
+        metrics = system.metrics
+        try:
+            logger.log(system.log_sampler.level('process'),
+                       f"🏢 Traitement de {job['company_name']} - <{job['email']}>")
+            with metrics.span('search'):
+                job['search_results'] = await self.search_company_info(job['company_name'])
+            await self._write(system._journal, job, SEARCHED)
+            if await asyncio.to_thread(system._lookup_cached_email, job):
+                await self._write(system._journal, job, GENERATED, "cache")
+            else:
+                with metrics.span('generate'):
+                    job['email_content'] = await self.generate_personalized_email(
+                        job['company_name'], job['Nom_ceo'], job['Titre'], job['search_results']
+                    )
+                await self._write(system._journal, job, GENERATED)
+            job = await self._write(system._stage_parse, job)
+            sender = await self.wait_for_quota(job['email'])
+            message_id = await self._write(system._begin_send, job)
+            try:
+                job['sender'] = (await self.send_with_failover(
+                    job['email'], sender,
+                    lambda account: self.deliver(job['email'], job['company_name'], job['subject'],
+                                                 job['body'], cv_path, scheduled, message_id, account)
+                )).email
+            except Exception as e:
+                logger.error(f"❌ Erreur envoi à {job['email']} ({job['company_name']}): {e}")
+                return await self._write(system._record_result, job, False, str(e))
+            return await self._write(system._record_result, job, True)
+        except Exception as e:
+            logger.error(f"💥 Erreur lors du traitement de ({job['company_name']}): {e}")
+            return await self._write(system._record_failure, job, e)
+
+    async def run(self, companies: Iterable[Dict], cv_path: Optional[str] = None,
+                  scheduled: bool = False) -> int:
+        """Traite tous les contacts avec au plus ``concurrency`` en vol; renvoie le nombre injecté.
+
+        Les contacts sont lus hors de la boucle (fichier, décompression, dédoublonnage).
+        """
+        inbox = self._inbox = asyncio.Queue(maxsize=self.concurrency * 2)
+
+        async def worker():
+            while True:
+                person = await inbox.get()
+                if person is None:
+                    return
+                await self.process_person(person, cv_path, scheduled)
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        contacts = iter(companies)
+        count = 0
+        try:
+            while True:
+                person = await asyncio.to_thread(next, contacts, None)
+                if person is None:
+                    break
+                await inbox.put(person)
+                count += 1
+        finally:
+            for _ in workers:
+                await inbox.put(None)
+            await asyncio.gather(*workers)
+        return count
+
+    def queue_depths(self) -> Dict[str, int]:
+        """Contacts lus en attente d'un worker (même interface que ``CampaignPipeline``)"""
+        return {'inbox': self._inbox.qsize() if self._inbox is not None else 0}
+
+    def stats(self) -> Dict:
+        return {
+            'mode': 'async',
+            'concurrency': self.concurrency,
+            'http_requests': self.http_requests,
+            'smtp_sessions': {email: pool.stats() for email, pool in self.smtp_pools.items()}
+        }
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Registre des pièces jointes: fichier lu et encodé en base64 une seule fois par campagne
+"""
+
+import base64
+import hashlib
+import logging
+import mimetypes
+import mmap
+import os
+import threading
+import time
+from email.mime.base import MIMEBase
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def _read_mapped(path: Path) -> Tuple[bytes, str]:
+    """Renvoie (base64 MIME, sha256) du fichier, lu via mmap"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b"", hashlib.sha256(b"").hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return base64.encodebytes(mapped), hashlib.sha256(mapped).hexdigest()
+
+
+class Attachment:
+    """Une pièce jointe pré-encodée, réutilisée telle quelle dans chaque message.
+
+    Le fichier est surveillé par ``stat`` (au plus une fois par
+    ``check_interval`` secondes): si sa date de modification ou sa taille
+    change, son empreinte est recalculée et la partie MIME reconstruite
+    uniquement si le contenu a réellement changé.
+    """
+
+    def __init__(self, path: str, filename: Optional[str] = None,
+                 mimetype: Optional[str] = None, check_interval: float = 1.0):
+        self.path = Path(path)
+        self.filename = filename or self.path.name
+        self.mimetype = mimetype or mimetypes.guess_type(self.filename)[0] or 'application/octet-stream'
+        self.check_interval = check_interval
+
+        self._lock = threading.Lock()
+        self._part: Optional[MIMEBase] = None
+        self._stat_key: Optional[Tuple[int, int]] = None
+        self._checked_at = 0.0
+        self.sha256: Optional[str] = None
+        self.encoded_size = 0
+        self.encodings = 0
+
+        self._load()
+
+    def _load(self):
+        stat = self.path.stat()
+        encoded, digest = _read_mapped(self.path)
+        self._stat_key = (stat.st_mtime_ns, stat.st_size)
+        self._checked_at = time.monotonic()
+        if digest == self.sha256 and self._part is not None:
+            return
+
+        maintype, subtype = self.mimetype.split('/', 1)
+        part = MIMEBase(maintype, subtype)
+        part.set_payload(encoded.decode('ascii'))
+        part['Content-Transfer-Encoding'] = 'base64'
+        part.add_header('Content-Disposition', f'attachment; filename= {self.filename}')
+
+        self._part = part
+        self.sha256 = digest
+        self.encoded_size = len(encoded)
+        self.encodings += 1
+        logger.info(f"📎 Pièce jointe encodée: {self.path} ({self.encoded_size} octets base64)")
+
+    def part(self) -> MIMEBase:
+        """Partie MIME à attacher (revalidée si le fichier a changé)"""
+        with self._lock:
+            now = time.monotonic()
+            if now - self._checked_at >= self.check_interval:
+                self._checked_at = now
+                try:
+                    stat = self.path.stat()
+                    if (stat.st_mtime_ns, stat.st_size) != self._stat_key:
+                        logger.info(f"🔄 Pièce jointe modifiée, revalidation: {self.path}")
+                        self._load()
+                except OSError as e:
+                    # Fichier momentanément absent: on garde la dernière version encodée
+                    logger.warning(f"Pièce jointe inaccessible ({self.path}), version en cache utilisée: {e}")
+            return self._part
+
+    def stats(self) -> Dict:
+        return {
+            'path': str(self.path),
+            'filename': self.filename,
+            'sha256': self.sha256,
+            'encoded_size': self.encoded_size,
+            'encodings': self.encodings
+        }
+
+
+class AttachmentRegistry:
+    """Pièces jointes d'une campagne: le CV (résolu une fois parmi des chemins candidats)
+    et des pièces supplémentaires déclarées dans la configuration."""
+
+    def __init__(self, check_interval: float = 1.0):
+        self.check_interval = check_interval
+        self.extras: List[Attachment] = []
+        self._resolved: Dict[Tuple, Optional[Attachment]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: Optional[List[Dict]]) -> 'AttachmentRegistry':
+        """Construit le registre; ``config`` est la liste ``attachments`` de config.json"""
+        registry = cls()
+        for entry in config or []:
+            registry.add(entry['path'], entry.get('filename'), entry.get('mimetype'))
+        return registry
+
+    def add(self, path: str, filename: Optional[str] = None,
+            mimetype: Optional[str] = None) -> Attachment:
+        """Ajoute une pièce jointe supplémentaire à tous les messages"""
+        attachment = Attachment(path, filename, mimetype, self.check_interval)
+        self.extras.append(attachment)
+        return attachment
+
+    def resolve(self, candidates: Sequence[Optional[str]], filename: str,
+                mimetype: str = 'application/octet-stream') -> Optional[Attachment]:
+        """Premier chemin existant parmi ``candidates``, encodé une seule fois et mémorisé"""
+        key = (tuple(candidates), filename)
+        with self._lock:
+            if key in self._resolved:
+                return self._resolved[key]
+            attachment = None
+            for path in candidates:
+                if path and Path(path).exists():
+                    try:
+                        attachment = Attachment(path, filename, mimetype, self.check_interval)
+                        logger.info(f"CV attaché depuis: {path}")
+                        break
+                    except Exception as e:
+                        logger.warning(f"Erreur pièce jointe {path}: {e}")
+            if attachment is None:
+                logger.warning("⚠️ Aucun CV trouvé pour pièce jointe")
+            self._resolved[key] = attachment
+            return attachment
+
+    def clear(self):
+        """Oublie les CV résolus (une nouvelle campagne les recherche à nouveau)"""
+        with self._lock:
+            self._resolved.clear()
+
+    def stats(self) -> List[Dict]:
+        attachments = [a for a in self._resolved.values() if a is not None] + self.extras
+        return [a.stats() for a in attachments]
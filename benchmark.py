@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark du moteur de campagne: contacts synthétiques, faux services, débit, latences et mémoire
+"""
+
+import csv
+import json
+import logging
+import multiprocessing
+import resource
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence
+
+from dry_run import DryRun
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZES = (100, 10000, 100000)
+
+# Corps typique d'un email généré (accents compris: encodage UTF-8 réel)
+SAMPLE_BODY = ("Bonjour,\n\nJe me permets de vous contacter au sujet d'un poste d'ingénieur IA/ML "
+               "au sein de votre équipe. Vos projets récents m'ont particulièrement intéressé.\n\n") * 4
+
+
+def write_contacts(path: str, count: int, domains: int = 1000):
+    """CSV de ``count`` contacts synthétiques répartis sur ``domains`` domaines"""
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Nom_ceo', 'Titre', 'company_name', 'email'])
+        for i in range(count):
+            writer.writerow([f"Dirigeant {i}", "CEO", f"Entreprise {i}",
+                             f"contact{i}@domaine{i % domains}.test"])
+
+
+def peak_rss_mb() -> float:
+    """Pic de mémoire résidente du processus courant (Mo)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Octets sous macOS, kilo-octets sous Linux
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def run_size(config_path: str, size: int, options: Dict) -> Dict:
+    """Une campagne à blanc de ``size`` contacts (à lancer dans un processus dédié pour
+    que le pic de mémoire ne mesure qu'elle)"""
+    # Import tardif: main importe ce module pour sa ligne de commande
+    from main import EmailAutomationSystem
+
+    # Les logs INFO par contact fausseraient la mesure
+    logging.getLogger().setLevel(logging.WARNING)
+    with DryRun.from_file(config_path, **options['latency']) as dry:
+        # Le benchmark mesure le moteur, pas la réutilisation des caches
+        dry.config['search_cache'] = {**dry.config['search_cache'], 'enabled': False}
+        dry.config['email_cache'] = {**dry.config['email_cache'], 'enabled': False}
+        with open(dry.config_path, 'w', encoding='utf-8') as f:
+            json.dump(dry.config, f, ensure_ascii=False)
+
+        csv_path = str(Path(dry.workdir) / f"contacts_{size}.csv")
+        write_contacts(csv_path, size)
+        cv_path = str(Path(dry.workdir) / "cv.pdf")
+        with open(cv_path, 'wb') as f:
+            f.write(b"%PDF-1.4\n" + b"0" * 200 * 1024)
+
+        system = EmailAutomationSystem(dry.config_path)
+        started = time.perf_counter()
+        system.run_email_campaign(csv_path, cv_path, max_workers=options['workers'],
+                                  delay_between_emails=0)
+        elapsed = time.perf_counter() - started
+        return {
+            'contacts': size,
+            'seconds': round(elapsed, 2),
+            'contacts_per_sec': round(size / elapsed, 1) if elapsed else None,
+            'sent': system.campaign_stats.sent,
+            'failed': system.campaign_stats.failed,
+            'stages': {
+                name: {key: stats[key] for key in ('latency_p50', 'latency_p95', 'latency_p99')}
+                for name, stats in system.pipeline_stats.items()
+            },
+            'peak_rss_mb': peak_rss_mb(),
+            'mock': dry.stats()
+        }
+
+
+def _run_size_process(config_path: str, size: int, options: Dict, results):
+    try:
+        results.put(run_size(config_path, size, options))
+    except Exception as e:
+        results.put({'contacts': size, 'error': repr(e)})
+
+
+def run_benchmark(config_path: str = "config.json", sizes: Sequence[int] = DEFAULT_SIZES,
+                  workers: int = 3, search_latency: float = 0.0, llm_latency: float = 0.0,
+                  smtp_latency: float = 0.0, jitter: float = 0.0,
+                  output: Optional[str] = None) -> List[Dict]:
+    """Lance une campagne à blanc par taille, chacune dans un processus neuf"""
+    options = {
+        'workers': workers,
+        'latency': {'search_latency': search_latency, 'llm_latency': llm_latency,
+                    'smtp_latency': smtp_latency, 'jitter': jitter}
+    }
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for size in sizes:
+        logger.info(f"⏱️ Benchmark: {size} contacts")
+        queue = context.Queue()
+        process = context.Process(target=_run_size_process, args=(config_path, size, options, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+        results.append(result)
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump({'options': options, 'results': results}, f, indent=2, ensure_ascii=False)
+    return results
+
+
+def format_result(result: Dict) -> str:
+    """Résumé lisible d'une taille du benchmark"""
+    if 'error' in result:
+        return f"{result['contacts']:>7} contacts: ERREUR {result['error']}"
+    lines = [f"{result['contacts']:>7} contacts: {result['contacts_per_sec']} contacts/s "
+             f"({result['seconds']}s, {result['sent']} envoyés, {result['failed']} échecs), "
+             f"pic RSS {result['peak_rss_mb']} Mo"]
+    for name, stats in result['stages'].items():
+        lines.append(f"          {name:<9} p50 {stats['latency_p50'] * 1000:8.1f} ms   "
+                     f"p95 {stats['latency_p95'] * 1000:8.1f} ms   p99 {stats['latency_p99'] * 1000:8.1f} ms")
+    return "\n".join(lines)
+
+
+def _measure(render: Callable[[int], object], messages: int, sample: int = 50) -> Dict:
+    """Débit de ``render(i)`` sur ``messages`` appels, puis mémoire par message sous tracemalloc"""
+    render(0)
+    started = time.perf_counter()
+    for i in range(messages):
+        render(i)
+    elapsed = time.perf_counter() - started
+
+    tracemalloc.start()
+    try:
+        # Pic transitoire: un message à la fois, résultat aussitôt libéré
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        for i in range(sample):
+            render(i)
+        peak = tracemalloc.get_traced_memory()[1] - baseline
+        # Blocs et octets encore alloués par message rendu (objets conservés)
+        before = tracemalloc.take_snapshot()
+        kept = [render(i) for i in range(sample)]
+        diff = tracemalloc.take_snapshot().compare_to(before, 'filename')
+    finally:
+        tracemalloc.stop()
+    del kept
+    return {
+        'messages_per_sec': round(messages / elapsed, 1) if elapsed else None,
+        'peak_bytes_per_message': peak,
+        'blocks_per_message': round(sum(stat.count_diff for stat in diff) / sample, 1),
+        'bytes_per_message': round(sum(stat.size_diff for stat in diff) / sample)
+    }
+
+
+def run_mime_benchmark(config_path: str = "config.json", messages: int = 2000,
+                       attachment_kb: int = 200) -> Dict:
+    """Microbenchmark du rendu MIME: ``MIMEMultipart`` + ``as_string`` (chemin historique)
+    contre le gabarit précalculé de la campagne (``render_message``)"""
+    from main import EmailAutomationSystem
+
+    logging.getLogger().setLevel(logging.WARNING)
+    with DryRun.from_file(config_path) as dry:
+        cv_path = str(Path(dry.workdir) / "cv.pdf")
+        with open(cv_path, 'wb') as f:
+            f.write(b"%PDF-1.4\n" + b"0" * attachment_kb * 1024)
+        system = EmailAutomationSystem(dry.config_path)
+
+        def legacy(i: int):
+            msg, _ = system.build_message(f"contact{i}@domaine{i % 1000}.test", f"Entreprise {i}",
+                                          f"Candidature - Ingénieur IA/ML - Entreprise {i}",
+                                          SAMPLE_BODY, cv_path, message_id=f"<{i}@bench.test>")
+            return msg.as_string()
+
+        def template(i: int):
+            return system.render_message(f"contact{i}@domaine{i % 1000}.test", f"Entreprise {i}",
+                                         f"Candidature - Ingénieur IA/ML - Entreprise {i}",
+                                         SAMPLE_BODY, cv_path, message_id=f"<{i}@bench.test>")[0]
+
+        result = {
+            'messages': messages,
+            'attachment_kb': attachment_kb,
+            'message_bytes': len(template(0)),
+            'mimemultipart': _measure(legacy, messages),
+            'template': _measure(template, messages)
+        }
+    speedup = (result['template']['messages_per_sec'] or 0) / (result['mimemultipart']['messages_per_sec'] or 1)
+    result['speedup'] = round(speedup, 1)
+    return result
+
+
+def format_mime_result(result: Dict) -> str:
+    """Résumé lisible du microbenchmark MIME"""
+    lines = [f"Rendu MIME: {result['messages']} messages de {result['message_bytes']} octets "
+             f"(pièce jointe {result['attachment_kb']} Ko), x{result['speedup']}"]
+    for name in ('mimemultipart', 'template'):
+        stats = result[name]
+        lines.append(f"  {name:<14} {stats['messages_per_sec']:>10} msg/s   "
+                     f"pic {stats['peak_bytes_per_message']:>9} o/msg   "
+                     f"{stats['blocks_per_message']:>7} blocs/msg   {stats['bytes_per_message']:>9} o conservés/msg")
+    return "\n".join(lines)
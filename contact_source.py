@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Lecture en flux des contacts (CSV, CSV.gz, JSONL) avec validation et dédoublonnage
+"""
+
+import csv
+import gzip
+import hashlib
+import json
+import logging
+import math
+import re
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+EMAIL_RE = re.compile(
+    r"^[A-Za-z0-9.!#$%&'*+/=?^_`{|}~-]+@"
+    r"[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?"
+    r"(?:\.[A-Za-z0-9](?:[A-Za-z0-9-]{0,61}[A-Za-z0-9])?)+$"
+)
+
+
+def normalize_email(email: str) -> str:
+    """Forme canonique d'une adresse pour le dédoublonnage"""
+    return email.strip().lower()
+
+
+def _digest(value: str) -> bytes:
+    return hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+
+
+class CompactSeenSet:
+    """Ensemble des adresses déjà vues, sous forme d'empreintes de 8 octets.
+
+    Les empreintes sont réparties selon leurs ``bits`` premiers bits dans
+    des tableaux ``array('Q')`` (8 octets par adresse, plus ~5 Mo fixes
+    pour 65 536 tableaux); chaque recherche parcourt en C un seul tableau,
+    court. Deux adresses de même empreinte (probabilité ~n²/2⁶⁵) seraient
+    confondues.
+    """
+
+    def __init__(self, bits: int = 16):
+        self._buckets: List[Optional[array]] = [None] * (1 << bits)
+        self._shift = 64 - bits
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, value: str) -> bool:
+        """Ajoute la valeur; renvoie False si elle était déjà présente"""
+        key = int.from_bytes(_digest(value)[:8], 'little')
+        bucket = self._buckets[key >> self._shift]
+        if bucket is None:
+            bucket = self._buckets[key >> self._shift] = array('Q')
+        elif key in bucket:
+            return False
+        bucket.append(key)
+        self._size += 1
+        return True
+
+
+class BloomFilter:
+    """Filtre de Bloom: mémoire fixe, faux positifs possibles (``error_rate``), jamais de faux négatifs"""
+
+    def __init__(self, capacity: int = 1_000_000, error_rate: float = 0.001):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value: str):
+        digest = _digest(value)
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, value: str) -> bool:
+        """Ajoute la valeur; renvoie False si elle était (probablement) déjà présente"""
+        new = False
+        for pos in self._positions(value):
+            byte, bit = divmod(pos, 8)
+            if not self._bits[byte] & (1 << bit):
+                self._bits[byte] |= 1 << bit
+                new = True
+        return new
+
+
+class ContactSource:
+    """Itérateur paresseux sur les contacts d'un fichier.
+
+    Formats reconnus d'après l'extension: ``.csv``, ``.jsonl`` et leurs
+    variantes compressées ``.gz``. Chaque ligne est validée (email,
+    entreprise) puis dédoublonnée sur l'email normalisé; les lignes
+    rejetées sont écrites avec leur motif dans ``rejects_path`` (JSONL).
+    Seul l'ensemble des adresses vues est gardé en mémoire.
+
+    ``domain_counts`` (première passe facultative, pour estimer la durée
+    de la campagne) lit tout le fichier; jusqu'à ``buffer_limit`` contacts
+    retenus, ils sont gardés et l'itération suivante les rejoue sans
+    relire le fichier. Au-delà, le fichier est relu en flux.
+    """
+
+    def __init__(self, path: str, rejects_path: Optional[str] = None,
+                 dedupe: str = "exact", bloom_capacity: int = 1_000_000,
+                 bloom_error_rate: float = 0.001, buffer_limit: int = 50_000):
+        self.path = Path(path)
+        self.rejects_path = rejects_path
+        self.dedupe = dedupe
+        self.bloom_capacity = bloom_capacity
+        self.bloom_error_rate = bloom_error_rate
+        self.buffer_limit = buffer_limit
+
+        self.read = 0
+        self.accepted = 0
+        self.rejected: Counter = Counter()
+        self._buffer: Optional[List[Dict]] = None
+
+    @classmethod
+    def from_config(cls, path: str, config: Optional[Dict],
+                    report_dir: Optional[str] = None) -> 'ContactSource':
+        """Construit la source depuis la section ``contacts`` de config.json.
+
+        Le fichier des rejets (relatif) est rangé dans ``report_dir``, avec les rapports.
+        """
+        config = config or {}
+        rejects_path = config.get('rejects_path', f"{Path(path).name}.rejects.jsonl")
+        if rejects_path and report_dir:
+            rejects_path = str(Path(report_dir) / rejects_path)
+        return cls(
+            path,
+            rejects_path=rejects_path or None,
+            dedupe=config.get('dedupe', "exact"),
+            bloom_capacity=config.get('bloom_capacity', 1_000_000),
+            bloom_error_rate=config.get('bloom_error_rate', 0.001),
+            buffer_limit=config.get('buffer_limit', 50_000)
+        )
+
+    def _open(self):
+        suffixes = [s.lower() for s in self.path.suffixes]
+        if suffixes and suffixes[-1] == '.gz':
+            return gzip.open(self.path, 'rt', encoding='utf-8', newline=''), suffixes[:-1]
+        return open(self.path, 'r', encoding='utf-8', newline=''), suffixes
+
+    def _rows(self) -> Iterator[Tuple[int, Optional[Dict], Optional[str]]]:
+        """Lignes brutes: (numéro, dict ou None, erreur de lecture ou None)"""
+        handle, suffixes = self._open()
+        with handle:
+            if suffixes and suffixes[-1] in ('.jsonl', '.ndjson'):
+                for line_no, line in enumerate(handle, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        row = json.loads(line)
+                    except ValueError:
+                        yield line_no, None, "JSON invalide"
+                        continue
+                    if not isinstance(row, dict):
+                        yield line_no, None, "objet JSON attendu"
+                        continue
+                    yield line_no, row, None
+            else:
+                reader = csv.DictReader(handle)
+                for row in reader:
+                    # Numéro de ligne du fichier (l'en-tête est la ligne 1)
+                    yield reader.line_num, row, None
+
+    @staticmethod
+    def validate(row: Dict) -> Tuple[Optional[Dict], Optional[str]]:
+        """Renvoie (contact normalisé, None) ou (None, motif du rejet)"""
+        email = (row.get('email') or '').strip()
+        if not email:
+            return None, "email manquant"
+        if not EMAIL_RE.match(email):
+            return None, "email invalide"
+        company_name = (row.get('company_name') or '').strip()
+        if not company_name:
+            return None, "company_name manquant"
+        return {
+            'company_name': company_name,
+            'email': email,
+            'Nom_ceo': (row.get('Nom_ceo') or '').strip(),
+            'Titre': (row.get('Titre') or '').strip(),
+            # Fuseau IANA facultatif (fenêtres d'envoi planifiées)
+            'timezone': (row.get('timezone') or '').strip()
+        }, None
+
+    def __iter__(self) -> Iterator[Dict]:
+        if self._buffer is not None:
+            # Contacts retenus par domain_counts: pas de seconde lecture du fichier
+            buffer, self._buffer = self._buffer, None
+            yield from buffer
+            return
+        yield from self._scan()
+
+    def _scan(self) -> Iterator[Dict]:
+        """Lecture, validation, dédoublonnage et écriture des rejets (compteurs remis à zéro)"""
+        self.read = self.accepted = 0
+        self.rejected = Counter()
+        seen = (BloomFilter(self.bloom_capacity, self.bloom_error_rate)
+                if self.dedupe == "bloom" else CompactSeenSet())
+        rejects = open(self.rejects_path, 'w', encoding='utf-8') if self.rejects_path else None
+        try:
+            for line_no, row, error in self._rows():
+                self.read += 1
+                contact = None
+                if error is None:
+                    contact, error = self.validate(row)
+                if contact is not None and not seen.add(normalize_email(contact['email'])):
+                    contact, error = None, "doublon"
+                if contact is None:
+                    self.rejected[error] += 1
+                    if rejects:
+                        rejects.write(json.dumps({'line': line_no, 'reason': error, 'row': row},
+                                                 ensure_ascii=False) + "\n")
+                    continue
+                self.accepted += 1
+                yield contact
+        finally:
+            if rejects:
+                rejects.close()
+            logger.info(f"Chargé {self.accepted} contacts ({sum(self.rejected.values())} rejetés)")
+
+    def domain_counts(self) -> Counter:
+        """Première passe: nombre de contacts retenus (valides, dédoublonnés) par domaine"""
+        domains: Counter = Counter()
+        buffer: Optional[List[Dict]] = []
+        for contact in self._scan():
+            domains[contact['email'].rsplit('@', 1)[-1].lower()] += 1
+            if buffer is not None:
+                buffer.append(contact)
+                if len(buffer) > self.buffer_limit:
+                    buffer = None
+        self._buffer = buffer
+        return domains
+
+    def stats(self) -> Dict:
+        return {
+            'read': self.read,
+            'accepted': self.accepted,
+            'rejected': dict(self.rejected),
+            'rejects_file': self.rejects_path
+        }
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exécution à blanc: faux services Serper / OpenRouter et serveur SMTP puits, en local
+"""
+
+import copy
+import json
+import logging
+import random
+import socketserver
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Configuration minimale quand aucun config.json n'est disponible (CI, benchmark)
+DEFAULT_CONFIG = {
+    "openrouter": {"api_key": "dry-run", "model": "dry-run", "base_url": "http://127.0.0.1"},
+    "email": {
+        "smtp_server": "127.0.0.1",
+        "smtp_port": 25,
+        "email": "candidat@dry-run.test",
+        "password": "dry-run",
+        "from_name": "Dry Run"
+    },
+    "serper": {"api_key": "dry-run", "location": "Morocco", "gl": "ma"},
+    "portfolio_url": "https://dry-run.test",
+    "schedule_time": "08:00"
+}
+
+# Latences injectées par défaut (secondes, et variation en fraction)
+DRY_RUN_LATENCY = {'search_latency': 0.05, 'llm_latency': 0.2, 'smtp_latency': 0.01, 'jitter': 0.2}
+
+
+class Latency:
+    """Latence injectée par un faux service: ``base`` secondes, ± ``jitter`` (fraction)"""
+
+    def __init__(self, base: float = 0.0, jitter: float = 0.0):
+        self.base = max(0.0, base)
+        self.jitter = max(0.0, jitter)
+
+    def sleep(self):
+        if self.base > 0:
+            time.sleep(self.base * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+
+class MockAPIServer:
+    """Faux Serper (``/search``) et faux OpenRouter (``/chat/completions``) sur un même port.
+
+    Les réponses ont le format attendu par le système (résultats
+    ``organic``, email ``OBJET:`` / ``CORPS:``, marqueurs du mode
+    ``packed``), avec la latence configurée pour chaque service.
+    """
+
+    def __init__(self, search_latency: Latency, llm_latency: Latency):
+        self.search_latency = search_latency
+        self.llm_latency = llm_latency
+        self.searches = 0
+        self.completions = 0
+        self._lock = threading.Lock()
+
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive: les sessions HTTP partagées du système réutilisent la connexion
+            protocol_version = "HTTP/1.1"
+            # En-têtes et corps en une seule écriture, sans attente de Nagle
+            wbufsize = 64 * 1024
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b"{}")
+                if self.path.endswith("/search"):
+                    response = api.search(request)
+                elif self.path.endswith("/chat/completions"):
+                    response = api.complete(request)
+                else:
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                body = json.dumps(response, ensure_ascii=False).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def search(self, request: Dict) -> Dict:
+        self.search_latency.sleep()
+        with self._lock:
+            self.searches += 1
+        query = request.get('q', '')
+        return {"organic": [
+            {"title": f"{query} - résultat {i}", "snippet": f"Présentation de {query} ({i})."}
+            for i in range(1, 4)
+        ]}
+
+    def complete(self, request: Dict) -> Dict:
+        self.llm_latency.sleep()
+        prompt = request['messages'][-1]['content']
+        count = prompt.count("--- Demande ")
+        with self._lock:
+            self.completions += 1
+        email = "OBJET: Candidature - Ingénieur IA/ML\nCORPS:\nBonjour,\n\nEmail généré à blanc.\n\nCordialement"
+        if count > 1:
+            content = "\n".join(f"=== EMAIL {i} ===\n{email}" for i in range(1, count + 1))
+        else:
+            content = email
+        return {
+            "choices": [{"message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4}
+        }
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name="dry-run-api", daemon=True).start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class SinkSMTPServer:
+    """Serveur SMTP puits: accepte tout, ne garde que des compteurs (pas de TLS ni d'authentification)"""
+
+    def __init__(self, latency: Latency):
+        self.latency = latency
+        self.messages = 0
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+        sink = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            disable_nagle_algorithm = True
+
+            def reply(self, line: bytes):
+                self.wfile.write(line + b"\r\n")
+
+            def handle(self):
+                self.reply(b"220 dry-run ESMTP")
+                for line in self.rfile:
+                    command = line[:4].upper()
+                    if command == b"EHLO":
+                        self.wfile.write(b"250-dry-run\r\n250-8BITMIME\r\n250 SIZE 52428800\r\n")
+                    elif command == b"DATA":
+                        self.reply(b"354 End data with <CR><LF>.<CR><LF>")
+                        size = 0
+                        for data in self.rfile:
+                            if data == b".\r\n":
+                                break
+                            size += len(data)
+                        sink.latency.sleep()
+                        with sink._lock:
+                            sink.messages += 1
+                            sink.bytes += size
+                        self.reply(b"250 OK queued")
+                    elif command == b"QUIT":
+                        self.reply(b"221 Bye")
+                        return
+                    elif command in (b"HELO", b"MAIL", b"RCPT", b"RSET", b"NOOP"):
+                        self.reply(b"250 OK")
+                    else:
+                        self.reply(b"502 Command not implemented")
+
+        class Server(socketserver.ThreadingTCPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        self._server = Server(('127.0.0.1', 0), Handler)
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name="dry-run-smtp", daemon=True).start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self) -> Dict:
+        return {'messages': self.messages, 'bytes': self.bytes}
+
+
+def dry_run_config(config: Dict, api_url: str, smtp_port: int, workdir: str) -> Dict:
+    """Copie de la configuration branchée sur les faux services, avec tous les fichiers
+    d'état (journal, outbox, caches, file, minuteurs, quotas, rapports) dans ``workdir``.
+
+    Les quotas d'envoi sont retirés: l'envoi va au rythme du serveur puits.
+    Le point /metrics, s'il est configuré, passe sur un port libre choisi par
+    le système pour ne jamais prendre celui de la production.
+    """
+    config = copy.deepcopy(config)
+    work = Path(workdir)
+    config['openrouter']['base_url'] = api_url
+    config['serper']['base_url'] = api_url
+
+    def local_smtp(account: Dict):
+        account.update(smtp_server="127.0.0.1", smtp_port=smtp_port, password="dry-run")
+        account['pool'] = {**account.get('pool', {}), 'use_tls': False, 'auth': False}
+
+    local_smtp(config['email'])
+    for account in config['email'].get('accounts', []):
+        local_smtp(account)
+    config['email']['state_path'] = str(work / "accounts.sqlite")
+
+    for section, filename in (('journal', "campaign_journal.sqlite"), ('outbox', "outbox.sqlite"),
+                              ('search_cache', "search_cache.sqlite"), ('email_cache', "email_cache.sqlite"),
+                              ('queue', "job_queue.sqlite"), ('scheduler', "scheduler.sqlite")):
+        config[section] = {**config.get(section, {}), 'path': str(work / filename)}
+    config['rate_limits'] = {'state_file': str(work / "rate_limits_state.json")}
+    config['resilience'] = {**config.get('resilience', {}),
+                            'dead_letter_path': str(work / "dead_letter.jsonl")}
+    config['report_dir'] = str(work)
+    if config.get('metrics', {}).get('port') is not None:
+        config['metrics'] = {**config['metrics'], 'port': 0}
+    return config
+
+
+class DryRun:
+    """Faux services démarrés pour la durée d'un bloc ``with``.
+
+    ``config_path`` pointe vers une configuration temporaire à passer à
+    ``EmailAutomationSystem`` (ou à des workers dans d'autres processus).
+    """
+
+    def __init__(self, config: Dict, search_latency: float = 0.05, llm_latency: float = 0.2,
+                 smtp_latency: float = 0.01, jitter: float = 0.2, workdir: Optional[str] = None):
+        self.base_config = config
+        self.api = MockAPIServer(Latency(search_latency, jitter), Latency(llm_latency, jitter))
+        self.smtp = SinkSMTPServer(Latency(smtp_latency, jitter))
+        self._tempdir = None if workdir else tempfile.TemporaryDirectory(prefix="dry-run-")
+        self.workdir = workdir or self._tempdir.name
+        self.config_path = str(Path(self.workdir) / "config.json")
+
+    @classmethod
+    def from_file(cls, config_path: str, **options) -> 'DryRun':
+        """Part de ``config_path`` s'il existe, sinon de ``DEFAULT_CONFIG``"""
+        if Path(config_path).exists():
+            with open(config_path, 'r', encoding='utf-8') as f:
+                config = json.load(f)
+        else:
+            logger.info(f"🧪 {config_path} introuvable, configuration par défaut")
+            config = DEFAULT_CONFIG
+        return cls(config, **options)
+
+    def __enter__(self) -> 'DryRun':
+        Path(self.workdir).mkdir(parents=True, exist_ok=True)
+        self.api.start()
+        self.smtp.start()
+        self.config = dry_run_config(self.base_config, self.api.url, self.smtp.port, self.workdir)
+        with open(self.config_path, 'w', encoding='utf-8') as f:
+            json.dump(self.config, f, indent=2, ensure_ascii=False)
+        logger.info(f"🧪 Exécution à blanc: API {self.api.url}, SMTP 127.0.0.1:{self.smtp.port}, "
+                    f"fichiers dans {self.workdir}")
+        return self
+
+    def __exit__(self, *exc):
+        self.api.stop()
+        self.smtp.stop()
+        if self._tempdir is not None:
+            self._tempdir.cleanup()
+
+    def stats(self) -> Dict:
+        return {
+            'searches': self.api.searches,
+            'completions': self.api.completions,
+            'smtp': self.smtp.stats(),
+            'workdir': self.workdir
+        }
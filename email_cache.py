@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cache des emails générés (objet + corps parsés), indexé par modèle, version du prompt et entrées
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import sqlite3
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def email_key(model: str, prompt_version: str, prompt: str) -> str:
+    """Clé de contenu: SHA-256 du modèle, de la version du prompt et du prompt rendu (entreprise,
+    destinataire, extraits de recherche)"""
+    payload = json.dumps([model, prompt_version, prompt], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class EmailCache:
+    """Emails déjà générés, réutilisés lors d'un nouvel essai ou d'une nouvelle campagne.
+
+    Stockage SQLite avec durée de vie (``ttl``) et plafond d'entrées
+    (``max_entries``) appliqué par éviction LRU, comme ``SearchCache``.
+    Changer de modèle ou de version de prompt change la clé: les anciennes
+    entrées ne sont plus lues et finissent évincées.
+    """
+
+    def __init__(self, path: str = "email_cache.sqlite", ttl: float = 30 * 24 * 3600,
+                 max_entries: int = 100000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS email_cache (
+                key TEXT PRIMARY KEY,
+                company TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                subject TEXT NOT NULL,
+                body TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_email_cache_accessed ON email_cache(accessed_at)"
+        )
+        self._db.commit()
+        # Nombre d'entrées, tenu à jour à chaque écriture (pas de COUNT(*) par ajout)
+        self._entries = self._db.execute("SELECT COUNT(*) FROM email_cache").fetchone()[0]
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict]) -> Optional['EmailCache']:
+        """Construit le cache depuis la section ``email_cache`` (None si désactivé)"""
+        config = config or {}
+        if not config.get('enabled', True):
+            return None
+        return cls(
+            path=config.get('path', "email_cache.sqlite"),
+            ttl=config.get('ttl_days', 30) * 24 * 3600,
+            max_entries=config.get('max_entries', 100000)
+        )
+
+    def get(self, key: str) -> Optional[Tuple[str, str]]:
+        """Renvoie (objet, corps) ou None si absent ou expiré"""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT subject, body, created_at FROM email_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[2] > self.ttl:
+                self._db.execute("DELETE FROM email_cache WHERE key = ?", (key,))
+                self._db.commit()
+                self._entries -= 1
+                self.expired += 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute(
+                "UPDATE email_cache SET accessed_at = ?, hits = hits + 1 WHERE key = ?", (now, key)
+            )
+            self._db.commit()
+            self.hits += 1
+        return row[0], row[1]
+
+    def put(self, key: str, company: str, model: str, prompt_version: str,
+            subject: str, body: str):
+        """Enregistre un email parsé; évince les entrées les moins récemment lues au-delà du plafond"""
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE email_cache SET company = ?, model = ?, prompt_version = ?, subject = ?, body = ?, "
+                "created_at = ?, accessed_at = ?, hits = 0 WHERE key = ?",
+                (company, model, prompt_version, subject, body, now, now, key)
+            )
+            if cursor.rowcount == 0:
+                self._db.execute(
+                    "INSERT INTO email_cache "
+                    "(key, company, model, prompt_version, subject, body, created_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key, company, model, prompt_version, subject, body, now, now)
+                )
+                self._entries += 1
+            overflow = self._entries - self.max_entries
+            if overflow > 0:
+                cursor = self._db.execute(
+                    "DELETE FROM email_cache WHERE key IN "
+                    "(SELECT key FROM email_cache ORDER BY accessed_at LIMIT ?)",
+                    (overflow,)
+                )
+                self._entries -= cursor.rowcount
+                self.evictions += cursor.rowcount
+            self._db.commit()
+
+    def entries(self, limit: int = 20, company: Optional[str] = None) -> List[Dict]:
+        """Dernières entrées (les plus récemment lues d'abord)"""
+        query = "SELECT key, company, model, prompt_version, subject, created_at, accessed_at, hits FROM email_cache"
+        params: tuple = ()
+        if company:
+            query += " WHERE company = ?"
+            params = (company,)
+        query += " ORDER BY accessed_at DESC LIMIT ?"
+        with self._lock:
+            rows = self._db.execute(query, params + (limit,)).fetchall()
+        columns = ('key', 'company', 'model', 'prompt_version', 'subject', 'created_at', 'accessed_at', 'hits')
+        return [dict(zip(columns, row)) for row in rows]
+
+    def purge(self, expired_only: bool = True, company: Optional[str] = None) -> int:
+        """Supprime les entrées expirées, celles d'une entreprise, ou tout; renvoie le nombre supprimé"""
+        with self._lock:
+            if company:
+                cursor = self._db.execute("DELETE FROM email_cache WHERE company = ?", (company,))
+            elif expired_only:
+                cursor = self._db.execute(
+                    "DELETE FROM email_cache WHERE created_at < ?", (time.time() - self.ttl,)
+                )
+                self.expired += cursor.rowcount
+            else:
+                cursor = self._db.execute("DELETE FROM email_cache")
+            self._db.commit()
+            self._entries -= cursor.rowcount
+        return cursor.rowcount
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        with self._lock:
+            # Recalé sur la base: d'autres processus peuvent partager le fichier
+            self._entries, stored_hits = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM email_cache"
+            ).fetchone()
+        return {
+            'entries': self._entries,
+            # Réutilisations cumulées sur toutes les campagnes
+            'stored_hits': stored_hits,
+            'hits': self.hits,
+            'misses': self.misses,
+            'expired': self.expired,
+            'evictions': self.evictions,
+            'hit_rate': f"{(self.hits / lookups * 100) if lookups else 0:.1f}%"
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def main(argv: Optional[List[str]] = None):
+    """Inspection, purge et préchauffage du cache d'emails en ligne de commande"""
+    parser = argparse.ArgumentParser(description="Cache des emails générés")
+    parser.add_argument('--config', default="config.json", help="fichier de configuration")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('stats', help="nombre d'entrées et taux de succès")
+    show = commands.add_parser('list', help="entrées les plus récemment utilisées")
+    show.add_argument('--limit', type=int, default=20)
+    show.add_argument('--company', help="filtrer sur une entreprise")
+    purge = commands.add_parser('purge', help="supprime des entrées (expirées par défaut)")
+    purge.add_argument('--all', action='store_true', help="vide entièrement le cache")
+    purge.add_argument('--company', help="supprime les entrées d'une entreprise")
+    prewarm = commands.add_parser('prewarm', help="génère à l'avance les emails d'un CSV (sans envoi)")
+    prewarm.add_argument('csv_path')
+    prewarm.add_argument('--workers', type=int, default=3)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'prewarm':
+        # Import tardif: main importe ce module
+        from main import EmailAutomationSystem
+        system = EmailAutomationSystem(args.config)
+        if system.email_cache is None:
+            print("Cache d'emails désactivé (email_cache.enabled = false)")
+            return 1
+        system.prewarm_email_cache(args.csv_path, max_workers=args.workers)
+        print(json.dumps(system.email_cache.stats(), indent=2, ensure_ascii=False))
+        return 0
+
+    with open(args.config, 'r', encoding='utf-8') as f:
+        cache = EmailCache.from_config(json.load(f).get('email_cache'))
+    if cache is None:
+        print("Cache d'emails désactivé (email_cache.enabled = false)")
+        return 1
+    try:
+        if args.command == 'stats':
+            print(json.dumps(cache.stats(), indent=2, ensure_ascii=False))
+        elif args.command == 'list':
+            for entry in cache.entries(args.limit, args.company):
+                print(json.dumps(entry, ensure_ascii=False))
+        elif args.command == 'purge':
+            removed = cache.purge(expired_only=not args.all, company=args.company)
+            print(f"{removed} entrées supprimées")
+    finally:
+        cache.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
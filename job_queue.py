@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+File de contacts partagée entre processus: baux, remise en file et résultats centralisés
+"""
+
+import argparse
+import json
+import logging
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class LeaseAbandoned(Exception):
+    """Contact abandonné: ses baux ont expiré ``max_attempts`` fois (workers morts)"""
+
+
+class JobQueue:
+    """Contacts d'un lot à préparer, réclamés par des workers concurrents.
+
+    Un worker réclame des contacts pour ``lease_seconds`` secondes et
+    renouvelle son bail tant qu'il les traite. Si le worker meurt, le bail
+    expire et les contacts repartent en file pour un autre worker (au plus
+    ``max_attempts`` fois, puis ``on_abandoned(contenu, erreur)`` est
+    appelé pour la lettre morte et le journal). Le résultat de chaque
+    contact (préparé ou en échec, par quel worker) reste dans la file:
+    c'est le point central agrégé par le rapport.
+
+    Le stockage est un fichier SQLite en WAL, partagé par les processus
+    d'une même machine. Le WAL repose sur une mémoire partagée locale: le
+    fichier ne doit pas être placé sur un disque réseau (NFS, SMB).
+    """
+
+    def __init__(self, path: str = "job_queue.sqlite", lease_seconds: float = 300.0,
+                 max_attempts: int = 3, poll_interval: float = 1.0,
+                 worker_id: Optional[str] = None,
+                 on_abandoned: Optional[Callable[[Dict, LeaseAbandoned], None]] = None):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max(1, max_attempts)
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.on_abandoned = on_abandoned
+        self.requeued = 0
+
+        self._lock = threading.Lock()
+        # Transactions explicites (BEGIN IMMEDIATE) pour réclamer sans conflit entre processus
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                batch TEXT NOT NULL,
+                email TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                state TEXT NOT NULL,
+                worker TEXT,
+                lease_expires REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                created_at REAL NOT NULL,
+                finished_at REAL,
+                UNIQUE (batch, email)
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs(batch, state, id);
+        """)
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict]) -> Optional['JobQueue']:
+        """Construit la file depuis la section ``queue`` (None si désactivée)"""
+        config = config or {}
+        if not config.get('enabled', True):
+            return None
+        return cls(
+            path=config.get('path', "job_queue.sqlite"),
+            lease_seconds=config.get('lease_seconds', 300.0),
+            max_attempts=config.get('max_attempts', 3),
+            poll_interval=config.get('poll_interval', 1.0)
+        )
+
+    def enqueue(self, batch: str, contacts: Iterable[Dict], chunk_size: int = 1000,
+                **extra) -> int:
+        """Ajoute les contacts au lot (un contact déjà présent est ignoré); renvoie le nombre ajouté.
+
+        ``extra`` (chemin du CV, planification...) est joint à chaque contact.
+        """
+        added = 0
+        chunk: List[tuple] = []
+
+        def flush():
+            nonlocal added
+            with self._lock:
+                self._db.execute("BEGIN IMMEDIATE")
+                cursor = self._db.executemany(
+                    "INSERT OR IGNORE INTO jobs (batch, email, payload, state, created_at) "
+                    "VALUES (?, ?, ?, ?, ?)", chunk
+                )
+                self._db.execute("COMMIT")
+            added += cursor.rowcount
+            chunk.clear()
+
+        for contact in contacts:
+            payload = json.dumps({'contact': contact, **extra}, ensure_ascii=False)
+            chunk.append((batch, contact['email'].strip().lower(), payload, QUEUED, time.time()))
+            if len(chunk) >= chunk_size:
+                flush()
+        if chunk:
+            flush()
+        return added
+
+    def latest_batch(self) -> Optional[str]:
+        """Dernier lot ayant encore des contacts à traiter"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT batch FROM jobs WHERE state IN (?, ?) ORDER BY id DESC LIMIT 1",
+                (QUEUED, LEASED)
+            ).fetchone()
+        return row[0] if row else None
+
+    def claim(self, batch: str, limit: int = 10) -> List[Dict]:
+        """Réclame jusqu'à ``limit`` contacts libres (ou dont le bail a expiré)"""
+        now = time.time()
+        claimed = []
+        abandoned = []
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._db.execute(
+                    "SELECT id, payload, state, attempts, worker FROM jobs WHERE batch = ? "
+                    "AND (state = ? OR (state = ? AND lease_expires < ?)) ORDER BY id LIMIT ?",
+                    (batch, QUEUED, LEASED, now, limit)
+                ).fetchall()
+                for job_id, payload, state, attempts, worker in rows:
+                    if state == LEASED:
+                        self.requeued += 1
+                        logger.warning(f"♻️ Bail expiré (worker {worker}), contact #{job_id} remis en file")
+                        if attempts >= self.max_attempts:
+                            result = {'success': False, 'stage': 'queue',
+                                      'error': f"abandonné après {attempts} baux expirés"}
+                            self._db.execute(
+                                "UPDATE jobs SET state = ?, result = ?, finished_at = ? WHERE id = ?",
+                                (FAILED, json.dumps(result, ensure_ascii=False), now, job_id)
+                            )
+                            abandoned.append(({'id': job_id, **json.loads(payload)}, result['error']))
+                            continue
+                    self._db.execute(
+                        "UPDATE jobs SET state = ?, worker = ?, lease_expires = ?, "
+                        "attempts = attempts + 1 WHERE id = ?",
+                        (LEASED, self.worker_id, now + self.lease_seconds, job_id)
+                    )
+                    claimed.append({'id': job_id, **json.loads(payload)})
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        # Hors transaction: le rappel écrit dans d'autres fichiers (lettres mortes, journal)
+        for item, error in abandoned:
+            logger.error(f"💀 Contact #{item['id']} abandonné: {error}")
+            if self.on_abandoned is not None:
+                try:
+                    self.on_abandoned(item, LeaseAbandoned(error))
+                except Exception as e:
+                    logger.exception(f"💥 Erreur en traitant l'abandon du contact #{item['id']}: {e}")
+        return claimed
+
+    def iter_claims(self, batch: str, limit: int = 10) -> Iterator[Dict]:
+        """Réclame les contacts du lot au fil de la consommation, jusqu'à ce qu'il soit épuisé.
+
+        Tant que d'autres workers détiennent des contacts, on attend: leur
+        bail peut expirer et ces contacts revenir en file.
+        """
+        while True:
+            claimed = self.claim(batch, limit)
+            if claimed:
+                yield from claimed
+                continue
+            if not self.remaining(batch):
+                return
+            time.sleep(self.poll_interval)
+
+    def renew(self) -> int:
+        """Prolonge les baux de ce worker; renvoie le nombre de contacts concernés"""
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE worker = ? AND state = ?",
+                (time.time() + self.lease_seconds, self.worker_id, LEASED)
+            )
+        return cursor.rowcount
+
+    def start_heartbeat(self) -> threading.Event:
+        """Renouvelle les baux en tâche de fond; renvoie l'évènement qui l'arrête"""
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(self.lease_seconds / 3):
+                self.renew()
+
+        threading.Thread(target=beat, name="job-queue-heartbeat", daemon=True).start()
+        return stop
+
+    def _finish(self, job_id: int, state: str, result: Dict):
+        # Seul le détenteur du bail conclut: un worker dont le bail a été repris n'écrase rien
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET state = ?, result = ?, finished_at = ? "
+                "WHERE id = ? AND worker = ? AND state = ?",
+                (state, json.dumps(result, ensure_ascii=False), time.time(),
+                 job_id, self.worker_id, LEASED)
+            )
+
+    def complete(self, job_id: int, result: Dict):
+        self._finish(job_id, DONE, result)
+
+    def fail(self, job_id: int, result: Dict):
+        self._finish(job_id, FAILED, result)
+
+    def remaining(self, batch: str) -> int:
+        """Contacts du lot encore en file ou en cours de traitement"""
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM jobs WHERE batch = ? AND state IN (?, ?)",
+                (batch, QUEUED, LEASED)
+            ).fetchone()[0]
+
+    def failures(self, batch: str) -> List[Dict]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT email, worker, result FROM jobs WHERE batch = ? AND state = ? ORDER BY id",
+                (batch, FAILED)
+            ).fetchall()
+        return [{'email': email, 'worker': worker, **json.loads(result or '{}')}
+                for email, worker, result in rows]
+
+    def summary(self, batch: str) -> Dict:
+        """Agrégat central du lot: états, répartition par worker, remises en file, échecs"""
+        with self._lock:
+            states = dict(self._db.execute(
+                "SELECT state, COUNT(*) FROM jobs WHERE batch = ? GROUP BY state", (batch,)
+            ).fetchall())
+            workers: Dict[str, Dict[str, int]] = {}
+            for worker, state, count in self._db.execute(
+                "SELECT worker, state, COUNT(*) FROM jobs WHERE batch = ? AND worker IS NOT NULL "
+                "GROUP BY worker, state", (batch,)
+            ):
+                workers.setdefault(worker, {})[state] = count
+            requeued = self._db.execute(
+                "SELECT COALESCE(SUM(attempts - 1), 0) FROM jobs WHERE batch = ? AND attempts > 1",
+                (batch,)
+            ).fetchone()[0]
+        return {
+            'batch': batch,
+            'states': states,
+            'workers': workers,
+            'requeued': requeued,
+            'failures': self.failures(batch)
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def main(argv: Optional[List[str]] = None):
+    """Worker de préparation et état de la file en ligne de commande"""
+    parser = argparse.ArgumentParser(description="File de contacts partagée")
+    parser.add_argument('--config', default="config.json", help="fichier de configuration")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    worker = commands.add_parser('worker', help="prépare les contacts du lot (recherche, génération, rendu)")
+    worker.add_argument('--batch', help="lot à traiter (par défaut le dernier en cours)")
+    worker.add_argument('--workers', type=int, default=3, help="largeur des étages réseau")
+    status = commands.add_parser('status', help="état agrégé d'un lot")
+    status.add_argument('--batch', help="lot à afficher (par défaut le dernier en cours)")
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'worker':
+        # Import tardif: main importe ce module
+        from main import EmailAutomationSystem
+        system = EmailAutomationSystem(args.config)
+        if system.job_queue is None:
+            print("File de contacts désactivée (queue.enabled = false)")
+            return 1
+        system.run_worker(args.batch, max_workers=args.workers)
+        return 0
+
+    with open(args.config, 'r', encoding='utf-8') as f:
+        jobs = JobQueue.from_config(json.load(f).get('queue'))
+    if jobs is None:
+        print("File de contacts désactivée (queue.enabled = false)")
+        return 1
+    try:
+        batch = args.batch or jobs.latest_batch()
+        if batch is None:
+            print("Aucun lot en cours")
+            return 1
+        print(json.dumps(jobs.summary(batch), indent=2, ensure_ascii=False))
+    finally:
+        jobs.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Journal durable de campagne (SQLite WAL): reprise après crash et envois sans doublon
+"""
+
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+SEARCHED = 'searched'
+GENERATED = 'generated'
+PREPARED = 'prepared'
+SENDING = 'sending'
+SENT = 'sent'
+FAILED = 'failed'
+
+# États qui excluent un nouvel envoi lors d'une reprise. SENDING veut dire
+# que le serveur SMTP a peut-être accepté le message avant le crash: on
+# préfère ne pas renvoyer (au plus une fois) plutôt que de doubler l'envoi.
+DONE_STATES = (SENT, SENDING)
+
+
+def contact_key(email: str) -> str:
+    return email.strip().lower()
+
+
+class CampaignJournal:
+    """Journal en ajout seul des transitions d'état de chaque contact.
+
+    Chaque transition (recherché, généré, en cours d'envoi, envoyé, échoué)
+    est ajoutée à la table ``events`` et reflétée dans ``contacts`` (dernier
+    état connu), dans une même transaction validée sur disque. L'état
+    ``sending`` est écrit *avant* la remise au serveur SMTP avec un
+    Message-ID déterministe: après un crash, ces contacts ne sont pas
+    renvoyés et restent signalés comme incertains.
+    """
+
+    def __init__(self, path: str = "campaign_journal.sqlite"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # fsync à chaque commit: une transition validée survit à un crash
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS runs (
+                run_id TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                started_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS contacts (
+                run_id TEXT NOT NULL,
+                contact TEXT NOT NULL,
+                state TEXT NOT NULL,
+                message_id TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (run_id, contact)
+            );
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                run_id TEXT NOT NULL,
+                contact TEXT NOT NULL,
+                state TEXT NOT NULL,
+                detail TEXT,
+                at REAL NOT NULL
+            );
+        """)
+        self._db.commit()
+        self.run_id: Optional[str] = None
+        self._done: Set[str] = set()
+        self.skipped = 0
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict]) -> Optional['CampaignJournal']:
+        """Construit le journal depuis la section ``journal`` (None si désactivé)"""
+        config = config or {}
+        if not config.get('enabled', True):
+            return None
+        return cls(config.get('path', "campaign_journal.sqlite"))
+
+    def start(self, source: str, resume: bool = False, run_id: Optional[str] = None) -> str:
+        """Ouvre une exécution pour ``source``; avec ``resume``, reprend la dernière
+        (ou ``run_id`` si précisé, par exemple le lot d'une outbox préparée).
+
+        En reprise, les contacts déjà envoyés (ou en cours d'envoi au moment
+        du crash) sont chargés en mémoire pour un test en O(1) par ligne.
+        """
+        source = str(Path(source).resolve())
+        self.skipped = 0
+        with self._lock:
+            row = None
+            if run_id is not None:
+                row = self._db.execute("SELECT run_id FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+            elif resume:
+                row = self._db.execute(
+                    "SELECT run_id FROM runs WHERE source = ? ORDER BY started_at DESC LIMIT 1",
+                    (source,)
+                ).fetchone()
+            if row is not None:
+                self.run_id = row[0]
+                placeholders = ",".join("?" for _ in DONE_STATES)
+                self._done = {
+                    contact for (contact,) in self._db.execute(
+                        f"SELECT contact FROM contacts WHERE run_id = ? AND state IN ({placeholders})",
+                        (self.run_id, *DONE_STATES)
+                    )
+                }
+                logger.info(f"♻️ Reprise de la campagne {self.run_id}: {len(self._done)} contacts déjà traités")
+            else:
+                if resume:
+                    logger.warning(f"Aucune campagne à reprendre pour {source}, nouvelle campagne")
+                self.run_id = f"{Path(source).stem}-{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+                self._done = set()
+                self._db.execute("INSERT INTO runs (run_id, source, started_at) VALUES (?, ?, ?)",
+                                 (self.run_id, source, time.time()))
+                self._db.commit()
+        return self.run_id
+
+    def is_done(self, email: str) -> bool:
+        """Vrai si le contact ne doit pas être renvoyé dans cette exécution"""
+        if contact_key(email) in self._done:
+            self.skipped += 1
+            return True
+        return False
+
+    def state(self, email: str, run_id: Optional[str] = None) -> Optional[str]:
+        """Dernier état enregistré du contact (sur disque, y compris par un autre processus)"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT state FROM contacts WHERE run_id = ? AND contact = ?",
+                (run_id or self.run_id, contact_key(email))
+            ).fetchone()
+        return row[0] if row else None
+
+    def message_id(self, email: str, domain: str = "localhost") -> str:
+        """Message-ID stable pour (exécution, contact): un renvoi éventuel reste identifiable"""
+        digest = hashlib.sha256(f"{self.run_id}:{contact_key(email)}".encode('utf-8')).hexdigest()[:32]
+        return f"<{digest}@{domain}>"
+
+    def record(self, email: str, state: str, detail: Optional[str] = None,
+               message_id: Optional[str] = None, run_id: Optional[str] = None):
+        """Ajoute une transition et met à jour le dernier état du contact (validé sur disque).
+
+        ``run_id`` désigne une autre exécution que l'exécution courante (envois
+        planifiés de plusieurs lots par un même processus).
+        """
+        key = contact_key(email)
+        now = time.time()
+        current = run_id is None or run_id == self.run_id
+        run_id = run_id or self.run_id
+        with self._lock:
+            with self._db:
+                self._db.execute(
+                    "INSERT INTO events (run_id, contact, state, detail, at) VALUES (?, ?, ?, ?, ?)",
+                    (run_id, key, state, detail, now)
+                )
+                self._db.execute(
+                    "INSERT INTO contacts (run_id, contact, state, message_id, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?) "
+                    "ON CONFLICT(run_id, contact) DO UPDATE SET state = excluded.state, "
+                    "message_id = COALESCE(excluded.message_id, contacts.message_id), "
+                    "updated_at = excluded.updated_at",
+                    (run_id, key, state, message_id, now)
+                )
+            if current and state in DONE_STATES:
+                self._done.add(key)
+
+    def summary(self) -> Dict:
+        """Nombre de contacts par état pour l'exécution courante"""
+        with self._lock:
+            counts = dict(self._db.execute(
+                "SELECT state, COUNT(*) FROM contacts WHERE run_id = ? GROUP BY state",
+                (self.run_id,)
+            ).fetchall())
+        return {
+            'run_id': self.run_id,
+            'states': counts,
+            # Envois interrompus entre la remise SMTP et la confirmation
+            'uncertain': counts.get(SENDING, 0),
+            'skipped_on_resume': self.skipped
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Client LLM compatible OpenAI (OpenRouter): préfixe système cachable, lots et statistiques
+"""
+
+import logging
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import requests
+
+from metrics import percentile
+from resilience import Endpoint, http_error
+
+logger = logging.getLogger(__name__)
+
+# Séparateur demandé au modèle en mode "packed" (plusieurs emails par requête)
+BATCH_MARKER_RE = re.compile(r"^\s*=== EMAIL (\d+) ===\s*$", re.MULTILINE)
+
+BATCH_INSTRUCTIONS = """Écris un email distinct pour CHACUNE des {count} demandes ci-dessous.
+Commence chaque email par une ligne "=== EMAIL n ===" (n = numéro de la demande),
+puis respecte exactement le format demandé pour chaque email.
+
+"""
+
+
+class LLMError(Exception):
+    """Réponse inutilisable de l'API LLM"""
+
+
+class LLMClient:
+    """Appels chat/completions avec une session HTTP partagée (keep-alive).
+
+    Les instructions statiques sont envoyées comme message système séparé,
+    identique d'un contact à l'autre: les fournisseurs peuvent le mettre en
+    cache (cache automatique des préfixes, ou ``cache_control`` explicite
+    quand ``prompt_cache`` est activé). Deux modes de lot sont disponibles:
+    ``concurrent`` (K requêtes en parallèle) et ``packed`` (K emails dans
+    une seule requête, redécoupés ensuite). Avec un ``endpoint``, chaque
+    requête passe par ses réessais et son disjoncteur.
+
+    ``max_workers`` borne les requêtes parallèles d'un lot ``concurrent``;
+    ``pool_size`` (par défaut ``max_workers``) est le nombre de connexions
+    keep-alive gardées par hôte, à dimensionner sur le nombre total de
+    requêtes simultanées (workers de génération × lot).
+    """
+
+    def __init__(self, base_url: str, api_key: str, model: str, max_tokens: int = 1000,
+                 temperature: float = 0.4, prompt_cache: bool = True, timeout: float = 30,
+                 max_workers: int = 8, endpoint: Optional[Endpoint] = None,
+                 pool_size: Optional[int] = None):
+        self.base_url = base_url.rstrip('/')
+        self.api_key = api_key
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.prompt_cache = prompt_cache
+        self.timeout = timeout
+        self.max_workers = max(1, max_workers)
+        self.endpoint = endpoint
+
+        self.pool_size = max(1, pool_size or self.max_workers)
+        self.session = requests.Session()
+        self._mount()
+
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.emails = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        self.latencies = deque(maxlen=10000)
+
+    def _mount(self):
+        for prefix in ('https://', 'http://'):
+            self.session.mount(prefix, requests.adapters.HTTPAdapter(pool_maxsize=self.pool_size))
+
+    def ensure_pool(self, connections: int):
+        """Agrandit le pool de connexions si ``connections`` requêtes peuvent être simultanées"""
+        if connections > self.pool_size:
+            self.pool_size = connections
+            self._mount()
+
+    @classmethod
+    def from_config(cls, config: Dict, endpoint: Optional[Endpoint] = None,
+                    workers: int = 1) -> 'LLMClient':
+        """Construit le client depuis la section ``openrouter`` de config.json.
+
+        ``workers``: workers de génération qui partagent le client (section ``pipeline``).
+        """
+        batch_size = max(1, config.get('batch_size', 1))
+        return cls(
+            base_url=config['base_url'],
+            api_key=config['api_key'],
+            model=config['model'],
+            max_tokens=config.get('max_tokens', 1000),
+            temperature=config.get('temperature', 0.4),
+            prompt_cache=config.get('prompt_cache', True),
+            timeout=config.get('timeout', 30),
+            max_workers=batch_size,
+            endpoint=endpoint,
+            pool_size=max(1, workers) * batch_size
+        )
+
+    def build_request(self, system_prompt: str, user_prompt: str,
+                      max_tokens: Optional[int] = None) -> Tuple[Dict, Dict]:
+        """En-têtes et corps JSON: préfixe système statique + message utilisateur variable"""
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+        system_content = [{"type": "text", "text": system_prompt}]
+        if self.prompt_cache:
+            system_content[0]["cache_control"] = {"type": "ephemeral"}
+        data = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": system_content},
+                {"role": "user", "content": user_prompt}
+            ],
+            "max_tokens": max_tokens or self.max_tokens,
+            "temperature": self.temperature
+        }
+        return headers, data
+
+    def record(self, usage: Optional[Dict], latency: float, emails: int = 1):
+        """Comptabilise une réponse (tokens, latence, nombre d'emails produits)"""
+        usage = usage or {}
+        details = usage.get('prompt_tokens_details') or {}
+        with self._lock:
+            self.requests += 1
+            self.emails += emails
+            self.prompt_tokens += usage.get('prompt_tokens', 0)
+            self.cached_tokens += details.get('cached_tokens', 0) or 0
+            self.completion_tokens += usage.get('completion_tokens', 0)
+            self.latencies.append(latency)
+
+    def complete(self, system_prompt: str, user_prompt: str, emails: int = 1,
+                 max_tokens: Optional[int] = None) -> str:
+        """Un appel chat/completions (avec réessais si un ``endpoint`` est configuré).
+
+        Lève ``LLMError`` si la réponse est inexploitable ou vide: un
+        contenu d'erreur ne doit jamais être envoyé comme email.
+        """
+        if self.endpoint is not None:
+            return self.endpoint.call(self._complete, system_prompt, user_prompt, emails, max_tokens)
+        return self._complete(system_prompt, user_prompt, emails, max_tokens)
+
+    def _complete(self, system_prompt: str, user_prompt: str, emails: int,
+                  max_tokens: Optional[int]) -> str:
+        headers, data = self.build_request(system_prompt, user_prompt, max_tokens)
+        started = time.monotonic()
+        response = self.session.post(self.base_url + "/chat/completions",
+                                     headers=headers, json=data, timeout=self.timeout)
+        if response.status_code != 200:
+            raise http_error("OpenRouter", response.status_code, response.headers.get('Retry-After'))
+        result = response.json()
+        self.record(result.get('usage'), time.monotonic() - started, emails)
+        return extract_content(result)
+
+    def complete_many(self, system_prompt: str, user_prompts: Sequence[str]) -> List[Optional[str]]:
+        """Mode ``concurrent``: une requête par prompt, en parallèle sur la session partagée.
+
+        Les prompts en échec (après réessais) valent ``None``.
+        """
+        def one(prompt):
+            try:
+                return self.complete(system_prompt, prompt)
+            except Exception as e:
+                logger.error(f"Erreur génération (lot concurrent): {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(user_prompts) or 1)) as executor:
+            return list(executor.map(one, user_prompts))
+
+    def complete_packed(self, system_prompt: str, user_prompts: Sequence[str]) -> List[Optional[str]]:
+        """Mode ``packed``: tous les prompts dans une requête, réponse redécoupée par marqueur.
+
+        Les emails manquants dans la réponse valent ``None``.
+        """
+        if len(user_prompts) == 1:
+            return self.complete_many(system_prompt, user_prompts)
+
+        user_prompt = BATCH_INSTRUCTIONS.format(count=len(user_prompts)) + "\n\n".join(
+            f"--- Demande {i} ---\n{prompt}" for i, prompt in enumerate(user_prompts, 1)
+        )
+        try:
+            content = self.complete(system_prompt, user_prompt, emails=0,
+                                    max_tokens=self.max_tokens * len(user_prompts))
+        except Exception as e:
+            logger.error(f"Erreur génération (lot packed): {e}")
+            return [None] * len(user_prompts)
+        results = split_batch(content, len(user_prompts))
+        with self._lock:
+            # Seuls les emails effectivement retrouvés dans la réponse comptent
+            self.emails += sum(1 for r in results if r is not None)
+        return results
+
+    def stats(self) -> Dict:
+        with self._lock:
+            latencies = list(self.latencies)
+            emails = self.emails or 1
+            return {
+                'requests': self.requests,
+                'emails': self.emails,
+                'prompt_tokens': self.prompt_tokens,
+                'cached_prompt_tokens': self.cached_tokens,
+                'completion_tokens': self.completion_tokens,
+                'prompt_tokens_per_email': round(self.prompt_tokens / emails, 1),
+                'completion_tokens_per_email': round(self.completion_tokens / emails, 1),
+                'latency_p50': round(percentile(latencies, 50), 3),
+                'latency_p95': round(percentile(latencies, 95), 3),
+                'latency_p99': round(percentile(latencies, 99), 3)
+            }
+
+
+def extract_content(result: Dict) -> str:
+    """Texte de la première réponse; ``LLMError`` si absent ou vide"""
+    try:
+        content = result['choices'][0]['message']['content']
+    except (KeyError, IndexError, TypeError) as e:
+        raise LLMError(f"Réponse OpenRouter inattendue: {e}")
+    if not content or not content.strip():
+        raise LLMError("Réponse OpenRouter vide")
+    return content
+
+
+def split_batch(content: str, count: int) -> List[Optional[str]]:
+    """Redécoupe une réponse "packed" en ``count`` emails selon les marqueurs ``=== EMAIL n ===``"""
+    results: List[Optional[str]] = [None] * count
+    markers = list(BATCH_MARKER_RE.finditer(content))
+    for i, marker in enumerate(markers):
+        index = int(marker.group(1)) - 1
+        end = markers[i + 1].start() if i + 1 < len(markers) else len(content)
+        text = content[marker.end():end].strip()
+        if 0 <= index < count and text:
+            results[index] = text
+    return results
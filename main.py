@@ -6,23 +6,46 @@ Auteur: MiniMax Agent
 Date: 2025-10-04
 """
 
+import argparse
+import asyncio
 import json
-import csv
-import smtplib
 import http.client
+import itertools
 import logging
-import schedule
+import os
+import sys
 import time
 from datetime import datetime, timedelta
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from email.mime.base import MIMEBase
-from email import encoders
 from pathlib import Path
-from typing import Dict, List, Optional
-import requests
+from urllib.parse import urlsplit
+from typing import Dict, Iterable, Iterator, List, Optional
 from concurrent.futures import ThreadPoolExecutor
 import threading
+import multiprocessing
+from accounts import AccountScheduler, SenderAccount
+from pipeline import CampaignPipeline, Deferred, Stage
+from rate_limiter import RateScheduler
+from search_cache import SearchCache
+from async_backend import AsyncEmailBackend
+from contact_source import ContactSource
+from attachments import AttachmentRegistry
+from message_template import MessageFactory
+from llm_client import LLMClient
+from resilience import Resilience, http_error, is_transient
+from email_cache import EmailCache, email_key
+from journal import CampaignJournal, DONE_STATES, SEARCHED, GENERATED, PREPARED, SENDING, SENT, FAILED
+from outbox import Outbox
+from dry_run import DRY_RUN_LATENCY, DryRun
+from benchmark import DEFAULT_SIZES, format_mime_result, format_result, run_benchmark, run_mime_benchmark
+from job_queue import JobQueue
+from metrics import LogSampler, MetricsRegistry, MetricsServer
+from scheduler import DEFAULT_TIMEZONE, Scheduler, SendWindow
+from results import CampaignStats, ResultsLog
+import results as results_file
+import job_queue as queue_states
+import outbox as outbox_states
 
 # Configuration du logging
 logging.basicConfig(
@@ -35,12 +58,87 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Nom du CV tel qu'il apparaît chez le destinataire
+CV_FILENAME = "CV_Achraf_Bouyalloul.pdf"
+
+# À incrémenter à chaque modification d'EMAIL_SYSTEM_PROMPT ou de build_prompt:
+# les emails en cache générés avec l'ancienne version ne sont plus réutilisés
+PROMPT_VERSION = "2"
+
+# Consignes communes à tous les emails: envoyées en message système,
+# identiques d'un contact à l'autre pour que le fournisseur les mette en cache
+EMAIL_SYSTEM_PROMPT = """Tu es un expert en rédaction d'emails professionnels en français.
+
+Tu écris des emails de candidature adressés à une personne précise, pour ce candidat:
+- Candidat: Achraf Bouyalloul, jeune diplômé en Intelligence Artificielle / informatique
+
+Exigences:
+- Objet clair (pas "spontanée", mais "Candidature - Ingénieur IA/tech")
+- Introduction: saluer, montrer que je me suis intéressé à l'entreprise (la nommer)
+- Lien avec l'entreprise: mettre en avant mon profil IA/ML adapté au domaine
+- Demande: opportunité/offre pour jeunes diplômés motivés
+- Motivation: expliquer que tu es motivé pour n'importe quelle opportunité dans le domaine informatique/IA, que tu souhaites apprendre et contribuer
+- Compétences: IA, ML, Python, développement d'applications IA, MLOps
+- Conclusion: polie et positive, demande un rendez-vous ou échange
+- Pièces jointes: CV (eviter de dire "[pièce jointe: CV ]")
+- Longueur: max 300 mots
+- Style: naturel, humain, PAS robotique
+
+IMPORTANT: Réponds EXACTEMENT dans ce format:
+OBJET: [objet ici]
+CORPS:
+[corps du mail ici]"""
+
 class EmailAutomationSystem:
     def __init__(self, config_path: str = "config.json"):
         """Initialise le système d'automation d'emails"""
+        self.config_path = config_path
         self.config = self.load_config(config_path)
-        self.sent_emails = []
-        self.failed_emails = []
+        # Agrégats en mémoire constante; le détail par contact va dans le fichier de résultats
+        self.campaign_stats = CampaignStats()
+        self.results: Optional[ResultsLog] = None
+        self._results_lock = threading.Lock()
+        self.pipeline_stats = {}
+        self.last_report: Optional[str] = None
+        self.last_results: Optional[str] = None
+        self.contact_source: Optional[ContactSource] = None
+        self.expected_contacts = 0
+        # Comptes expéditeurs (un seul sans ``email.accounts``) et attribution des contacts
+        self.senders = AccountScheduler.from_config(self.config['email'])
+        self.rate_scheduler = RateScheduler.from_config(
+            self.senders.rate_rules(self.config.get('rate_limits'))
+        )
+        # Résultats Serper déjà obtenus (même entreprise, campagnes précédentes)
+        self.search_cache = SearchCache.from_config(self.config.get('search_cache'))
+        # Journal durable des transitions de chaque contact (reprise après crash)
+        self.journal = CampaignJournal.from_config(self.config.get('journal'))
+        # CV et autres pièces jointes lus et encodés une seule fois
+        self.attachments = AttachmentRegistry.from_config(self.config.get('attachments'))
+        self.message_factory = MessageFactory()
+        # Emails déjà générés (nouvel essai, nouvelle campagne sur le même CSV)
+        self.email_cache = EmailCache.from_config(self.config.get('email_cache'))
+        # Réessais, disjoncteurs par service et file des lettres mortes
+        self.resilience = Resilience.from_config(self.config.get('resilience'))
+        # Client LLM: session HTTP partagée, lots et comptage des tokens
+        self.llm = LLMClient.from_config(self.config['openrouter'], self.resilience['openrouter'],
+                                         self.config.get('pipeline', {}).get('generate_workers', 3))
+        # Messages rendus à l'avance (préparation), envoyés à l'heure prévue
+        self.outbox = Outbox.from_config(self.config.get('outbox'))
+        self.outbox_batch: Optional[str] = None
+        # File de contacts partagée par les workers de préparation (multi-processus)
+        self.job_queue = JobQueue.from_config(self.config.get('queue'))
+        # Minuteurs persistants des envois planifiés (fenêtres par fuseau horaire)
+        self.scheduler = Scheduler.from_config(self.config.get('scheduler'))
+        # Sessions SMTP authentifiées du compte principal (chaque compte a son pool)
+        self.smtp_pool = self.senders.primary.pool
+        # Durées par étage et compteurs, exposés en /metrics et dans le rapport
+        self.metrics = MetricsRegistry()
+        self.metrics_server: Optional[MetricsServer] = None
+        # Pipeline (ou backend asyncio) en cours: profondeur de ses files
+        self.active_pipeline = None
+        self._register_metrics()
+        # Logs par contact: un sur ``metrics.log_every`` en INFO, les autres en DEBUG
+        self.log_sampler = LogSampler(self.config.get('metrics', {}).get('log_every', 100))
         
     def load_config(self, config_path: str) -> Dict:
         """Charge la configuration depuis le fichier JSON"""
@@ -51,12 +149,59 @@ class EmailAutomationSystem:
             logger.error(f"Erreur lors du chargement de la configuration: {e}")
             raise
 
-    def search_company_info(self, company_name: str) -> Dict:
-        """Recherche des informations sur l'entreprise via Serper API"""
+    def _register_metrics(self):
+        """Déclare les métriques; celles déjà comptées ailleurs (appels, caches, files) sont lues à l'export"""
+        self.metrics.describe('stage_duration_seconds', "Durée des étapes par contact (secondes)")
+        self.metrics.describe('emails_total', "Contacts traités, par résultat")
+        self.metrics.describe('smtp_bytes_sent_total', "Octets remis au serveur SMTP, par compte")
+        
+        def collect():
+            endpoints = list(self.resilience.endpoints.items())
+            for metric, attribute, help_text in (('api_calls_total', 'calls', "Appels aux services externes"),
+                                                 ('api_retries_total', 'retries', "Nouvelles tentatives"),
+                                                 ('api_failures_total', 'failures', "Appels abandonnés")):
+                for name, endpoint in endpoints:
+                    yield metric, 'counter', help_text, {'service': name}, getattr(endpoint, attribute)
+            caches = []
+            if self.search_cache is not None:
+                cache = self.search_cache
+                caches.append(('search', cache.memory_hits + cache.disk_hits + cache.coalesced, cache.misses))
+            if self.email_cache is not None:
+                caches.append(('email', self.email_cache.hits, self.email_cache.misses))
+            for cache, hits, _ in caches:
+                yield 'cache_hits_total', 'counter', "Réponses servies par un cache", {'cache': cache}, hits
+            for cache, _, misses in caches:
+                yield 'cache_misses_total', 'counter', "Recherches absentes du cache", {'cache': cache}, misses
+            for kind in ('prompt', 'completion'):
+                yield ('llm_tokens_total', 'counter', "Tokens consommés par le LLM", {'kind': kind},
+                       getattr(self.llm, f"{kind}_tokens"))
+            yield ('rate_limit_wait_seconds_total', 'counter', "Attente cumulée imposée par les quotas",
+                   {}, self.rate_scheduler.total_wait)
+            pipeline = self.active_pipeline
+            if pipeline is not None:
+                for stage, depth in pipeline.queue_depths().items():
+                    yield 'queue_depth', 'gauge', "Éléments en attente devant chaque étage", {'stage': stage}, depth
+        
+        self.metrics.register_collector(collect)
+
+    def start_metrics_server(self):
+        """Expose /metrics si ``metrics.port`` est configuré (une seule fois par processus)"""
+        config = self.config.get('metrics', {})
+        if self.metrics_server is not None or config.get('port') is None:
+            return
+        try:
+            self.metrics_server = MetricsServer(self.metrics, config.get('host', "127.0.0.1"), config['port'])
+        except OSError as e:
+            logger.warning(f"⚠️ Point /metrics indisponible sur le port {config['port']}: {e}")
+
+    def _fetch_company_info(self, query: str) -> Dict:
+        """Appelle l'API Serper; lève une exception en cas d'échec (rien n'est mis en cache)"""
+        url = urlsplit(self.config['serper'].get('base_url', "https://google.serper.dev"))
+        connection_class = http.client.HTTPConnection if url.scheme == 'http' else http.client.HTTPSConnection
+        conn = connection_class(url.netloc)
         try:
-            conn = http.client.HTTPSConnection("google.serper.dev")
             payload = json.dumps({
-                "q": f"{company_name} Maroc entreprise société",
+                "q": query,
                 "location": self.config["serper"]["location"],
                 "gl": self.config["serper"]["gl"]
             })
@@ -65,94 +210,105 @@ class EmailAutomationSystem:
                 'Content-Type': 'application/json'
             }
             
-            conn.request("POST", "/search", payload, headers)
+            conn.request("POST", url.path.rstrip('/') + "/search", payload, headers)
             res = conn.getresponse()
             data = res.read()
+            if res.status != 200:
+                raise http_error("Serper", res.status, res.getheader('Retry-After'))
             
-            search_results = json.loads(data.decode("utf-8"))
-            logger.info(f"Recherche effectuée pour {company_name}")
+            return json.loads(data.decode("utf-8"))
+        finally:
+            conn.close()
+
+    def search_company_info(self, company_name: str) -> Dict:
+        """Recherche des informations sur l'entreprise via Serper API (avec cache).
+
+        Après épuisement des réessais, l'email est généré sans contexte de
+        recherche plutôt que d'abandonner le contact.
+        """
+        query = f"{company_name} Maroc entreprise société"
+        fetch = lambda: self.resilience['serper'].call(self._fetch_company_info, query)
+        try:
+            with self.metrics.span('search'):
+                if self.search_cache is None:
+                    search_results = fetch()
+                else:
+                    search_results = self.search_cache.get_or_fetch(
+                        query, self.config["serper"]["location"], self.config["serper"]["gl"], fetch
+                    )
+            logger.debug(f"Recherche effectuée pour {company_name}")
             return search_results
             
         except Exception as e:
             logger.error(f"Erreur lors de la recherche pour {company_name}: {e}")
             return {"organic": []}
 
-    
-
-    def generate_personalized_email(self, company_name: str, Nom_ceo: str,Titre: str,
-                               search_results: Dict) -> str:
-        """Génère un email personnalisé avec OpenRouter LLM"""
-        try:
-            search_context = ""
-            if "organic" in search_results and search_results["organic"]:
-                for idx, result in enumerate(search_results["organic"][:3], 1):
-                    search_context += f"{idx}. {result.get('title', '')}: {result.get('snippet', '')}\n"
+    def build_prompt(self, company_name: str, Nom_ceo: str, Titre: str,
+                     search_results: Dict) -> str:
+        """Construit la partie variable du prompt (les consignes sont dans EMAIL_SYSTEM_PROMPT)"""
+        search_context = ""
+        if "organic" in search_results and search_results["organic"]:
+            for idx, result in enumerate(search_results["organic"][:3], 1):
+                search_context += f"{idx}. {result.get('title', '')}: {result.get('snippet', '')}\n"
 
-            prompt = f"""Tu es un expert en rédaction d'emails professionnels en français.
-
-Écris un email de candidature adressé à une personne précise:
+        prompt = f"""Écris l'email de candidature adressé à cette personne:
 - Entreprise: {company_name}
 - Nom du Destinataire: {Nom_ceo} (si disponible, sinon ne pas mentionner)
-- Candidat: Achraf Bouyalloul, jeune diplômé en Intelligence Artificielle / informatique
 - Titre du Destinataire: {Titre} (si disponible, sinon ne pas mentionner)
 
 Informations sur l'entreprise :
-{search_context}
+{search_context}"""
+        return prompt
 
-Exigences:
-- Objet clair (pas "spontanée", mais "Candidature - Ingénieur IA/tech")
-- Introduction: saluer, montrer que je me suis intéressé à {company_name}
-- Lien avec l'entreprise: mettre en avant mon profil IA/ML adapté au domaine
-- Demande: opportunité/offre pour jeunes diplômés motivés
-- Motivation: expliquer que tu es motivé pour n'importe quelle opportunité dans le domaine informatique/IA, que tu souhaites apprendre et contribuer
-- Compétences: IA, ML, Python, développement d'applications IA, MLOps
-- Conclusion: polie et positive, demande un rendez-vous ou échange
-- Pièces jointes: CV (eviter de dire "[pièce jointe: CV ]")
-- Longueur: max 300 mots
-- Style: naturel, humain, PAS robotique
+    def build_llm_request(self, prompt: str) -> tuple:
+        """En-têtes et corps JSON d'un appel chat/completions OpenRouter"""
+        return self.llm.build_request(EMAIL_SYSTEM_PROMPT, prompt)
 
-IMPORTANT: Réponds EXACTEMENT dans ce format:
-OBJET: [objet ici]
-CORPS:
-[corps du mail ici]"""
+    def generate_personalized_email(self, company_name: str, Nom_ceo: str,Titre: str,
+                               search_results: Dict) -> str:
+        """Génère un email personnalisé avec OpenRouter LLM.
 
-            # Appel à OpenRouter API
-            headers = {
-                "Authorization": f"Bearer {self.config['openrouter']['api_key']}",
-                "Content-Type": "application/json"
-            }
-            
-            data = {
-                "model": self.config['openrouter']['model'],
-                "messages": [
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                "max_tokens": 1000,
-                "temperature": 0.4
-            }
-            
-            response = requests.post(
-                self.config['openrouter']['base_url'] + "/chat/completions",
-                headers=headers,
-                json=data,
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                email_content = result['choices'][0]['message']['content']
-                logger.info(f"Email généré pour {company_name}")
-                return email_content
-            else:
-                logger.error(f"Erreur API OpenRouter: {response.status_code}")
-                return "Erreur génération email"
-                
+        Lève une exception si la génération échoue après réessais: aucun
+        contenu de remplacement ne doit partir par SMTP.
+        """
+        prompt = self.build_prompt(company_name, Nom_ceo, Titre, search_results)
+        try:
+            # Appel à OpenRouter API (session HTTP partagée, préfixe système en cache)
+            with self.metrics.span('generate'):
+                email_content = self.llm.complete(EMAIL_SYSTEM_PROMPT, prompt)
         except Exception as e:
             logger.error(f"Erreur lors de la génération d'email pour {company_name}: {e}")
-            return 'Erreur génération email'
+            raise
+        logger.debug(f"Email généré pour {company_name}")
+        return email_content
+
+    def generate_personalized_emails(self, jobs: List[Dict]) -> List[Optional[str]]:
+        """Génère les emails d'un lot de contacts (mode ``batch_mode`` de la section openrouter).
+
+        ``concurrent``: une requête par contact en parallèle; ``packed``: une
+        seule requête pour tout le lot, les contacts absents de la réponse
+        étant régénérés un par un. Renvoie None pour les contacts dont la
+        génération a échoué.
+        """
+        prompts = [self.build_prompt(job['company_name'], job['Nom_ceo'], job['Titre'],
+                                     job['search_results']) for job in jobs]
+        if self.config['openrouter'].get('batch_mode', 'concurrent') != 'packed':
+            with self.metrics.span('generate'):
+                return self.llm.complete_many(EMAIL_SYSTEM_PROMPT, prompts)
+
+        with self.metrics.span('generate'):
+            contents = self.llm.complete_packed(EMAIL_SYSTEM_PROMPT, prompts)
+        for index, (job, content) in enumerate(zip(jobs, contents)):
+            if content is not None:
+                continue
+            try:
+                contents[index] = self.generate_personalized_email(
+                    job['company_name'], job['Nom_ceo'], job['Titre'], job['search_results']
+                )
+            except Exception as e:
+                logger.warning(f"⚠️ Email absent du lot packed et régénération échouée "
+                               f"pour {job['company_name']}: {e}")
+        return contents
 
     def parse_email_content(self, email_content: str) -> tuple:
         """Parse le contenu email pour extraire objet et corps"""
@@ -162,7 +318,7 @@ CORPS:
             body_lines = []
             
             # Debug
-            logger.info(f"Contenu à parser (premières lignes): {lines[:3]}")
+            logger.debug(f"Contenu à parser (premières lignes): {lines[:3]}")
             
             # Recherche de l'objet
             for i, line in enumerate(lines):
@@ -170,7 +326,7 @@ CORPS:
                 
                 if line_stripped.startswith("OBJET:"):
                     subject = line_stripped.replace("OBJET:", "").strip()
-                    logger.info(f"Objet trouvé: {subject}")
+                    logger.debug(f"Objet trouvé: {subject}")
                     
                     # Cherche "CORPS:" dans les lignes suivantes
                     corps_start_idx = i + 1
@@ -217,284 +373,1309 @@ CORPS:
             if not body:
                 body = email_content
             
-            logger.info(f"✅ Parsing réussi - Objet: '{subject}' | Corps: {len(body)} caractères")
+            logger.debug(f"✅ Parsing réussi - Objet: '{subject}' | Corps: {len(body)} caractères")
             return subject.strip(), body.strip()
             
         except Exception as e:
             logger.error(f"❌ Erreur parsing email: {e}")
             return "Candidature - Ingénieur IA/ML", email_content
 
-    def send_email(self, to_email: str, company_name: str, subject: str, body: str, 
-                   cv_path: Optional[str] = None, scheduled: bool = False) -> bool:
-        """Envoie l'email avec pièce jointe et planification"""
-        try:
-            # Validation des paramètres
-            if not subject or not subject.strip():
-                subject = f"Candidature - Ingénieur IA/ML - {company_name}"
-                logger.warning(f"Objet vide détecté, utilisation de: {subject}")
-            
-            # Configuration SMTP
-            smtp_server = smtplib.SMTP(self.config['email']['smtp_server'], 
-                                     self.config['email']['smtp_port'])
-            smtp_server.starttls()
-            smtp_server.login(self.config['email']['email'], 
-                            self.config['email']['password'])
-
-            # Création du message
-            msg = MIMEMultipart()
-            msg['From'] = f"{self.config['email']['from_name']} <{self.config['email']['email']}>"
-            msg['To'] = to_email
-            msg['Subject'] = subject
-            
-            logger.info(f"📧 Préparation email - Objet: '{subject}' | Destinataire: {to_email}")
+    def cv_candidates(self, cv_path: Optional[str] = None) -> tuple:
+        """Chemins essayés, dans l'ordre, pour trouver le CV"""
+        return (
+            cv_path,
+            "CV_ACHRAF_BOUYALLOUL_PFE.pdf",
+            "CV_Achraf_Bouyalloul.pdf",
+            "cv.pdf",
+            "CV.pdf",
+            "../CV_Achraf_Bouyalloul.pdf"
+        )
+
+    def build_message(self, to_email: str, company_name: str, subject: str, body: str,
+                      cv_path: Optional[str] = None, scheduled: bool = False,
+                      message_id: Optional[str] = None,
+                      sender: Optional[SenderAccount] = None) -> tuple:
+        """Construit le message ``MIMEMultipart`` complet; renvoie (message, cv_attaché).
+
+        Chemin de référence: l'envoi passe par ``render_message``, qui produit
+        les mêmes octets sans reconstruire les parties communes.
+        """
+        subject = self._subject(subject, company_name)
+        
+        # Création du message
+        msg = MIMEMultipart()
+        msg['From'] = (sender or self.senders.primary).from_header
+        msg['To'] = to_email
+        msg['Subject'] = subject
+        for name, value in self._extra_headers(message_id, scheduled):
+            msg[name] = value
+        
+        logger.debug(f"📧 Préparation email - Objet: '{subject}' | Destinataire: {to_email}")
+
+        msg.attach(MIMEText(self._email_body(body), 'plain', 'utf-8'))
+
+        # Pièces jointes pré-encodées: CV (résolu une fois) + pièces de la configuration
+        parts, cv_attached = self.attachment_parts(cv_path)
+        for part in parts:
+            msg.attach(part)
+
+        return msg, cv_attached
+
+    def render_message(self, to_email: str, company_name: str, subject: str, body: str,
+                       cv_path: Optional[str] = None, scheduled: bool = False,
+                       message_id: Optional[str] = None,
+                       sender: Optional[SenderAccount] = None,
+                       attachments: Optional[tuple] = None) -> tuple:
+        """Message final en octets CRLF, depuis le gabarit de la campagne; renvoie
+        (octets, objet, cv_attaché). ``attachments``: résultat d'``attachment_parts``
+        si l'appelant l'a déjà calculé."""
+        subject = self._subject(subject, company_name)
+        parts, cv_attached = attachments or self.attachment_parts(cv_path)
+        template = self.message_factory.template((sender or self.senders.primary).from_header, parts)
+        logger.debug(f"📧 Préparation email - Objet: '{subject}' | Destinataire: {to_email}")
+        data = template.render(to_email, subject, self._email_body(body),
+                               self._extra_headers(message_id, scheduled))
+        return data, subject, cv_attached
+
+    @staticmethod
+    def _subject(subject: str, company_name: str) -> str:
+        if not subject or not subject.strip():
+            subject = f"Candidature - Ingénieur IA/ML - {company_name}"
+            logger.warning(f"Objet vide détecté, utilisation de: {subject}")
+        return subject
+
+    @staticmethod
+    def _extra_headers(message_id: Optional[str], scheduled: bool) -> List[tuple]:
+        """En-têtes après ``Subject``: Message-ID, puis ceux de la planification si demandée"""
+        headers = [('Message-ID', message_id)] if message_id else []
+        if scheduled:
+            tomorrow_8am = datetime.now() + timedelta(days=1)
+            tomorrow_8am = tomorrow_8am.replace(hour=8, minute=0, second=0, microsecond=0)
             
-            # Headers pour la planification si demandée
-            if scheduled:
-                tomorrow_8am = datetime.now() + timedelta(days=1)
-                tomorrow_8am = tomorrow_8am.replace(hour=8, minute=0, second=0, microsecond=0)
-                
-                msg['X-Delayed-Delivery-Time'] = tomorrow_8am.strftime('%Y-%m-%d %H:%M:%S')
-                msg['X-Schedule-Send'] = tomorrow_8am.strftime('%Y-%m-%d %H:%M:%S')
-                msg['Date'] = tomorrow_8am.strftime('%a, %d %b %Y %H:%M:%S %z')
+            headers += [
+                ('X-Delayed-Delivery-Time', tomorrow_8am.strftime('%Y-%m-%d %H:%M:%S')),
+                ('X-Schedule-Send', tomorrow_8am.strftime('%Y-%m-%d %H:%M:%S')),
+                ('Date', tomorrow_8am.strftime('%a, %d %b %Y %H:%M:%S %z'))
+            ]
+        return headers
 
-            # Corps de l'email avec signatures
-            email_body = f"""{body}
+    @staticmethod
+    def _email_body(body: str) -> str:
+        # Corps de l'email avec signatures
+        return f"""{body}
 
 """
 
-            msg.attach(MIMEText(email_body, 'plain', 'utf-8'))
-
-            # Pièce jointe CV - Recherche multiple
-            cv_attached = False
-            cv_possible_paths = [
-                cv_path,
-                "CV_ACHRAF_BOUYALLOUL_PFE.pdf",
-                "CV_Achraf_Bouyalloul.pdf",
-                "cv.pdf",
-                "CV.pdf",
-                "../CV_Achraf_Bouyalloul.pdf"
-            ]
-            
-            for possible_path in cv_possible_paths:
-                if possible_path and Path(possible_path).exists():
-                    try:
-                        with open(possible_path, "rb") as attachment:
-                            part = MIMEBase('application', 'octet-stream')
-                            part.set_payload(attachment.read())
-                            encoders.encode_base64(part)
-                            part.add_header(
-                                'Content-Disposition',
-                                f'attachment; filename= CV_Achraf_Bouyalloul.pdf'
-                            )
-                            msg.attach(part)
-                            cv_attached = True
-                            logger.info(f"CV attaché depuis: {possible_path}")
-                            break
-                    except Exception as e:
-                        logger.warning(f"Erreur pièce jointe {possible_path}: {e}")
-                        continue
-            
-            if not cv_attached:
-                logger.warning("⚠️ Aucun CV trouvé pour pièce jointe")
+    def attachment_parts(self, cv_path: Optional[str] = None) -> tuple:
+        """Parties MIME communes à tous les messages; renvoie (parties, cv_attaché)"""
+        cv = self.attachments.resolve(self.cv_candidates(cv_path), CV_FILENAME)
+        parts = [cv.part()] if cv is not None else []
+        parts.extend(extra.part() for extra in self.attachments.extras)
+        return parts, cv is not None
 
-            # Envoi
-            text = msg.as_string()
-            smtp_server.sendmail(self.config['email']['email'], to_email, text)
-            smtp_server.quit()
-            
-            status_msg = "avec CV" if cv_attached else "sans CV"
-            scheduled_msg = " (PLANIFIÉ)" if scheduled else ""
-            logger.info(f"✅ Email envoyé {status_msg} à {to_email} ({company_name}){scheduled_msg}")
+    def deliver(self, to_email: str, company_name: str, subject: str, body: str,
+                cv_path: Optional[str] = None, scheduled: bool = False,
+                message_id: Optional[str] = None, sender: Optional[SenderAccount] = None):
+        """Construit et remet le message (réessais sur les erreurs SMTP 4xx); lève en cas d'échec"""
+        sender = sender or self.senders.primary
+        data, cv_attached = self.prepare_delivery(to_email, company_name, subject, body,
+                                                  cv_path, scheduled, message_id, sender)
+
+        # Envoi via une session SMTP du pool du compte, en octets
+        self.smtp_send(sender, to_email, data)
+        self.log_delivered(to_email, company_name, cv_attached, scheduled)
+
+    def prepare_delivery(self, to_email: str, company_name: str, subject: str, body: str,
+                         cv_path: Optional[str], scheduled: bool, message_id: Optional[str],
+                         sender: SenderAccount) -> tuple:
+        """Rendu mesuré (étage ``mime``) du message à remettre; renvoie (octets, cv_attaché).
+
+        Partagé par ``deliver`` et sa version asyncio.
+        """
+        with self.metrics.span('mime'):
+            data, _, cv_attached = self.render_message(to_email, company_name, subject, body,
+                                                       cv_path, scheduled, message_id, sender)
+        return data, cv_attached
+
+    def log_delivered(self, to_email: str, company_name: str, cv_attached: bool, scheduled: bool):
+        status_msg = "avec CV" if cv_attached else "sans CV"
+        scheduled_msg = " (PLANIFIÉ)" if scheduled else ""
+        logger.log(self.log_sampler.level('sent'),
+                   f"✅ Email envoyé {status_msg} à {to_email} ({company_name}){scheduled_msg}")
+
+    def smtp_send(self, sender: SenderAccount, to_email: str, msg):
+        """Remise SMTP mesurée (étage ``smtp``, octets envoyés par compte); ``msg`` en str ou bytes"""
+        with self.metrics.span('smtp'):
+            self.smtp_endpoint(sender).call(sender.pool.sendmail, sender.email, to_email, msg)
+        self.metrics.inc('smtp_bytes_sent_total', len(msg), account=sender.email)
+
+    def smtp_endpoint(self, sender: SenderAccount):
+        """Réessais et disjoncteur propres au compte: un compte limité n'arrête pas les autres"""
+        return self.resilience[f"smtp:{sender.email}"]
+
+    def send_with_failover(self, to_email: str, sender: SenderAccount, send,
+                           defer: bool = False) -> SenderAccount:
+        """Appelle ``send(compte)``; si le compte reste limité (4xx après réessais),
+        le contact bascule vers un autre compte disponible. Renvoie le compte utilisé.
+
+        Avec ``defer`` (étage d'envoi du pipeline), un compte de bascule sans quota
+        disponible lève ``Deferred`` au lieu d'attendre: le contact repasse par la
+        file des quotas et le worker continue avec les autres.
+        """
+        while True:
+            try:
+                send(sender)
+            except Exception as e:
+                sender = self.failover_after(to_email, sender, e)
+                if not defer:
+                    self.rate_scheduler.acquire(to_email, account=sender.email)
+                    continue
+                wait = self.rate_scheduler.try_acquire(to_email, account=sender.email)
+                if wait > 0:
+                    raise Deferred(min(wait, 600))
+                continue
+            self.senders.record_sent(sender, to_email)
+            return sender
+
+    def failover_after(self, to_email: str, sender: SenderAccount, error: Exception) -> SenderAccount:
+        """Compte l'échec de ``sender``; renvoie le compte de bascule si l'erreur est temporaire
+        et qu'un autre compte est disponible, sinon relève ``error``.
+
+        Partagé par ``send_with_failover`` et sa version asyncio.
+        """
+        throttled = is_transient(error)
+        self.senders.record_failure(sender, throttled=throttled)
+        alternative = self.senders.failover(to_email, sender) if throttled else None
+        if alternative is None:
+            raise error
+        return alternative
+
+    def send_email(self, to_email: str, company_name: str, subject: str, body: str, 
+                   cv_path: Optional[str] = None, scheduled: bool = False,
+                   message_id: Optional[str] = None) -> bool:
+        """Envoie l'email avec pièce jointe et planification"""
+        try:
+            self.deliver(to_email, company_name, subject, body, cv_path, scheduled, message_id)
             return True
-            
         except Exception as e:
             logger.error(f"❌ Erreur envoi à {to_email} ({company_name}): {e}")
             return False
 
+    def _new_job(self, person_data: Dict, cv_path: Optional[str] = None,
+                 scheduled: bool = False) -> Dict:
+        """Contexte d'une personne qui circule d'un étage du pipeline à l'autre"""
+        return {
+            'company_name': person_data['company_name'],
+            'Nom_ceo': person_data.get('Nom_ceo'),
+            'Titre': person_data.get('Titre'),
+            'email': person_data['email'],
+            'timezone': person_data.get('timezone') or None,
+            'cv_path': cv_path,
+            'scheduled': scheduled
+        }
+
+    def _stage_search(self, job: Dict) -> Dict:
+        """Étage 1: recherche Google pour contextualiser l'entreprise"""
+        logger.log(self.log_sampler.level('process'),
+                   f"🏢 Traitement de {job['company_name']} - <{job['email']}>")
+        job['search_results'] = self.search_company_info(job['company_name'])
+        self._journal(job, SEARCHED)
+        return job
+
+    def _cached_email(self, job: Dict) -> bool:
+        """Reprend l'objet et le corps depuis le cache d'emails; renvoie True si trouvé"""
+        if not self._lookup_cached_email(job):
+            return False
+        self._journal(job, GENERATED, "cache")
+        return True
+
+    def _lookup_cached_email(self, job: Dict) -> bool:
+        """Lecture seule du cache d'emails (sans journal): le backend asyncio journalise
+        lui-même, sur son thread d'écriture"""
+        if self.email_cache is None:
+            return False
+        prompt = self.build_prompt(job['company_name'], job['Nom_ceo'], job['Titre'],
+                                   job['search_results'])
+        job['cache_key'] = email_key(self.config['openrouter']['model'], PROMPT_VERSION, prompt)
+        cached = self.email_cache.get(job['cache_key'])
+        if cached is None:
+            return False
+        job['subject'], job['body'] = cached
+        job['email_content'] = None
+        job['from_cache'] = True
+        return True
+
+    def _store_email(self, job: Dict):
+        """Met en cache un email fraîchement généré et parsé"""
+        if self.email_cache is None or 'cache_key' not in job:
+            return
+        self.email_cache.put(job['cache_key'], job['company_name'], self.config['openrouter']['model'],
+                             PROMPT_VERSION, job['subject'], job['body'])
+
+    def _stage_generate(self, job: Dict) -> Dict:
+        """Étage 2: génération de l'email personnalisé (ou reprise depuis le cache)"""
+        if self._cached_email(job):
+            return job
+        job['email_content'] = self.generate_personalized_email(
+            job['company_name'], job['Nom_ceo'], job['Titre'], job['search_results']
+        )
+        self._journal(job, GENERATED)
+        return job
+
+    def _stage_generate_batch(self, jobs: List[Dict]) -> List[Dict]:
+        """Étage 2 par lots: plusieurs contacts par appel (``openrouter.batch_size``)"""
+        missing = [job for job in jobs if not self._cached_email(job)]
+        failed = set()
+        if missing:
+            for job, content in zip(missing, self.generate_personalized_emails(missing)):
+                if content is None:
+                    # Génération impossible: le contact part en lettre morte, jamais en SMTP
+                    self._record_failure(job, RuntimeError("génération de l'email impossible"), 'generate')
+                    failed.add(id(job))
+                    continue
+                job['email_content'] = content
+                self._journal(job, GENERATED)
+        return [job for job in jobs if id(job) not in failed]
+
+    def _stage_parse(self, job: Dict) -> Dict:
+        """Étage 3: extraction de l'objet et du corps"""
+        if job.get('from_cache'):
+            return job
+        with self.metrics.span('parse'):
+            job['subject'], job['body'] = self.parse_email_content(job['email_content'])
+        self._store_email(job)
+        return job
+
+    def _stage_send(self, job: Dict, sender: Optional[SenderAccount] = None,
+                    defer: bool = False) -> Dict:
+        """Étage 4: envoi (compte attribué au contact) et enregistrement du résultat"""
+        if 'message_id' not in job:
+            # Un envoi différé après une bascule reprend ici sans être journalisé à nouveau
+            job['message_id'] = self._begin_send(job)
+        message_id = job['message_id']
+        try:
+            job['sender'] = self.send_with_failover(
+                job['email'], sender or self.senders.assign(job['email']),
+                lambda account: self.deliver(job['email'], job['company_name'], job['subject'],
+                                             job['body'], job['cv_path'], job['scheduled'],
+                                             message_id, account),
+                defer
+            ).email
+        except Deferred:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Erreur envoi à {job['email']} ({job['company_name']}): {e}")
+            return self._record_result(job, False, str(e))
+        return self._record_result(job, True)
+
+    def _journal(self, job: Dict, state: str, detail: Optional[str] = None,
+                 message_id: Optional[str] = None):
+        """Ajoute une transition au journal de la campagne du contact (``run_id``) ou de la campagne en cours"""
+        if self.journal is not None and (job.get('run_id') or self.journal.run_id) is not None:
+            self.journal.record(job['email'], state, detail, message_id, job.get('run_id'))
+
+    def _message_id(self, job: Dict) -> Optional[str]:
+        """Message-ID déterministe du contact dans la campagne journalisée en cours"""
+        if self.journal is None or self.journal.run_id is None:
+            return None
+        domain = self.config['email']['email'].rsplit('@', 1)[-1]
+        return self.journal.message_id(job['email'], domain)
+
+    def _begin_send(self, job: Dict) -> Optional[str]:
+        """Journalise l'envoi AVANT la remise SMTP; renvoie le Message-ID à utiliser"""
+        message_id = self._message_id(job)
+        if message_id is not None:
+            self._journal(job, SENDING, message_id=message_id)
+        return message_id
+
+    def _stage_render(self, job: Dict) -> Dict:
+        """Étage de préparation: message MIME final rendu et déposé dans l'outbox"""
+        message_id = self._message_id(job)
+        # Compte attribué dès la préparation (l'envoi peut encore basculer)
+        sender = self.senders.assign(job['email'])
+        with self.metrics.span('mime'):
+            # Mêmes parties pour le rendu et pour leur extraction dans l'outbox
+            attachments = self.attachment_parts(job['cv_path'])
+            data, subject, _ = self.render_message(job['email'], job['company_name'], job['subject'],
+                                                   job['body'], job['cv_path'], job['scheduled'],
+                                                   message_id, sender, attachments)
+        shared_parts = attachments[0]
+        self.outbox.add(self.outbox_batch, job['email'], job['company_name'], subject,
+                        len(job['body']), data, shared_parts, message_id, sender.email, job['timezone'])
+        self._journal(job, PREPARED, message_id=message_id)
+        return job
+
+    def _record_result(self, job: Dict, success: bool, error: Optional[str] = None) -> Dict:
+        """Enregistre le résultat d'un envoi (fichier de résultats et agrégats).
+
+        Un envoi en échec (réessais épuisés ou refus définitif) part en lettre morte.
+        """
+        result = {
+            'company': job['company_name'],
+            'email': job['email'],
+            'subject': job['subject'],
+            'body_length': job['body_length'] if 'body_length' in job else len(job['body']),
+            'success': success,
+            'scheduled': job['scheduled'],
+            'sender': job.get('sender'),
+            'timestamp': datetime.now().isoformat()
+        }
+        
+        if not success:
+            result['stage'] = 'send'
+            result['error'] = error
+        
+        self._add_result(result)
+        self.metrics.inc('emails_total', result='sent' if success else 'failed')
+        if success:
+            self._journal(job, SENT)
+        else:
+            self._journal(job, FAILED, error)
+            self.resilience.dead_letters.add(job, 'send', error or "échec d'envoi")
+        
+        return result
+
+    def _record_failure(self, job: Dict, error: Exception, stage: str = 'pipeline') -> Dict:
+        """Enregistre un contact dont le traitement a échoué avant l'envoi (lettre morte)"""
+        result = {
+            'company': job['company_name'],
+            'email': job['email'],
+            'success': False,
+            'scheduled': job['scheduled'],
+            'stage': stage,
+            'error': str(error),
+            'timestamp': datetime.now().isoformat()
+        }
+        self._add_result(result)
+        self.metrics.inc('emails_total', result='failed')
+        self._journal(job, FAILED, str(error))
+        self.resilience.dead_letters.add(job, stage, str(error))
+        if 'queue_id' in job:
+            self.job_queue.fail(job['queue_id'], result)
+        return result
+
+    def _add_result(self, result: Dict):
+        """Ajoute le résultat au fichier de la campagne en cours (et à ses agrégats)"""
+        if self.results is not None:
+            self.results.append(result)
+            return
+        with self._results_lock:
+            self.campaign_stats.add(result)
+
+    def _open_results(self):
+        """Nouveau fichier de résultats (``report_dir``), lisible pendant la campagne"""
+        if self.results is not None:
+            self.results.close()
+        self.results = ResultsLog.open(self.config.get('report_dir', '.'), self.expected_contacts,
+                                       self.config.get('results'))
+        self.campaign_stats = self.results.stats
+        self.last_results = self.results.path
+        logger.info(f"🧾 Résultats au fil de l'eau: {self.results.path}")
+
     def process_person(self, person_data: Dict, cv_path: Optional[str] = None, scheduled: bool = False) -> Dict:
         """Traite une personne: recherche + génération + envoi"""
-        company_name = person_data['company_name']
-        Nom_ceo = person_data.get('Nom_ceo')
-        Titre = person_data.get('Titre')
-        email = person_data['email']
-        
-        logger.info(f"🏢 Traitement de {company_name} - <{email}>")
+        job = self._new_job(person_data, cv_path, scheduled)
         
         try:
-            # Recherche Google pour contextualiser l'entreprise
-            search_results = self.search_company_info(company_name)
-            
-            # Génération email personnalisé
-            email_content = self.generate_personalized_email(
-                company_name, Nom_ceo ,Titre,search_results
-            )
-            
-            # Parse email
-            subject, body = self.parse_email_content(email_content)
-            
-            # Envoi
-            success = self.send_email(email, company_name, subject, body, cv_path, scheduled)
-            
-            result = {
-                'company': company_name,
-                'email': email,
-                'subject': subject,
-                'body_length': len(body),
-                'success': success,
-                'scheduled': scheduled,
-                'timestamp': datetime.now().isoformat()
-            }
-            
-            if success:
-                self.sent_emails.append(result)
-            else:
-                self.failed_emails.append(result)
-                
-            return result
+            for stage in (self._stage_search, self._stage_generate, self._stage_parse):
+                job = stage(job)
+            return self._stage_send(job)
         
         except Exception as e:
-            logger.error(f"💥 Erreur lors du traitement de ({company_name}): {e}")
-            return {"success": False, "error": str(e)}
+            logger.error(f"💥 Erreur lors du traitement de ({job['company_name']}): {e}")
+            return self._record_failure(job, e)
+
+    def _generation_stages(self, max_workers: int) -> List[Stage]:
+        """Étages recherche → génération → parsing, communs à la campagne et au préchauffage"""
+        pipeline_config = self.config.get('pipeline', {})
+        batch_size = self.config['openrouter'].get('batch_size', 1)
+        # Une connexion keep-alive par requête LLM simultanée
+        self.llm.ensure_pool(pipeline_config.get('generate_workers', max_workers) * max(1, batch_size))
+        if batch_size > 1:
+            generate = Stage('generate', self._stage_generate_batch,
+                             pipeline_config.get('generate_workers', max_workers),
+                             batch_size=batch_size,
+                             batch_wait=self.config['openrouter'].get('batch_wait', 0.5))
+        else:
+            generate = Stage('generate', self._stage_generate,
+                             pipeline_config.get('generate_workers', max_workers))
+        return [
+            Stage('search', self._stage_search,
+                  pipeline_config.get('search_workers', max_workers)),
+            generate,
+            Stage('parse', self._stage_parse,
+                  pipeline_config.get('parse_workers', 1))
+        ]
+
+    def prewarm_email_cache(self, csv_path: str, max_workers: int = 3) -> int:
+        """Recherche et génère les emails d'un CSV sans rien envoyer, pour remplir le cache"""
+        pipeline = CampaignPipeline(
+            self._generation_stages(max_workers),
+            queue_size=self.config.get('pipeline', {}).get('queue_size', 32)
+        )
+        self.contact_source = self.iter_contacts(csv_path)
+        logger.info(f"🔥 Préchauffage du cache d'emails pour {csv_path}")
+        count = self._run_pipeline(pipeline, (self._new_job(person, None, False) for person in self.contact_source))
+        logger.info(f"🔥 Préchauffage terminé: {count} contacts, {self.email_cache.stats()['entries']} emails en cache")
+        return count
+
+    def build_pipeline(self, max_workers: int = 3,
+                       total: Optional[int] = None) -> CampaignPipeline:
+        """Construit le pipeline recherche → génération → parsing → envoi.
+
+        ``max_workers`` fixe la largeur des étages réseau (recherche et LLM);
+        chaque étage peut être surchargé via la section ``pipeline`` de la
+        configuration (``search_workers``, ``generate_workers``,
+        ``parse_workers``, ``send_workers``, ``queue_size``). La cadence
+        d'envoi est fixée par ``self.rate_scheduler``.
+        """
+        pipeline_config = self.config.get('pipeline', {})
+        progress_lock = threading.Lock()
+        progress = {'count': 0}
+        total_msg = f"/{total}" if total else ""
+
+        def send_when_allowed(job: Dict) -> Dict:
+            # Compte réservé par quota_ready: les quotas global / domaine / compte autorisent l'envoi
+            sender, waited = job.pop('quota_sender'), job.pop('quota_waited')
+            with progress_lock:
+                if 'send_position' not in job:
+                    progress['count'] += 1
+                    job['send_position'] = progress['count']
+                position = job['send_position']
+            if waited >= 1:
+                logger.log(self.log_sampler.level('quota'), f"⏱️ Quota d'envoi: attente de {waited:.1f}s")
+            logger.log(self.log_sampler.level('sending'),
+                       f"📧 [{position}{total_msg}] Envoi en cours depuis {sender.email}...")
+            return self._stage_send(job, sender, defer=True)
+
+        stages = self._generation_stages(max_workers) + [
+            Stage('send', send_when_allowed,
+                  pipeline_config.get('send_workers', 1),
+                  throttle=self._quota_ready, throttle_key=self._quota_key,
+                  max_deferred=pipeline_config.get('max_deferred', 1000))
+        ]
+        return CampaignPipeline(
+            stages,
+            queue_size=pipeline_config.get('queue_size', 32),
+            on_error=lambda stage, job, e: self._record_failure(job, e, stage.name)
+        )
+
+    @staticmethod
+    def _quota_key(job: Dict) -> str:
+        """File d'attente des quotas d'un contact: son domaine"""
+        return job['email'].rsplit('@', 1)[-1].lower()
+
+    def _quota_ready(self, job: Dict) -> float:
+        """Réserve sans attendre un compte pour l'envoi (``throttle`` de l'étage d'envoi).
+
+        Renvoie 0 si un jeton a été consommé (compte et attente cumulée dans
+        ``quota_sender`` / ``quota_waited``), sinon le délai avant de réessayer:
+        le contact est mis de côté et les autres domaines continuent.
+        """
+        sender, wait = self.senders.try_acquire(job['email'], self.rate_scheduler)
+        started = job.setdefault('quota_since', time.monotonic())
+        if wait > 0:
+            if wait > 3600 and job.get('quota_deferred') is None:
+                logger.warning(f"⏳ Plafond journalier atteint pour {sender.email}, reprise dans {wait / 3600:.1f}h")
+            job['quota_deferred'] = True
+            return min(wait, 600)
+        job.pop('quota_since')
+        job.pop('quota_deferred', None)
+        job['quota_sender'] = sender
+        job['quota_waited'] = time.monotonic() - started
+        self.rate_scheduler.record_wait(job['quota_waited'])
+        return 0
+
+    def _run_pipeline(self, pipeline: CampaignPipeline, jobs: Iterable[Dict]) -> int:
+        """Fait tourner le pipeline (profondeur des files visible en /metrics) et garde ses statistiques"""
+        self.active_pipeline = pipeline
+        try:
+            return pipeline.run(jobs)
+        finally:
+            self.active_pipeline = None
+            self.pipeline_stats = pipeline.stats()
+
+    def iter_contacts(self, csv_path: str) -> ContactSource:
+        """Source paresseuse des contacts validés et dédoublonnés (CSV, CSV.gz, JSONL)"""
+        return ContactSource.from_config(csv_path, self.config.get('contacts'), self.config.get('report_dir'))
 
     def load_companies(self, csv_path: str) -> List[Dict]:
-        """Charge la liste des personnes depuis CSV"""
-        companies = []
+        """Charge la liste des personnes depuis CSV (tout en mémoire, préférer iter_contacts)"""
         try:
-            with open(csv_path, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    companies.append({
-                        'company_name': row['company_name'],
-                        'email': row['email'],
-                        'Nom_ceo': row['Nom_ceo'],
-                        'Titre': row['Titre']
-                    })
-            logger.info(f"Chargé {len(companies)} contacts")
-            return companies
+            return list(self.iter_contacts(csv_path))
         except Exception as e:
             logger.error(f"Erreur lors du chargement du CSV: {e}")
-            return []
+            raise
 
-    def run_email_campaign(self, csv_path: str, cv_path: Optional[str] = None, 
-                          max_workers: int = 3, delay_between_emails: int = 10,
-                          scheduled: bool = False):
-        """Lance la campagne d'emails"""
+    def _start_campaign(self, csv_path: str, cv_path: Optional[str],
+                        delay_between_emails: float, scheduled: bool,
+                        resume: bool = False) -> Optional[Iterator[Dict]]:
+        """Ouvre la source de contacts et prépare quotas et journal.
+
+        Renvoie l'itérateur des contacts restant à traiter (en reprise, ceux
+        déjà envoyés sont sautés), ou None si la source est inutilisable.
+        """
         schedule_msg = " PLANIFIÉE" if scheduled else ""
         logger.info(f"🚀 === DÉBUT CAMPAGNE EMAIL{schedule_msg} ===")
+        self.start_metrics_server()
         
-        companies = self.load_companies(csv_path)
-        if not companies:
+        # Par défaut les contacts sont lus au fil de l'envoi: le premier part sans attendre
+        # la lecture du fichier entier, et le nombre attendu n'est connu qu'à la fin de celle-ci.
+        # ``contacts.estimate``: première passe complète pour annoncer total et fin estimée.
+        self.contact_source = self.iter_contacts(csv_path)
+        estimate = self.config.get('contacts', {}).get('estimate', False)
+        try:
+            if estimate:
+                domains = self.contact_source.domain_counts()
+                self.expected_contacts = sum(domains.values())
+                first = None
+            else:
+                domains = None
+                self.expected_contacts = 0
+                contacts = iter(self.contact_source)
+                first = next(contacts, None)
+        except Exception as e:
+            logger.error(f"❌ Erreur lors du chargement des contacts ({csv_path}): {e}")
+            return None
+        if not self.expected_contacts and first is None:
             logger.error("❌ Aucune entreprise chargée")
-            return
+            return None
         
-        logger.info(f"📊 Traitement de {len(companies)} entreprises")
+        if estimate:
+            logger.info(f"📊 Traitement de {self.expected_contacts} entreprises")
+            contacts = iter(self.contact_source)
+        else:
+            logger.info("📊 Traitement des entreprises au fil de la lecture (total inconnu)")
+            contacts = self._count_contacts(itertools.chain([first], contacts))
         
-        # Vérification CV
-        cv_status = "✅ AVEC CV" if cv_path and Path(cv_path).exists() else "⚠️ SANS CV"
+        # Vérification CV: résolution et encodage une seule fois pour toute la campagne
+        self.attachments.clear()
+        cv = self.attachments.resolve(self.cv_candidates(cv_path), CV_FILENAME)
+        cv_status = "✅ AVEC CV" if cv is not None else "⚠️ SANS CV"
         logger.info(f"📎 Statut CV: {cv_status}")
         
-        # Traitement séquentiel avec délai pour éviter le spam
-        for i, company in enumerate(companies, 1):
-            logger.info(f"📧 [{i}/{len(companies)}] Traitement en cours...")
-            
-            result = self.process_person(company, cv_path, scheduled)
-            
-            # Délai entre emails sauf pour le dernier
-            if i < len(companies):
-                logger.info(f"⏱️ Attente {delay_between_emails}s avant le prochain email...")
-                time.sleep(delay_between_emails)
+        # Quotas d'envoi: sans section rate_limits, delay_between_emails fixe la cadence globale
+        self.rate_scheduler = RateScheduler.from_config(
+            self.senders.rate_rules(self.config.get('rate_limits')), default_interval=delay_between_emails
+        )
+        if domains is not None:
+            eta = self.rate_scheduler.predict_completion(domains, account=self._single_account())
+            logger.info(f"🕒 Fin d'envoi estimée: {eta.strftime('%Y-%m-%d %H:%M:%S')}")
+        
+        if self.journal is None:
+            return contacts
+        run_id = self.journal.start(csv_path, resume=resume)
+        logger.info(f"📓 Journal de campagne: {run_id}")
+        # En reprise, un contact déjà déposé dans l'outbox de cette exécution partira avec elle
+        prepared = self.outbox if resume and self.outbox is not None else None
+        return (contact for contact in contacts
+                if not self.journal.is_done(contact['email'])
+                and not (prepared is not None and prepared.has(run_id, contact['email'])))
+
+    def _count_contacts(self, contacts: Iterator[Dict]) -> Iterator[Dict]:
+        """Transmet les contacts lus au fil de l'eau; à la fin de la lecture, le nombre
+        attendu devient connu (rapport, fichier de résultats et sa fin estimée)"""
+        yield from contacts
+        self.expected_contacts = self.contact_source.accepted
+        if self.results is not None:
+            self.results.stats.expected = self.expected_contacts
+        logger.info(f"📊 {self.expected_contacts} entreprises lues")
+
+    def _single_account(self) -> Optional[str]:
+        """Compte à prendre en compte dans l'estimation de durée (None si plusieurs comptes)"""
+        return self.senders.primary.email if len(self.senders.accounts) == 1 else None
+
+    def _finish_campaign(self, scheduled: bool):
+        """Sauvegarde les quotas et produit le rapport final"""
+        self.rate_scheduler.save()
         
         # Rapport final
         self.generate_report()
+        if self.results is not None:
+            self.results.close()
+            self.results = None
         
+        schedule_msg = " PLANIFIÉE" if scheduled else ""
         logger.info(f"🏁 === FIN CAMPAGNE EMAIL{schedule_msg} ===")
 
-    def schedule_campaign_immediate(self, csv_path: str, cv_path: Optional[str] = None):
-        """Lance la campagne avec envoi planifié immédiat (headers de planification)"""
-        logger.info("🕐 Lancement de la campagne avec PLANIFICATION FORCÉE dans les emails")
-        logger.info("📅 Emails configurés pour être livrés demain matin à 8h00")
+    def run_email_campaign(self, csv_path: str, cv_path: Optional[str] = None, 
+                          max_workers: int = 3, delay_between_emails: int = 10,
+                          scheduled: bool = False, resume: bool = False):
+        """Lance la campagne d'emails (``resume``: reprend la dernière campagne de ce CSV)"""
+        # Mode asyncio activé dans la configuration: simple enveloppe synchrone
+        if self.config.get('async', {}).get('enabled'):
+            asyncio.run(self.arun_email_campaign(csv_path, cv_path, delay_between_emails,
+                                                 scheduled, resume=resume))
+            return
+        
+        contacts = self._start_campaign(csv_path, cv_path, delay_between_emails, scheduled,
+                                        resume)
+        if contacts is None:
+            return
+        self._open_results()
+        
+        # Traitement en pipeline: les contacts sont lus au fil de l'eau, l'envoi suit les quotas
+        pipeline = self.build_pipeline(max_workers, total=self.expected_contacts)
+        self._run_pipeline(pipeline, (self._new_job(contact, cv_path, scheduled) for contact in contacts))
+        
+        # Fermeture des sessions SMTP restées ouvertes
+        self.senders.close()
+        
+        self._finish_campaign(scheduled)
+
+    def prepare_campaign(self, csv_path: str, cv_path: Optional[str] = None,
+                         max_workers: int = 3, scheduled: bool = False,
+                         resume: bool = False) -> Optional[str]:
+        """Phase 1: recherche, génération et rendu MIME de tous les contacts dans l'outbox.
+
+        Rien n'est envoyé. Renvoie l'identifiant du lot préparé (None en cas
+        d'échec), à passer à ``send_outbox``.
+        """
+        if self.outbox is None:
+            logger.error("❌ Outbox désactivée (outbox.enabled = false)")
+            return None
+        contacts = self._start_campaign(csv_path, cv_path, 0, scheduled, resume)
+        if contacts is None:
+            return None
+        
+        self._open_outbox_batch(csv_path)
+        logger.info(f"📦 Préparation de l'outbox: lot {self.outbox_batch}")
+        
+        pipeline_config = self.config.get('pipeline', {})
+        pipeline = CampaignPipeline(
+            self._generation_stages(max_workers) + [
+                Stage('render', self._stage_render, pipeline_config.get('render_workers', 1))
+            ],
+            queue_size=pipeline_config.get('queue_size', 32),
+            on_error=lambda stage, job, e: self._record_failure(job, e, stage.name)
+        )
+        self._run_pipeline(pipeline, (self._new_job(contact, cv_path, scheduled) for contact in contacts))
+        
+        stats = self.outbox.stats(self.outbox_batch)
+        logger.info(f"📦 Outbox prête: {stats['states'].get(outbox_states.PENDING, 0)} messages en attente "
+                    f"({stats['stored_bytes']} octets + {stats['shared_parts_bytes']} octets de pièces jointes partagées)")
+        return self.outbox_batch
+
+    def _open_outbox_batch(self, csv_path: str):
+        """Déclare le lot de l'outbox (identifiant de la campagne journalisée s'il y en a une)"""
+        if self.journal is not None:
+            self.outbox_batch = self.journal.run_id
+        else:
+            self.outbox_batch = f"{Path(csv_path).stem}-{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+        self.outbox.open_batch(self.outbox_batch, csv_path)
+
+    def enqueue_campaign(self, csv_path: str, cv_path: Optional[str] = None,
+                         scheduled: bool = False, resume: bool = False) -> Optional[str]:
+        """Dépose les contacts du CSV dans la file partagée; renvoie le lot (None en cas d'échec).
+
+        Les workers (``run_worker``, sur cette machine ou une autre) les
+        préparent ensuite dans l'outbox; l'envoi reste à un seul processus
+        (``send_outbox``) pour que quotas et comptes restent coordonnés.
+        """
+        if self.outbox is None or self.job_queue is None:
+            logger.error("❌ Outbox ou file de contacts désactivée (outbox/queue.enabled = false)")
+            return None
+        contacts = self._start_campaign(csv_path, cv_path, 0, scheduled, resume)
+        if contacts is None:
+            return None
+        self._open_outbox_batch(csv_path)
+        added = self.job_queue.enqueue(self.outbox_batch, contacts, cv_path=cv_path, scheduled=scheduled)
+        logger.info(f"📥 {added} contacts mis en file (lot {self.outbox_batch})")
+        return self.outbox_batch
+
+    def _stage_render_queued(self, job: Dict) -> Dict:
+        """Étage de rendu d'un worker: dépose le message dans l'outbox puis conclut le contact"""
+        job = self._stage_render(job)
+        self.job_queue.complete(job['queue_id'], {
+            'company': job['company_name'],
+            'email': job['email'],
+            'subject': job['subject'],
+            'success': True,
+            'from_cache': bool(job.get('from_cache'))
+        })
+        return job
+
+    def run_worker(self, batch: Optional[str] = None, max_workers: int = 3) -> int:
+        """Worker de préparation: réclame des contacts dans la file partagée, les recherche,
+        génère et rend dans l'outbox jusqu'à épuisement du lot. N'envoie rien.
+
+        Renvoie le nombre de contacts traités par ce worker.
+        """
+        batch = batch or self.job_queue.latest_batch()
+        if batch is None:
+            logger.warning("📭 Aucun lot en file")
+            return 0
+        self.outbox_batch = batch
+        if self.journal is not None:
+            self.journal.start(self.outbox.source(batch), run_id=batch)
+        # Contacts abandonnés par la file (baux expirés): lettre morte et journal, comme les autres échecs
+        self.job_queue.on_abandoned = lambda item, error: self._record_failure(
+            self._new_job(item['contact'], item.get('cv_path'), item.get('scheduled', False)), error, 'queue'
+        )
+        logger.info(f"👷 Worker {self.job_queue.worker_id} sur le lot {batch}")
+        
+        def claimed_jobs() -> Iterator[Dict]:
+            for item in self.job_queue.iter_claims(batch, limit=max_workers * 2):
+                job = self._new_job(item['contact'], item.get('cv_path'), item.get('scheduled', False))
+                job['queue_id'] = item['id']
+                yield job
+        
+        pipeline_config = self.config.get('pipeline', {})
+        pipeline = CampaignPipeline(
+            self._generation_stages(max_workers) + [
+                Stage('render', self._stage_render_queued, pipeline_config.get('render_workers', 1))
+            ],
+            queue_size=pipeline_config.get('queue_size', 32),
+            on_error=lambda stage, job, e: self._record_failure(job, e, stage.name)
+        )
+        heartbeat = self.job_queue.start_heartbeat()
+        try:
+            count = self._run_pipeline(pipeline, claimed_jobs())
+        finally:
+            heartbeat.set()
+        logger.info(f"👷 Worker {self.job_queue.worker_id} terminé: {count} contacts traités")
+        return count
+
+    def run_distributed(self, csv_path: str, cv_path: Optional[str] = None,
+                        processes: Optional[int] = None, max_workers: int = 3,
+                        scheduled: bool = False, resume: bool = False) -> Optional[str]:
+        """Met le CSV en file et le fait préparer par ``processes`` workers locaux.
+
+        D'autres processus de la même machine peuvent rejoindre le lot avec
+        ``python job_queue.py worker`` (fichiers SQLite en WAL: jamais sur un
+        disque réseau). Renvoie le lot, prêt pour ``send_outbox``.
+        """
+        batch = self.enqueue_campaign(csv_path, cv_path, scheduled, resume)
+        if batch is None:
+            return None
+        processes = processes or self.config.get('queue', {}).get('processes') or os.cpu_count() or 1
+        # "spawn": chaque worker ouvre ses propres connexions SQLite, HTTP et son propre journal
+        context = multiprocessing.get_context('spawn')
+        workers = [context.Process(target=run_worker_process, name=f"worker-{i}",
+                                   args=(self.config_path, batch, max_workers))
+                   for i in range(processes)]
+        for worker in workers:
+            worker.start()
+        logger.info(f"👷 {processes} workers lancés sur le lot {batch}")
+        for worker in workers:
+            worker.join()
+        
+        summary = self.job_queue.summary(batch)
+        logger.info(f"📦 Lot {batch} préparé: {summary['states'].get(queue_states.DONE, 0)} prêts, "
+                    f"{summary['states'].get(queue_states.FAILED, 0)} en échec, {summary['requeued']} remis en file")
+        return batch
+
+    def send_outbox(self, batch: Optional[str] = None, delay_between_emails: float = 10):
+        """Phase 2: envoie les messages préparés, au rythme maximal permis par les quotas.
+
+        Aucun appel Serper ni LLM: seule la remise SMTP reste. Sans ``batch``,
+        le dernier lot ayant des messages en attente est envoyé.
+        """
+        if self.outbox is None:
+            logger.error("❌ Outbox désactivée (outbox.enabled = false)")
+            return
+        batch = batch or self.outbox.latest_batch()
+        if batch is None:
+            logger.warning("📭 Aucun message en attente dans l'outbox")
+            return
+        self.outbox_batch = batch
+        logger.info(f"🚀 === ENVOI DE L'OUTBOX {batch} ===")
+        self.start_metrics_server()
+        
+        domains = self.outbox.domain_counts(batch)
+        self.expected_contacts = sum(domains.values())
+        self.rate_scheduler = RateScheduler.from_config(
+            self.senders.rate_rules(self.config.get('rate_limits')), default_interval=delay_between_emails
+        )
+        eta = self.rate_scheduler.predict_completion(domains, account=self._single_account())
+        logger.info(f"📊 {self.expected_contacts} messages à envoyer, "
+                    f"fin estimée: {eta.strftime('%Y-%m-%d %H:%M:%S')}")
+        self._open_results()
+        if self.journal is not None:
+            self.journal.start(self.outbox.source(batch), run_id=batch)
+        
+        pipeline_config = self.config.get('pipeline', {})
+        pipeline = CampaignPipeline(
+            [Stage('send', lambda row: self._send_prepared(row, batch, row.pop('quota_sender'), defer=True),
+                   pipeline_config.get('send_workers', 1),
+                   throttle=self._quota_ready, throttle_key=self._quota_key,
+                   max_deferred=pipeline_config.get('max_deferred', 1000))],
+            queue_size=pipeline_config.get('queue_size', 32),
+            on_error=lambda stage, row, e: self._record_failure(self._prepared_job(row, batch), e, stage.name)
+        )
+        self._run_pipeline(pipeline, self.outbox.pending(batch))
+        
+        self.senders.close()
+        self._finish_campaign(False)
+
+    def _deliver_prepared(self, row: Dict, sender: SenderAccount):
+        """Remet un message de l'outbox; rendu pour un autre compte (bascule), seul l'en-tête From change"""
+        replacement = None if sender.email == row['account'] else (sender.from_name, sender.email)
+        self.smtp_send(sender, row['email'], self.outbox.render(row['id'], replacement))
+
+    @staticmethod
+    def _prepared_job(row: Dict, batch: str) -> Dict:
+        """Contexte d'un message de l'outbox, pour le journal et les résultats"""
+        return {
+            'company_name': row['company'],
+            'email': row['email'],
+            'subject': row['subject'],
+            'body_length': row['body_length'],
+            'scheduled': False,
+            'run_id': batch
+        }
+
+    def _send_prepared(self, row: Dict, batch: str, sender: Optional[SenderAccount] = None,
+                       defer: bool = False) -> Dict:
+        """Envoie un message préparé du lot ``batch`` (quotas, bascule de compte, journal).
+
+        Sans ``sender`` (compte déjà réservé par l'appelant), attend les quotas.
+        ``defer``: voir ``send_with_failover``.
+        """
+        job = self._prepared_job(row, batch)
+        if not row.get('claimed'):
+            if not self.outbox.claim(row['id']):
+                # Pris par un autre processus (ou un autre minuteur) entre la lecture et l'envoi
+                logger.info(f"⏭️ {row['email']} déjà pris en charge dans le lot {batch}, message ignoré")
+                return None
+            if self.journal is not None and self.journal.state(row['email'], batch) in DONE_STATES:
+                # Déjà envoyé (ou en cours) hors de l'outbox, par exemple par une reprise de la campagne
+                logger.info(f"⏭️ {row['email']} déjà envoyé dans la campagne {batch}, message préparé ignoré")
+                self.outbox.mark(row['id'], outbox_states.SENT, "déjà envoyé")
+                return None
+            if sender is None:
+                sender, _ = self.senders.acquire(row['email'], self.rate_scheduler)
+            # Journalisé avant la remise SMTP: un crash ici ne provoque pas de renvoi
+            self._journal(job, SENDING, message_id=row['message_id'])
+            # Un envoi différé après une bascule reprend après ces étapes
+            row['claimed'] = True
+        try:
+            job['sender'] = self.send_with_failover(
+                row['email'], sender, lambda account: self._deliver_prepared(row, account), defer
+            ).email
+        except Deferred:
+            raise
+        except Exception as e:
+            logger.error(f"❌ Erreur envoi à {row['email']} ({row['company']}): {e}")
+            self.outbox.mark(row['id'], outbox_states.FAILED, str(e))
+            return self._record_result(job, False, str(e))
+        self.outbox.mark(row['id'], outbox_states.SENT)
+        logger.log(self.log_sampler.level('sent'),
+                   f"✅ Email préparé envoyé à {row['email']} ({row['company']})")
+        return self._record_result(job, True)
+
+    async def aprocess_person(self, person_data: Dict, cv_path: Optional[str] = None,
+                              scheduled: bool = False) -> Dict:
+        """Version asyncio de process_person"""
+        async with AsyncEmailBackend.from_config(self) as backend:
+            return await backend.process_person(person_data, cv_path, scheduled)
+
+    async def arun_email_campaign(self, csv_path: str, cv_path: Optional[str] = None,
+                                  delay_between_emails: int = 10, scheduled: bool = False,
+                                  concurrency: Optional[int] = None, resume: bool = False):
+        """Lance la campagne sur une boucle asyncio (sessions HTTP et SMTP partagées).
+
+        ``concurrency`` (ou ``async.concurrency`` dans la configuration) borne
+        le nombre de contacts en vol.
+        """
+        contacts = self._start_campaign(csv_path, cv_path, delay_between_emails, scheduled,
+                                        resume)
+        if contacts is None:
+            return
+        self._open_results()
         
-        # Lance la campagne avec le flag scheduled=True
-        self.run_email_campaign(csv_path, cv_path, scheduled=True)
+        backend = AsyncEmailBackend.from_config(self)
+        if concurrency:
+            backend.concurrency = concurrency
+        self.active_pipeline = backend
+        try:
+            async with backend:
+                await backend.run(contacts, cv_path, scheduled)
+        finally:
+            self.active_pipeline = None
+        self.pipeline_stats = backend.stats()
+        
+        self._finish_campaign(scheduled)
 
     def generate_report(self):
-        """Génère un rapport de la campagne"""
-        total = len(self.sent_emails) + len(self.failed_emails)
-        success_rate = (len(self.sent_emails) / total * 100) if total > 0 else 0
+        """Génère le rapport de la campagne: agrégats et statistiques des composants.
+
+        Le détail par contact est dans le fichier de résultats (``results_file``).
+        """
+        summary = self.campaign_stats.summary()
         
         report = {
             'timestamp': datetime.now().isoformat(),
-            'total_emails': total,
-            'sent_successfully': len(self.sent_emails),
-            'failed': len(self.failed_emails),
-            'success_rate': f"{success_rate:.1f}%",
-            'sent_emails': self.sent_emails,
-            'failed_emails': self.failed_emails
+            **summary,
+            'results_file': self.results.path if self.results is not None else None,
+            'contacts': self.contact_source.stats() if self.contact_source else None,
+            'journal': self.journal.summary() if self.journal and self.journal.run_id else None,
+            'attachments': self.attachments.stats(),
+            'message_templates': self.message_factory.stats(),
+            'pipeline': self.pipeline_stats,
+            'rate_limits': self.rate_scheduler.stats(),
+            'search_cache': self.search_cache.stats() if self.search_cache else None,
+            'llm': self.llm.stats(),
+            'resilience': self.resilience.stats(),
+            'email_cache': self.email_cache.stats() if self.email_cache else None,
+            'outbox': self.outbox.stats(self.outbox_batch) if self.outbox and self.outbox_batch else None,
+            'workers': self.job_queue.summary(self.outbox_batch) if self.job_queue and self.outbox_batch else None,
+            'accounts': self.senders.stats(),
+            'smtp_sessions': self.smtp_pool.stats(),
+            'metrics': self.metrics.snapshot()
         }
         
         # Sauvegarde du rapport
-        with open(f'email_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json', 
-                  'w', encoding='utf-8') as f:
+        report_path = Path(self.config.get('report_dir', '.')) / f'email_report_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json'
+        with open(report_path, 'w', encoding='utf-8') as f:
             json.dump(report, f, indent=2, ensure_ascii=False)
+        self.last_report = str(report_path)
         
-        logger.info(f"RAPPORT: {len(self.sent_emails)}/{total} emails envoyés avec succès ({success_rate:.1f}%)")
+        logger.info(f"RAPPORT: {summary['sent_successfully']}/{summary['total_emails']} emails envoyés "
+                    f"avec succès ({summary['success_rate']})")
         
-        if self.failed_emails:
-            logger.warning(f"Échecs: {[e['company'] for e in self.failed_emails]}")
+        if summary['failed']:
+            logger.warning(f"Échecs: {summary['failed']} (domaines les plus touchés: "
+                           f"{list(summary['failing_domains'])[:5]})")
+
+    def send_window(self, schedule_time: Optional[str] = None) -> SendWindow:
+        """Plage d'envoi planifiée (section ``scheduler``), à ``schedule_time`` heure locale du destinataire"""
+        config = self.config.get('scheduler', {})
+        return SendWindow(schedule_time or self.config.get('schedule_time', "08:00"),
+                          config.get('window_minutes', 120),
+                          config.get('timezone', DEFAULT_TIMEZONE),
+                          config.get('domain_timezones'))
 
-    def schedule_campaign(self, csv_path: str, cv_path: Optional[str] = None, 
-                         schedule_time: str = "08:00"):
-        """Planifie la campagne pour demain matin (méthode traditionnelle)"""
-        logger.info(f"📅 Campagne planifiée pour demain à {schedule_time}")
+    def plan_outbox(self, batch: str, window: SendWindow) -> int:
+        """Programme un minuteur par message en attente du lot, réparti sur la plage
+        d'envoi de chaque destinataire; renvoie le nombre de minuteurs"""
+        # Une nouvelle planification du même lot remplace la précédente
+        replaced = self.scheduler.cancel(batch)
+        if replaced:
+            logger.info(f"📅 {replaced} envois déjà planifiés pour {batch} remplacés")
+        rows = [(row['id'], row['email'], row['timezone']) for row in self.outbox.pending(batch)]
+        send_times = list(window.spread([(email, timezone) for _, email, timezone in rows]))
+        self.scheduler.add_many(batch, 'send', (
+            (send_at, {'message': message}) for (message, _, _), send_at in zip(rows, send_times)
+        ))
+        if send_times:
+            first, last = min(send_times), max(send_times)
+            logger.info(f"📅 {len(rows)} envois planifiés du {datetime.fromtimestamp(first):%Y-%m-%d %H:%M:%S} "
+                        f"au {datetime.fromtimestamp(last):%Y-%m-%d %H:%M:%S} (heure de cette machine)")
+        return len(rows)
+
+    def schedule_campaign(self, csv_path: str, cv_path: Optional[str] = None,
+                          schedule_time: str = "08:00", wait: bool = True):
+        """Planifie la campagne à ``schedule_time``, heure locale de chaque destinataire.
+
+        Avec l'outbox, recherche et génération sont faites tout de suite:
+        chaque message reçoit son minuteur dans la plage d'envoi de son
+        destinataire (``scheduler.window_minutes``). Sans outbox, la
+        campagne entière est lancée au début de la prochaine plage. Les
+        minuteurs sont persistants: avec ``wait=False`` (ou après un
+        redémarrage), ``run_scheduler`` les exécute.
+        """
+        if self.scheduler is None:
+            logger.error("❌ Planificateur désactivé (scheduler.enabled = false)")
+            return
+        window = self.send_window(schedule_time)
+        if self.outbox is not None:
+            batch = self.prepare_campaign(csv_path, cv_path)
+            if batch is None:
+                return
+            self.plan_outbox(batch, window)
+        else:
+            run_at, _ = window.next_window(window.default)
+            campaign = f"{Path(csv_path).stem}-{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+            self.scheduler.add(campaign, 'campaign', run_at, {'csv_path': csv_path, 'cv_path': cv_path})
+            logger.info(f"📅 Campagne planifiée le {datetime.fromtimestamp(run_at):%Y-%m-%d %H:%M:%S}")
         
-        schedule.every().day.at(schedule_time).do(
-            self.run_email_campaign, csv_path, cv_path, 30, False
+        if wait:
+            self.run_scheduler(until_idle=True)
+
+    def schedule_campaign_immediate(self, csv_path: str, cv_path: Optional[str] = None):
+        """Ancienne planification par en-têtes de livraison différée: les messages sont
+        désormais retenus puis envoyés à l'heure prévue (voir ``schedule_campaign``)"""
+        self.schedule_campaign(csv_path, cv_path, self.config.get('schedule_time', "08:00"))
+
+    def run_scheduler(self, until_idle: bool = False, delay_between_emails: float = 0) -> int:
+        """Exécute les envois planifiés de toutes les campagnes à leur échéance.
+
+        Tourne jusqu'à Ctrl+C (ou, avec ``until_idle``, jusqu'à ce qu'il ne
+        reste plus rien de planifié). La cadence vient de la répartition sur
+        les plages d'envoi; les quotas ``rate_limits`` s'appliquent toujours.
+        Renvoie le nombre de minuteurs exécutés.
+        """
+        if self.scheduler is None:
+            logger.error("❌ Planificateur désactivé (scheduler.enabled = false)")
+            return 0
+        self.start_metrics_server()
+        self.rate_scheduler = RateScheduler.from_config(
+            self.senders.rate_rules(self.config.get('rate_limits')), default_interval=delay_between_emails
         )
+        next_run = self.scheduler.next_run()
+        next_msg = f", prochain le {datetime.fromtimestamp(next_run):%Y-%m-%d %H:%M:%S}" if next_run else ""
+        self.expected_contacts = self.scheduler.pending()
+        logger.info(f"⏳ Planificateur: {self.expected_contacts} minuteurs en attente{next_msg}")
+        self._open_results()
+        logger.info("⚠️ Appuyez sur Ctrl+C pour arrêter (les envois planifiés sont conservés)")
         
-        logger.info("⏳ En attente de l'heure programmée...")
-        logger.info("⚠️ Appuyez sur Ctrl+C pour arrêter")
-        
+        handlers = {'send': self._run_scheduled_send, 'campaign': self._run_scheduled_campaign}
+        fired = 0
         try:
-            while True:
-                schedule.run_pending()
-                time.sleep(60)  # Vérifie toutes les minutes
+            fired = self.scheduler.run(handlers, until_idle, on_campaign_done=self._scheduled_campaign_done)
         except KeyboardInterrupt:
-            logger.info("🛑 Arrêt du planificateur")
+            logger.info(f"🛑 Arrêt du planificateur: {self.scheduler.pending()} minuteurs restent planifiés")
+        
+        self.senders.close()
+        if self.campaign_stats.total:
+            self._finish_campaign(True)
+        elif self.results is not None:
+            self.results.close()
+            self.results = None
+        return fired
 
-def main():
-    """Fonction principale"""
+    def _run_scheduled_send(self, payload: Dict):
+        """Minuteur ``send``: envoie un message de l'outbox s'il est toujours en attente"""
+        row = self.outbox.message(payload['message'])
+        if row is None or row['state'] != outbox_states.PENDING:
+            # Déjà parti (ou en cours au moment d'un arrêt brutal): jamais renvoyé
+            logger.debug(f"Message #{payload['message']} déjà traité, minuteur ignoré")
+            return
+        self._send_prepared(row, row['batch'])
+
+    def _run_scheduled_campaign(self, payload: Dict):
+        """Minuteur ``campaign`` (sans outbox): campagne complète, sur une instance dédiée
+        pour ne pas partager l'état des autres campagnes en cours"""
+        system = EmailAutomationSystem(self.config_path)
+        system.run_email_campaign(payload['csv_path'], payload.get('cv_path'), delay_between_emails=30)
+
+    def _scheduled_campaign_done(self, campaign: str):
+        if self.outbox is None:
+            logger.info(f"🏁 Campagne planifiée {campaign} terminée")
+            return
+        states = self.outbox.stats(campaign)['states']
+        logger.info(f"🏁 Lot planifié {campaign} terminé: {states.get(outbox_states.SENT, 0)} envoyés, "
+                    f"{states.get(outbox_states.FAILED, 0)} en échec")
+
+
+def run_worker_process(config_path: str, batch: str, max_workers: int = 3):
+    """Point d'entrée d'un processus worker (``run_distributed``)"""
+    system = EmailAutomationSystem(config_path)
+    system.run_worker(batch, max_workers=max_workers)
+
+
+def interactive_menu(config_path: str = "config.json", csv_path: str = "filtered_achraf.csv",
+                     cv_path: str = "CV_USER.pdf"):
+    """Menu interactif (lancement sans sous-commande)"""
     print("🚀 === SYSTÈME D'AUTOMATION D'EMAILS ===\n")
     
     # Initialisation
-    system = EmailAutomationSystem("config.json")
-    
-    # Chemins des fichiers
-    csv_path = "filtered_achraf.csv" # Ajoutez votre fichier CSV
-    cv_path = "CV_USER.pdf"  # Ajoutez votre CV
+    system = EmailAutomationSystem(config_path)
     
     # Menu amélioré
     print("📧 OPTIONS D'ENVOI:")
     print("1. 🚀 Lancer la campagne IMMÉDIATEMENT")
-    print("2. ⏰ Planifier avec ATTENTE (script reste ouvert jusqu'à 8h00 demain)")
-    print("3. 📅 PLANIFICATION FORCÉE (envoi immédiat avec headers de planification)")
+    print("2. ⏰ Planifier avec ATTENTE (envoi à 8h00 heure locale de chaque destinataire)")
+    print("3. 📅 PLANIFICATEUR: exécuter les envois déjà planifiés (reprise après redémarrage)")
+    print("4. ♻️ REPRENDRE la dernière campagne interrompue (sans renvoyer les emails déjà partis)")
+    print("5. 📦 PRÉPARER l'outbox maintenant (recherche + génération, sans envoi)")
+    print("6. 📤 ENVOYER l'outbox préparée")
+    print("7. 👷 PRÉPARER l'outbox en multi-processus (workers sur une file partagée)")
 
     
-    choice = input("\n🎯 Votre choix (1/2/3): ").strip()
+    choice = input("\n🎯 Votre choix (1/2/3/4/5/6/7): ").strip()
     
     if choice == "1":
         print("🚀 Lancement immédiat de la campagne...")
         system.run_email_campaign(csv_path, cv_path)
     
     elif choice == "2":
-        print("⏰ Planification traditionnelle - Le script va attendre...")
+        print("⏰ Planification - Le script va attendre les plages d'envoi...")
         system.schedule_campaign(csv_path, cv_path, "08:00")
     
     elif choice == "3":
-        print("📅 PLANIFICATION FORCÉE - Envoi avec headers de livraison planifiée...")
-        system.schedule_campaign_immediate(csv_path, cv_path)
+        print("📅 Planificateur - Exécution des envois planifiés (Ctrl+C pour arrêter)...")
+        system.run_scheduler()
+    
+    elif choice == "4":
+        print("♻️ Reprise de la dernière campagne...")
+        system.run_email_campaign(csv_path, cv_path, resume=True)
+    
+    elif choice == "5":
+        print("📦 Préparation de l'outbox...")
+        system.prepare_campaign(csv_path, cv_path)
+    
+    elif choice == "6":
+        print("📤 Envoi de l'outbox préparée...")
+        system.send_outbox()
+    
+    elif choice == "7":
+        print("👷 Préparation multi-processus de l'outbox...")
+        system.run_distributed(csv_path, cv_path)
     
     else:
         print("❌ Choix invalide")
 
+
+def build_parser() -> argparse.ArgumentParser:
+    """Ligne de commande: une sous-commande par mode, utilisable depuis cron ou la CI"""
+    common = argparse.ArgumentParser(add_help=False)
+    # SUPPRESS: un --config placé avant la sous-commande n'est pas écrasé par le défaut
+    common.add_argument('--config', default=argparse.SUPPRESS, help="fichier de configuration")
+    common.add_argument('--dry-run', action='store_true',
+                        help="faux Serper/OpenRouter et serveur SMTP puits locaux, rien ne sort")
+    # Latences par défaut: réalistes à blanc (0.05 / 0.2 / 0.01 s, ±20 %), nulles en benchmark
+    common.add_argument('--search-latency', type=float, help="latence du faux Serper (s)")
+    common.add_argument('--llm-latency', type=float, help="latence du faux OpenRouter (s)")
+    common.add_argument('--smtp-latency', type=float, help="latence du SMTP puits (s)")
+    common.add_argument('--jitter', type=float, help="variation des latences (fraction)")
+    common.add_argument('--workdir', help="dossier des fichiers d'état de l'exécution à blanc (conservé)")
+
+    campaign = argparse.ArgumentParser(add_help=False)
+    campaign.add_argument('csv_path', help="contacts (CSV, CSV.gz ou JSONL)")
+    campaign.add_argument('--cv', dest='cv_path', help="CV à joindre")
+    campaign.add_argument('--workers', type=int, default=3, help="largeur des étages réseau")
+    campaign.add_argument('--delay', type=float, default=10,
+                          help="intervalle minimal entre deux envois sans section rate_limits (s)")
+
+    parser = argparse.ArgumentParser(description="Campagnes d'emails personnalisés")
+    parser.add_argument('--config', default="config.json", help="fichier de configuration")
+    commands = parser.add_subparsers(dest='command')
+    run = commands.add_parser('run', parents=[common, campaign], help="campagne immédiate")
+    run.add_argument('--scheduled', action='store_true', help="en-têtes de livraison planifiée")
+    commands.add_parser('resume', parents=[common, campaign],
+                        help="reprend la dernière campagne interrompue sur ce CSV")
+    schedule_cmd = commands.add_parser('schedule', parents=[common, campaign],
+                                       help="prépare tout de suite, envoie à l'heure prévue")
+    schedule_cmd.add_argument('--at', dest='schedule_time', help="heure d'envoi HH:MM (locale au destinataire)")
+    schedule_cmd.add_argument('--no-wait', dest='wait', action='store_false',
+                              help="planifie et rend la main (envois par la sous-commande scheduler)")
+    scheduler_cmd = commands.add_parser('scheduler', parents=[common],
+                                        help="exécute les envois planifiés de toutes les campagnes")
+    scheduler_cmd.add_argument('--until-idle', action='store_true',
+                               help="s'arrête quand plus rien n'est planifié")
+    scheduler_cmd.add_argument('--list', action='store_true', help="affiche les campagnes planifiées")
+    scheduler_cmd.add_argument('--cancel', metavar='CAMPAGNE', help="annule les envois planifiés d'une campagne")
+    prepare = commands.add_parser('prepare', parents=[common, campaign],
+                                  help="remplit l'outbox sans rien envoyer")
+    prepare.add_argument('--processes', type=int,
+                         help="nombre de workers (file partagée multi-processus)")
+    send = commands.add_parser('send', parents=[common], help="envoie un lot préparé de l'outbox")
+    send.add_argument('--batch', help="lot à envoyer (par défaut le dernier en attente)")
+    send.add_argument('--delay', type=float, default=10,
+                      help="intervalle minimal entre deux envois sans section rate_limits (s)")
+    bench = commands.add_parser('bench', parents=[common],
+                                help="benchmark à blanc: contacts/s, latences par étage, pic mémoire")
+    bench.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                       help="nombres de contacts synthétiques")
+    bench.add_argument('--workers', type=int, default=3, help="largeur des étages réseau")
+    bench.add_argument('--output', help="résultats JSON")
+    bench.add_argument('--mime', action='store_true',
+                       help="microbenchmark du rendu MIME (gabarit contre MIMEMultipart) au lieu des campagnes")
+    bench.add_argument('--messages', type=int, default=2000, help="messages rendus par le microbenchmark MIME")
+    report = commands.add_parser('report', help="agrégats d'un fichier de résultats, même en cours de campagne")
+    report.add_argument('--config', default=argparse.SUPPRESS, help="fichier de configuration")
+    report.add_argument('path', nargs='?',
+                        help="fichier email_results_*.jsonl (par défaut le plus récent de report_dir)")
+    report.add_argument('--tail', type=int, default=0, help="affiche aussi les N derniers résultats")
+    return parser
+
+
+def show_results(config_path: str, path: Optional[str] = None, count: int = 0) -> int:
+    """Affiche les agrégats (et les derniers résultats) d'un fichier de résultats"""
+    if path is None:
+        report_dir = "."
+        if os.path.exists(config_path):
+            with open(config_path, 'r', encoding='utf-8') as f:
+                report_dir = json.load(f).get('report_dir', '.')
+        path = results_file.latest(report_dir)
+        if path is None:
+            print(f"Aucun fichier de résultats dans {report_dir}")
+            return 1
+    output = results_file.summarize(path)
+    if count:
+        output['tail'] = results_file.tail(path, count)
+    print(json.dumps(output, indent=2, ensure_ascii=False))
+    return 0
+
+
+def run_command(args: argparse.Namespace, config_path: str) -> EmailAutomationSystem:
+    """Exécute la sous-commande avec la configuration ``config_path``"""
+    system = EmailAutomationSystem(config_path)
+    if args.command == 'run':
+        system.run_email_campaign(args.csv_path, args.cv_path, max_workers=args.workers,
+                                  delay_between_emails=args.delay, scheduled=args.scheduled)
+    elif args.command == 'resume':
+        system.run_email_campaign(args.csv_path, args.cv_path, max_workers=args.workers,
+                                  delay_between_emails=args.delay, resume=True)
+    elif args.command == 'schedule':
+        system.schedule_campaign(args.csv_path, args.cv_path,
+                                 args.schedule_time or system.config.get('schedule_time', "08:00"),
+                                 wait=args.wait)
+    elif args.command == 'scheduler':
+        if system.scheduler is None:
+            print("Planificateur désactivé (scheduler.enabled = false)")
+        elif args.list:
+            print(json.dumps(system.scheduler.campaigns(), indent=2, ensure_ascii=False))
+        elif args.cancel:
+            print(f"{system.scheduler.cancel(args.cancel)} envois annulés")
+        else:
+            system.run_scheduler(until_idle=args.until_idle)
+    elif args.command == 'prepare':
+        if args.processes:
+            batch = system.run_distributed(args.csv_path, args.cv_path, processes=args.processes,
+                                           max_workers=args.workers)
+        else:
+            batch = system.prepare_campaign(args.csv_path, args.cv_path, max_workers=args.workers)
+        if batch:
+            print(f"Lot préparé: {batch}")
+    elif args.command == 'send':
+        system.send_outbox(args.batch, delay_between_emails=args.delay)
+    return system
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Fonction principale: sous-commande, ou menu interactif sans argument"""
+    args = build_parser().parse_args(argv)
+    if args.command is None:
+        interactive_menu(args.config)
+        return 0
+    if args.command == 'report':
+        return show_results(args.config, args.path, args.tail)
+    
+    defaults = DRY_RUN_LATENCY if args.command != 'bench' else dict.fromkeys(DRY_RUN_LATENCY, 0.0)
+    latency = {name: default if getattr(args, name) is None else getattr(args, name)
+               for name, default in defaults.items()}
+    
+    if args.command == 'bench' and args.mime:
+        result = run_mime_benchmark(args.config, args.messages)
+        print(format_mime_result(result))
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(result, f, indent=2, ensure_ascii=False)
+        return 0
+    if args.command == 'bench':
+        results = run_benchmark(args.config, args.sizes, args.workers, output=args.output, **latency)
+        for result in results:
+            print(format_result(result))
+        return 1 if any('error' in r for r in results) else 0
+    
+    if not args.dry_run:
+        system = run_command(args, args.config)
+        return 1 if system.campaign_stats.failed else 0
+    
+    if hasattr(args, 'delay'):
+        # À blanc, l'envoi suit le rythme du serveur puits
+        args.delay = 0
+    with DryRun.from_file(args.config, workdir=args.workdir, **latency) as dry:
+        system = run_command(args, dry.config_path)
+        print(json.dumps({**dry.stats(), 'report': system.last_report,
+                          'results': system.last_results,
+                          'sent': system.campaign_stats.sent, 'failed': system.campaign_stats.failed},
+                         indent=2, ensure_ascii=False))
+    return 1 if system.campaign_stats.failed else 0
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
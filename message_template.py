@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Rendu MIME en masse: parties invariantes d'une campagne précalculées, messages rendus directement en octets
+"""
+
+import base64
+import logging
+import random
+import sys
+import threading
+from email.header import Header
+from email.message import Message
+from typing import Dict, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+CRLF = b"\r\n"
+
+# Longueur de ligne des en-têtes repliés (RFC 5322)
+MAX_HEADER_LENGTH = 78
+
+
+def make_boundary() -> str:
+    """Frontière au format du paquet ``email``. Le corps et les pièces jointes sont
+    en base64, qui ne contient jamais de suite de ``=``: aucune collision possible."""
+    return "=" * 15 + f"{random.randrange(sys.maxsize):019d}" + "=="
+
+
+def encode_header(name: str, value: str) -> bytes:
+    """Ligne d'en-tête ``Nom: valeur`` terminée par CRLF (RFC 2047 si non ASCII, repliée si longue)"""
+    line = f"{name}: {value}"
+    if value.isascii() and len(line) <= MAX_HEADER_LENGTH and "\n" not in value:
+        return line.encode('ascii') + CRLF
+    encoded = Header(value, 'utf-8' if not value.isascii() else 'us-ascii',
+                     MAX_HEADER_LENGTH, header_name=name).encode(linesep="\r\n")
+    return f"{name}: {encoded}".encode('ascii') + CRLF
+
+
+def encode_body(body: str) -> bytes:
+    """Corps texte UTF-8 en base64 (lignes de 76 caractères, CRLF), comme ``MIMEText``"""
+    return base64.encodebytes(body.encode('utf-8')).replace(b"\n", CRLF)
+
+
+def _part_bytes(part: Message) -> bytes:
+    """Partie MIME sérialisée une fois, en-têtes compris, fins de ligne CRLF"""
+    data = part.as_bytes(policy=part.policy.clone(linesep="\r\n"))
+    return data if data.endswith(CRLF) else data + CRLF
+
+
+class MessageTemplate:
+    """Squelette ``multipart/mixed`` d'une campagne pour un expéditeur et des pièces jointes.
+
+    Les en-têtes fixes, la frontière, l'en-tête de la partie texte et le
+    bloc des pièces jointes (déjà en base64) sont des octets calculés une
+    fois; ``render`` n'encode plus que les en-têtes du destinataire et le
+    corps, puis assemble. Le résultat est prêt pour ``sendmail``.
+    """
+
+    def __init__(self, from_header: str, parts: Sequence[Message] = (),
+                 boundary: Optional[str] = None):
+        self.boundary = boundary or make_boundary()
+        delimiter = b"--" + self.boundary.encode('ascii') + CRLF
+        self._head = (
+            encode_header('Content-Type', f'multipart/mixed; boundary="{self.boundary}"')
+            + b"MIME-Version: 1.0" + CRLF
+            + encode_header('From', from_header)
+        )
+        self._text_part = (
+            CRLF + delimiter
+            + b'Content-Type: text/plain; charset="utf-8"' + CRLF
+            + b"MIME-Version: 1.0" + CRLF
+            + b"Content-Transfer-Encoding: base64" + CRLF + CRLF
+        )
+        self._tail = b"".join(CRLF + delimiter + _part_bytes(part) for part in parts) \
+            + CRLF + b"--" + self.boundary.encode('ascii') + b"--" + CRLF
+
+    def render(self, to_email: str, subject: str, body: str,
+               headers: Sequence[Tuple[str, str]] = ()) -> bytes:
+        """Message complet en octets (CRLF); ``headers`` s'ajoutent après ``Subject``"""
+        chunks = [self._head, encode_header('To', to_email), encode_header('Subject', subject)]
+        chunks.extend(encode_header(name, value) for name, value in headers)
+        chunks.append(self._text_part)
+        chunks.append(encode_body(body))
+        chunks.append(self._tail)
+        return b"".join(chunks)
+
+
+class MessageFactory:
+    """Gabarits par expéditeur, reconstruits seulement quand les pièces jointes changent.
+
+    Les parties MIME viennent du registre des pièces jointes, qui renvoie le
+    même objet tant que le fichier n'a pas changé: l'identité des parties
+    suffit à savoir si le gabarit est encore valable.
+    """
+
+    def __init__(self):
+        self._templates: Dict[str, Tuple[Tuple[Message, ...], MessageTemplate]] = {}
+        self._lock = threading.Lock()
+        self.builds = 0
+
+    def template(self, from_header: str, parts: Sequence[Message]) -> MessageTemplate:
+        parts = tuple(parts)
+        with self._lock:
+            cached = self._templates.get(from_header)
+            if cached is not None and len(cached[0]) == len(parts) \
+                    and all(a is b for a, b in zip(cached[0], parts)):
+                return cached[1]
+        template = MessageTemplate(from_header, parts)
+        with self._lock:
+            self._templates[from_header] = (parts, template)
+            self.builds += 1
+        logger.debug(f"🧩 Gabarit MIME préparé pour {from_header} ({len(parts)} pièce(s) jointe(s))")
+        return template
+
+    def stats(self) -> Dict:
+        return {'templates': len(self._templates), 'builds': self.builds}
+
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Métriques de campagne: durées par étage, compteurs, jauges, et point d'exposition Prometheus
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Bornes (secondes) des histogrammes de durée: de l'appel local à l'appel LLM lent
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Échantillon (nom, type, aide, étiquettes, valeur) produit par un collecteur
+Sample = Tuple[str, str, str, Dict[str, str], float]
+
+
+def percentile(values: Sequence[float], p: float) -> float:
+    """Percentile par rang le plus proche (0 si aucune valeur)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    escaped = (f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for k, v in sorted(labels.items()))
+    return "{" + ",".join(escaped) + "}"
+
+
+class Histogram:
+    """Histogramme cumulatif à la Prometheus, plus un échantillon borné pour les percentiles"""
+
+    def __init__(self, buckets: Sequence[float] = DURATION_BUCKETS, sample_size: int = 10000):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.sample = deque(maxlen=sample_size)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        self.sample.append(value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def summary(self) -> Dict:
+        sample = list(self.sample)
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 4),
+            'p50': round(percentile(sample, 50), 4),
+            'p95': round(percentile(sample, 95), 4),
+            'p99': round(percentile(sample, 99), 4)
+        }
+
+
+class MetricsRegistry:
+    """Compteurs, histogrammes et jauges d'un processus.
+
+    Les ``span`` mesurent la durée d'un étage (``stage_duration_seconds``).
+    Les statistiques déjà tenues ailleurs (réessais, caches, files) ne sont
+    pas dupliquées: des collecteurs les lisent au moment de l'export.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Tuple, float]] = {}
+        self._histograms: Dict[str, Dict[Tuple, Histogram]] = {}
+        self._help: Dict[str, str] = {}
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+
+    def describe(self, name: str, help_text: str):
+        self._help[name] = help_text
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        """Mesure la durée du bloc dans ``stage_duration_seconds{stage=...}`` (même en cas d'erreur)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('stage_duration_seconds', time.perf_counter() - started, stage=stage)
+
+    def register_collector(self, collector: Callable[[], Iterable[Sample]]):
+        self._collectors.append(collector)
+
+    def _collect(self) -> List[Sample]:
+        samples: List[Sample] = []
+        for collector in self._collectors:
+            try:
+                samples.extend(collector())
+            except Exception as e:
+                logger.debug(f"Collecteur de métriques en échec: {e}")
+        return samples
+
+    def render(self) -> str:
+        """Format texte d'exposition Prometheus"""
+        lines: List[str] = []
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {
+                name: {key: (h.buckets, list(h.counts), h.count, h.sum) for key, h in series.items()}
+                for name, series in self._histograms.items()
+            }
+        for name, series in sorted(counters.items()):
+            lines.append(f"# HELP {name} {self._help.get(name, name)}")
+            lines.append(f"# TYPE {name} counter")
+            for key, value in series.items():
+                lines.append(f"{name}{_labels(dict(key))} {value}")
+        for name, series in sorted(histograms.items()):
+            lines.append(f"# HELP {name} {self._help.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, (buckets, counts, count, total) in series.items():
+                labels = dict(key)
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_labels({**labels, 'le': bound})} {cumulative}")
+                lines.append(f"{name}_bucket{_labels({**labels, 'le': '+Inf'})} {count}")
+                lines.append(f"{name}_sum{_labels(labels)} {total}")
+                lines.append(f"{name}_count{_labels(labels)} {count}")
+        described = set()
+        # Regroupés par nom, comme l'exige le format d'exposition
+        for name, kind, help_text, labels, value in sorted(self._collect(), key=lambda sample: sample[0]):
+            if name not in described:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                described.add(name)
+            lines.append(f"{name}{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict:
+        """Vue JSON pour le rapport: percentiles des étapes, compteurs, valeurs collectées"""
+        with self._lock:
+            spans = {
+                dict(key).get('stage', ''): histogram.summary()
+                for key, histogram in self._histograms.get('stage_duration_seconds', {}).items()
+            }
+            counters = {
+                name + _labels(dict(key)): value
+                for name, series in self._counters.items() for key, value in series.items()
+            }
+        collected = {name + _labels(labels): value for name, _, _, labels, value in self._collect()}
+        return {'spans': spans, 'counters': counters, 'collected': collected}
+
+
+class MetricsServer:
+    """Expose ``/metrics`` (format Prometheus) sur un port local, dans un thread"""
+
+    def __init__(self, registry: MetricsRegistry, host: str = "127.0.0.1", port: int = 9108):
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split('?', 1)[0] != "/metrics":
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                body = registry.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="metrics", daemon=True).start()
+        logger.info(f"📈 Métriques exposées sur http://{host}:{self.port}/metrics")
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class LogSampler:
+    """Niveau de log des messages répétés par contact: INFO une fois sur ``every``, DEBUG sinon"""
+
+    def __init__(self, every: int = 100):
+        self.every = max(1, every)
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def level(self, key: str) -> int:
+        with self._lock:
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+        return logging.INFO if count % self.every == 0 else logging.DEBUG
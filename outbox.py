@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Outbox sur disque: messages MIME entièrement rendus à l'avance, envoyés plus tard tels quels
+"""
+
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+from collections import Counter
+from email.message import Message
+from email.utils import formataddr
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+SENDING = 'sending'
+SENT = 'sent'
+FAILED = 'failed'
+
+# Emplacement d'une pièce jointe partagée dans un message stocké
+PART_MARKER = b"\x00outbox-part:%s\x00"
+
+# Champs d'un message renvoyés par ``pending`` et ``message`` (sans le contenu)
+MESSAGE_COLUMNS = ('id', 'email', 'company', 'subject', 'body_length', 'message_id', 'account', 'timezone')
+
+
+def replace_from(data: bytes, name: str, address: str) -> bytes:
+    """Remplace l'en-tête ``From`` d'un message rendu (fins de ligne CRLF)"""
+    headers_end = data.find(b"\r\n\r\n")
+    if data.startswith(b"From: "):
+        start = 0
+    else:
+        start = data.find(b"\r\nFrom: ", 0, headers_end) + 2
+        if start < 2:
+            return data
+    end = data.find(b"\r\n", start) + 2
+    # Lignes de continuation d'un en-tête replié
+    while data[end:end + 1] in (b" ", b"\t"):
+        end = data.find(b"\r\n", end) + 2
+    value = formataddr((name, address), charset='utf-8')
+    return data[:start] + b"From: " + value.encode('ascii') + b"\r\n" + data[end:]
+
+
+class Outbox:
+    """Messages prêts à partir, regroupés par lot (``batch``).
+
+    Chaque message est stocké sous sa forme finale (``as_bytes``),
+    compressée. Les pièces jointes communes à tous les messages (le CV)
+    sont extraites et stockées une seule fois: le message ne garde qu'un
+    marqueur, remplacé par les octets base64 au moment de l'envoi. L'envoi
+    ne fait donc plus aucun appel externe hormis SMTP.
+    """
+
+    def __init__(self, path: str = "outbox.sqlite", compress: bool = True):
+        self.path = path
+        self.compress = compress
+        self._lock = threading.Lock()
+        self._parts: Dict[str, bytes] = {}
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS batches (
+                batch TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                batch TEXT NOT NULL,
+                email TEXT NOT NULL,
+                company TEXT NOT NULL,
+                subject TEXT NOT NULL,
+                body_length INTEGER NOT NULL,
+                message_id TEXT,
+                account TEXT,
+                timezone TEXT,
+                data BLOB NOT NULL,
+                compressed INTEGER NOT NULL,
+                state TEXT NOT NULL,
+                error TEXT,
+                created_at REAL NOT NULL,
+                sent_at REAL,
+                UNIQUE (batch, email)
+            );
+            CREATE TABLE IF NOT EXISTS parts (
+                sha256 TEXT PRIMARY KEY,
+                data BLOB NOT NULL
+            );
+        """)
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(messages)")}
+        if 'account' not in columns:
+            # Outbox créée avant les comptes expéditeurs multiples
+            self._db.execute("ALTER TABLE messages ADD COLUMN account TEXT")
+        if 'timezone' not in columns:
+            # Outbox créée avant les fenêtres d'envoi par fuseau horaire
+            self._db.execute("ALTER TABLE messages ADD COLUMN timezone TEXT")
+        self._db.commit()
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict]) -> Optional['Outbox']:
+        """Construit l'outbox depuis la section ``outbox`` (None si désactivée)"""
+        config = config or {}
+        if not config.get('enabled', True):
+            return None
+        return cls(config.get('path', "outbox.sqlite"), config.get('compress', True))
+
+    def open_batch(self, batch: str, source: str):
+        """Déclare un lot (idempotent: un lot repréparé garde ses messages déjà envoyés)"""
+        with self._lock:
+            self._db.execute(
+                "INSERT OR IGNORE INTO batches (batch, source, created_at) VALUES (?, ?, ?)",
+                (batch, str(Path(source).resolve()), time.time())
+            )
+            self._db.commit()
+
+    def latest_batch(self) -> Optional[str]:
+        """Dernier lot préparé ayant encore des messages en attente"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT b.batch FROM batches b WHERE EXISTS "
+                "(SELECT 1 FROM messages m WHERE m.batch = b.batch AND m.state = ?) "
+                "ORDER BY b.created_at DESC LIMIT 1",
+                (PENDING,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def source(self, batch: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT source FROM batches WHERE batch = ?", (batch,)).fetchone()
+        return row[0] if row else None
+
+    def add(self, batch: str, email: str, company: str, subject: str, body_length: int,
+            msg: Union[Message, bytes], shared_parts: List[Message], message_id: Optional[str] = None,
+            account: Optional[str] = None, timezone: Optional[str] = None):
+        """Stocke un message (déjà rendu en octets CRLF, ou rendu ici); ``shared_parts``
+        sont les pièces jointes dédupliquées, ``account`` le compte expéditeur attribué
+        au contact, ``timezone`` son fuseau s'il est connu"""
+        # Fins de ligne CRLF: smtplib transmet les octets tels quels
+        data = msg if isinstance(msg, bytes) else msg.as_bytes(policy=msg.policy.clone(linesep="\r\n"))
+        new_parts = []
+        for part in shared_parts:
+            payload = part.get_payload().encode('ascii').rstrip(b"\n").replace(b"\n", b"\r\n")
+            if not payload or payload not in data:
+                continue
+            digest = hashlib.sha256(payload).hexdigest()
+            data = data.replace(payload, PART_MARKER % digest.encode('ascii'), 1)
+            if digest not in self._parts:
+                new_parts.append((digest, payload))
+        stored = zlib.compress(data) if self.compress else data
+
+        with self._lock:
+            with self._db:
+                for digest, payload in new_parts:
+                    self._db.execute("INSERT OR IGNORE INTO parts (sha256, data) VALUES (?, ?)",
+                                     (digest, payload))
+                    self._parts[digest] = payload
+                # Un message déjà parti (ou en cours d'envoi) n'est jamais remplacé
+                self._db.execute(
+                    "INSERT INTO messages (batch, email, company, subject, body_length, message_id, "
+                    "account, timezone, data, compressed, state, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(batch, email) DO UPDATE SET company = excluded.company, "
+                    "subject = excluded.subject, body_length = excluded.body_length, "
+                    "message_id = excluded.message_id, account = excluded.account, "
+                    "timezone = excluded.timezone, data = excluded.data, "
+                    "compressed = excluded.compressed, created_at = excluded.created_at "
+                    "WHERE messages.state = ?",
+                    (batch, email, company, subject, body_length, message_id, account, timezone,
+                     stored, int(self.compress), PENDING, time.time(), PENDING)
+                )
+
+    def pending(self, batch: str, page_size: int = 500) -> Iterator[Dict]:
+        """Messages en attente du lot, lus par pages (sans leur contenu)"""
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self._db.execute(
+                    f"SELECT {', '.join(MESSAGE_COLUMNS)} FROM messages "
+                    "WHERE batch = ? AND state = ? AND id > ? ORDER BY id LIMIT ?",
+                    (batch, PENDING, last_id, page_size)
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield dict(zip(MESSAGE_COLUMNS, row))
+            last_id = rows[-1][0]
+
+    def message(self, message: int) -> Optional[Dict]:
+        """Description d'un message (sans son contenu), avec son lot et son état"""
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {', '.join(MESSAGE_COLUMNS)}, batch, state FROM messages WHERE id = ?", (message,)
+            ).fetchone()
+        return dict(zip(MESSAGE_COLUMNS + ('batch', 'state'), row)) if row else None
+
+    def render(self, message: int, sender: Optional[Tuple[str, str]] = None) -> bytes:
+        """Octets du message prêts pour ``sendmail`` (pièces jointes réinsérées).
+
+        ``sender`` (nom, adresse) remplace l'en-tête ``From`` quand le
+        message part finalement d'un autre compte que celui prévu à la
+        préparation.
+        """
+        with self._lock:
+            data, compressed = self._db.execute(
+                "SELECT data, compressed FROM messages WHERE id = ?", (message,)
+            ).fetchone()
+        data = zlib.decompress(data) if compressed else data
+        start = data.find(b"\x00outbox-part:")
+        while start != -1:
+            end = data.index(b"\x00", start + 1)
+            digest = data[start + len(b"\x00outbox-part:"):end].decode('ascii')
+            data = data[:start] + self._part(digest) + data[end + 1:]
+            start = data.find(b"\x00outbox-part:", start)
+        if sender is not None:
+            data = replace_from(data, *sender)
+        return data
+
+    def _part(self, digest: str) -> bytes:
+        payload = self._parts.get(digest)
+        if payload is None:
+            with self._lock:
+                payload = self._db.execute(
+                    "SELECT data FROM parts WHERE sha256 = ?", (digest,)
+                ).fetchone()[0]
+            self._parts[digest] = payload
+        return payload
+
+    def has(self, batch: str, email: str) -> bool:
+        """Vrai si le lot contient déjà un message pour ce contact"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT 1 FROM messages WHERE batch = ? AND email = ?", (batch, email)
+            ).fetchone()
+        return row is not None
+
+    def claim(self, message: int) -> bool:
+        """Passe un message en attente à ``sending``; faux s'il a déjà été pris (ou envoyé)"""
+        with self._lock:
+            claimed = self._db.execute(
+                "UPDATE messages SET state = ? WHERE id = ? AND state = ?", (SENDING, message, PENDING)
+            ).rowcount
+            self._db.commit()
+        return claimed == 1
+
+    def mark(self, message: int, state: str, error: Optional[str] = None):
+        with self._lock:
+            self._db.execute(
+                "UPDATE messages SET state = ?, error = ?, sent_at = ? WHERE id = ?",
+                (state, error, time.time() if state == SENT else None, message)
+            )
+            self._db.commit()
+
+    def domain_counts(self, batch: str) -> Counter:
+        """Messages en attente par domaine destinataire (estimation de la durée d'envoi)"""
+        domains: Counter = Counter()
+        for row in self.pending(batch):
+            domains[row['email'].rsplit('@', 1)[-1].lower()] += 1
+        return domains
+
+    def stats(self, batch: Optional[str] = None) -> Dict:
+        with self._lock:
+            query = "SELECT state, COUNT(*), SUM(LENGTH(data)) FROM messages"
+            params: tuple = ()
+            if batch:
+                query += " WHERE batch = ?"
+                params = (batch,)
+            rows = self._db.execute(query + " GROUP BY state", params).fetchall()
+            shared = self._db.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM parts").fetchone()
+        return {
+            'batch': batch,
+            'states': {state: count for state, count, _ in rows},
+            'stored_bytes': sum(size or 0 for _, _, size in rows),
+            'shared_parts': shared[0],
+            'shared_parts_bytes': shared[1]
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pipeline de campagne par étages: recherche → génération → parsing → envoi
+"""
+
+import heapq
+import itertools
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from metrics import percentile
+
+logger = logging.getLogger(__name__)
+
+# Marqueur de fin de flux transmis d'un étage à l'autre
+_END = object()
+
+
+class Deferred(Exception):
+    """Levée par la fonction d'un étage à ``throttle`` qui ne peut pas aboutir tout de suite
+    (un compte de bascule sans quota par exemple): l'élément retourne dans sa file et repasse
+    par ``throttle`` dans ``delay`` secondes au plus tôt, sans bloquer le worker"""
+
+    def __init__(self, delay: float):
+        super().__init__(f"différé de {delay:.1f}s")
+        self.delay = delay
+
+
+class Stage:
+    """Un étage du pipeline: une fonction appliquée par N workers à chaque élément.
+
+    La fonction reçoit l'élément et renvoie l'élément (éventuellement enrichi)
+    à transmettre à l'étage suivant, ou ``None`` pour l'arrêter là.
+
+    Avec ``batch_size`` > 1, la fonction reçoit une liste d'au plus
+    ``batch_size`` éléments (regroupés pendant au plus ``batch_wait``
+    secondes) et renvoie la liste des résultats correspondants.
+
+    ``throttle(élément)`` (étages sans lots) renvoie 0 si l'élément peut être
+    traité tout de suite, sinon le délai en secondes avant de réessayer.
+    Les éléments sont répartis en files par ``throttle_key(élément)`` (le
+    domaine du destinataire par exemple): une file bloquée est mise de côté
+    jusqu'à son prochain essai et le worker passe aux autres, si bien qu'un
+    quota épuisé ne bloque que sa file, dont l'ordre est conservé. Au-delà
+    de ``max_deferred`` éléments en attente, l'étage cesse de lire son
+    entrée (contre-pression). La fonction peut aussi lever ``Deferred``:
+    l'élément reprend place dans sa file, derrière ceux qui y attendent.
+    """
+
+    def __init__(self, name: str, func: Callable[[Any], Any], workers: int = 1,
+                 batch_size: int = 1, batch_wait: float = 0.05,
+                 throttle: Optional[Callable[[Any], float]] = None,
+                 throttle_key: Optional[Callable[[Any], Any]] = None, max_deferred: int = 1000):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait
+        self.throttle = throttle
+        self.throttle_key = throttle_key
+        self.max_deferred = max(1, max_deferred)
+        self.deferrals = 0
+        # Files en attente par clé, et échéancier de leurs prochains essais (instant, ordre, clé)
+        self._waiting: Dict[Any, deque] = {}
+        self._retries: List = []
+        self._deferred = 0
+        self._deferred_lock = threading.Lock()
+        self._order = itertools.count()
+        self.processed = 0
+        self.errors = 0
+        # Durées de traitement des derniers éléments (s), pour les percentiles
+        self.latencies = deque(maxlen=10000)
+
+
+class CampaignPipeline:
+    """Exécute des étages en parallèle, reliés par des files bornées.
+
+    Chaque étage a son propre nombre de workers: le débit global est donc
+    fixé par l'étage le plus lent et non par la somme des latences. Les
+    files bornées (``queue_size``) assurent la contre-pression: la lecture
+    des contacts se met en pause tant que les étages en aval sont pleins,
+    ce qui garde la mémoire bornée quelle que soit la taille du CSV.
+    """
+
+    def __init__(self, stages: List[Stage], queue_size: int = 32,
+                 on_error: Optional[Callable[[Stage, Any, Exception], None]] = None):
+        if not stages:
+            raise ValueError("Le pipeline doit contenir au moins un étage")
+        self.stages = stages
+        self.queue_size = max(1, queue_size)
+        self.on_error = on_error
+        self._queues: List[queue.Queue] = []
+        self._lock = threading.Lock()
+
+    def queue_depths(self) -> Dict[str, int]:
+        """Nombre d'éléments en attente devant chaque étage (mis de côté compris)"""
+        return {stage.name: q.qsize() + stage._deferred for stage, q in zip(self.stages, self._queues)}
+
+    def stats(self) -> Dict[str, Dict]:
+        return {
+            stage.name: {
+                'workers': stage.workers,
+                'batch_size': stage.batch_size,
+                'processed': stage.processed,
+                'errors': stage.errors,
+                'deferrals': stage.deferrals,
+                'latency_p50': round(percentile(stage.latencies, 50), 4),
+                'latency_p95': round(percentile(stage.latencies, 95), 4),
+                'latency_p99': round(percentile(stage.latencies, 99), 4)
+            }
+            for stage in self.stages
+        }
+
+    def _worker(self, index: int, remaining: List[int]):
+        stage = self.stages[index]
+        inbox = self._queues[index]
+        outbox = self._queues[index + 1] if index + 1 < len(self.stages) else None
+
+        finished = False
+        try:
+            if stage.throttle is not None:
+                self._throttled_worker(stage, inbox, outbox)
+                finished = True
+            while not finished:
+                item = inbox.get()
+                if item is _END:
+                    break
+                if stage.batch_size == 1:
+                    self._process(stage, item, outbox)
+                    continue
+
+                batch = [item]
+                while len(batch) < stage.batch_size:
+                    try:
+                        item = inbox.get(timeout=stage.batch_wait)
+                    except queue.Empty:
+                        break
+                    if item is _END:
+                        finished = True
+                        break
+                    batch.append(item)
+                self._process_batch(stage, batch, outbox)
+        finally:
+            # Le dernier worker de l'étage propage la fin de flux à l'étage suivant,
+            # même si ce worker s'est arrêté sur une erreur inattendue
+            with self._lock:
+                remaining[index] -= 1
+                last = remaining[index] == 0
+            if last and outbox is not None:
+                for _ in range(self.stages[index + 1].workers):
+                    outbox.put(_END)
+
+    def _throttled_worker(self, stage: Stage, inbox: queue.Queue, outbox: Optional[queue.Queue]):
+        """Boucle d'un étage à ``throttle``: essaie la tête d'une file mise de côté dès
+        qu'elle est prête, sinon l'élément suivant de l'entrée, sans dormir sur un élément bloqué"""
+        ended = False
+        while True:
+            key = item = None
+            with stage._deferred_lock:
+                now = time.monotonic()
+                if stage._retries and stage._retries[0][0] <= now:
+                    key = heapq.heappop(stage._retries)[2]
+                    item = stage._waiting[key][0]
+                    wait = None
+                else:
+                    full = stage._deferred >= stage.max_deferred
+                    wait = stage._retries[0][0] - now if stage._retries else None
+            if key is None:
+                if ended or full:
+                    if wait is None:
+                        if ended and not stage._deferred:
+                            return
+                        # Files tenues par un autre worker: on attend qu'il les relâche
+                        time.sleep(0.01)
+                        continue
+                    time.sleep(min(wait, 1.0))
+                    continue
+                try:
+                    item = inbox.get(timeout=min(wait, 1.0) if wait is not None else None)
+                except queue.Empty:
+                    continue
+                if item is _END:
+                    ended = True
+                    continue
+                key = stage.throttle_key(item) if stage.throttle_key else object()
+                with stage._deferred_lock:
+                    if key in stage._waiting:
+                        # Sa file attend déjà: il passera après les éléments arrivés avant lui
+                        stage._waiting[key].append(item)
+                        stage._deferred += 1
+                        continue
+                    stage._waiting[key] = deque([item])
+                    stage._deferred += 1
+
+            try:
+                delay = stage.throttle(item)
+            except Exception as e:
+                self._release(stage, key)
+                with self._lock:
+                    stage.errors += 1
+                logger.error(f"💥 Erreur étage '{stage.name}': {e}")
+                self._report_error(stage, item, e)
+                continue
+            if delay > 0:
+                with stage._deferred_lock:
+                    heapq.heappush(stage._retries, (time.monotonic() + delay, next(stage._order), key))
+                    stage.deferrals += 1
+                continue
+            self._release(stage, key)
+            self._process(stage, item, outbox)
+
+    def _release(self, stage: Stage, key: Any):
+        """Retire la tête de la file ``key``; l'élément suivant sera essayé tout de suite"""
+        with stage._deferred_lock:
+            waiting = stage._waiting[key]
+            waiting.popleft()
+            stage._deferred -= 1
+            if waiting:
+                heapq.heappush(stage._retries, (time.monotonic(), next(stage._order), key))
+            else:
+                del stage._waiting[key]
+
+    def _defer(self, stage: Stage, item: Any, delay: float):
+        """Remet ``item`` (refusé par la fonction de l'étage) dans sa file, réessayé dans ``delay`` s"""
+        key = stage.throttle_key(item) if stage.throttle_key else object()
+        with stage._deferred_lock:
+            stage._deferred += 1
+            stage.deferrals += 1
+            if key in stage._waiting:
+                stage._waiting[key].append(item)
+                return
+            stage._waiting[key] = deque([item])
+            heapq.heappush(stage._retries, (time.monotonic() + delay, next(stage._order), key))
+
+    def _report_error(self, stage: Stage, item: Any, error: Exception):
+        """Appelle ``on_error``; une erreur du rappel lui-même est journalisée, jamais propagée"""
+        if self.on_error is None:
+            return
+        try:
+            self.on_error(stage, item, error)
+        except Exception as e:
+            logger.exception(f"💥 Erreur dans le traitement d'erreur de l'étage '{stage.name}': {e}")
+
+    def _process(self, stage: Stage, item: Any, outbox: Optional[queue.Queue]):
+        started = time.perf_counter()
+        try:
+            result = stage.func(item)
+        except Exception as e:
+            if isinstance(e, Deferred) and stage.throttle is not None:
+                self._defer(stage, item, e.delay)
+                return
+            with self._lock:
+                stage.errors += 1
+            logger.error(f"💥 Erreur étage '{stage.name}': {e}")
+            self._report_error(stage, item, e)
+            return
+        with self._lock:
+            stage.processed += 1
+            stage.latencies.append(time.perf_counter() - started)
+        if result is not None and outbox is not None:
+            outbox.put(result)
+
+    def _process_batch(self, stage: Stage, batch: List[Any], outbox: Optional[queue.Queue]):
+        started = time.perf_counter()
+        try:
+            results = stage.func(batch)
+        except Exception as e:
+            with self._lock:
+                stage.errors += len(batch)
+            logger.error(f"💥 Erreur étage '{stage.name}' (lot de {len(batch)}): {e}")
+            for item in batch:
+                self._report_error(stage, item, e)
+            return
+        with self._lock:
+            stage.processed += len(batch)
+            # Chaque élément du lot a attendu toute la durée du lot
+            stage.latencies.extend([time.perf_counter() - started] * len(batch))
+        if outbox is not None:
+            for result in results:
+                if result is not None:
+                    outbox.put(result)
+
+    def run(self, items: Iterable[Any]) -> int:
+        """Fait passer tous les éléments dans le pipeline; renvoie le nombre d'éléments injectés"""
+        self._queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        remaining = [stage.workers for stage in self.stages]
+
+        threads = []
+        for index, stage in enumerate(self.stages):
+            for n in range(stage.workers):
+                thread = threading.Thread(
+                    target=self._worker, args=(index, remaining),
+                    name=f"{stage.name}-{n}", daemon=True
+                )
+                thread.start()
+                threads.append(thread)
+
+        count = 0
+        try:
+            for item in items:
+                # Bloque quand le premier étage est saturé (contre-pression)
+                self._queues[0].put(item)
+                count += 1
+        finally:
+            for _ in range(self.stages[0].workers):
+                self._queues[0].put(_END)
+            for thread in threads:
+                thread.join()
+
+        return count
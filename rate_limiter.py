@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Planificateur de cadence d'envoi par seaux à jetons (global, domaine, compte SMTP)
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Seau à jetons: ``rate`` jetons par seconde, jusqu'à ``capacity`` en rafale"""
+
+    def __init__(self, rate: float, capacity: float, tokens: Optional[float] = None,
+                 updated: Optional[float] = None):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity if tokens is None else min(tokens, self.capacity)
+        # Horloge murale pour que l'état reste valable après un redémarrage
+        self.updated = time.time() if updated is None else updated
+
+    @classmethod
+    def from_rule(cls, rule: Dict) -> 'TokenBucket':
+        """Construit un seau depuis une règle ``{"rate": 2, "per": 60, "burst": 2}``"""
+        rate = rule['rate'] / rule.get('per', 1)
+        return cls(rate, rule.get('burst', rule['rate']))
+
+    def refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def time_until(self, now: float, n: float = 1) -> float:
+        """Secondes à attendre avant de disposer de ``n`` jetons"""
+        self.refill(now)
+        if self.tokens >= n:
+            return 0.0
+        if self.rate <= 0:
+            return float('inf')
+        return (n - self.tokens) / self.rate
+
+    def consume(self, now: float, n: float = 1):
+        self.refill(now)
+        self.tokens -= n
+
+    def time_for(self, count: int) -> float:
+        """Durée estimée pour écouler ``count`` envois depuis l'état courant"""
+        backlog = count - self.tokens
+        if backlog <= 0:
+            return 0.0
+        return backlog / self.rate if self.rate > 0 else float('inf')
+
+
+class RateScheduler:
+    """Décide quand chaque envoi peut partir, au plus vite sans dépasser les quotas.
+
+    Trois familles de seaux sont consultées pour chaque email: ``global``,
+    ``domain`` (domaine du destinataire) et ``account`` (compte SMTP). Chaque
+    famille a une règle par défaut, surchargeable par clé via ``domains`` et
+    ``accounts``. L'état des seaux est sauvegardé dans ``state_file`` pour
+    survivre aux redémarrages.
+    """
+
+    KINDS = ('global', 'domain', 'account')
+
+    def __init__(self, rules: Dict, state_path: Optional[str] = None,
+                 save_interval: float = 5.0):
+        self.rules = rules
+        self.state_path = Path(state_path) if state_path else None
+        self.save_interval = save_interval
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+        self._last_save = 0.0
+
+        self.acquired = 0
+        self.waits = 0
+        self.total_wait = 0.0
+
+        self._load_state()
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict], default_interval: float = 0) -> 'RateScheduler':
+        """Construit le planificateur depuis la section ``rate_limits`` de config.json.
+
+        Sans configuration, un seau global d'un envoi toutes les
+        ``default_interval`` secondes reproduit l'ancien délai fixe.
+        """
+        config = dict(config or {})
+        state_path = config.pop('state_file', None)
+        if 'global' not in config and default_interval > 0:
+            config['global'] = {'rate': 1, 'per': default_interval, 'burst': 1}
+        return cls(config, state_path)
+
+    def _rule_for(self, kind: str, key: str) -> Optional[Dict]:
+        overrides = self.rules.get(f"{kind}s", {})
+        if key in overrides:
+            return overrides[key]
+        return self.rules.get(kind)
+
+    def _bucket(self, kind: str, key: str) -> Optional[TokenBucket]:
+        name = kind if kind == 'global' else f"{kind}:{key}"
+        bucket = self._buckets.get(name)
+        if bucket is None:
+            rule = self._rule_for(kind, key)
+            if rule is None:
+                return None
+            bucket = self._buckets[name] = TokenBucket.from_rule(rule)
+        return bucket
+
+    def _buckets_for(self, recipient: str, account: Optional[str]) -> List[TokenBucket]:
+        domain = recipient.rsplit('@', 1)[-1].lower()
+        keys = {'global': 'global', 'domain': domain, 'account': account or ''}
+        buckets = []
+        for kind in self.KINDS:
+            if kind == 'account' and not account:
+                continue
+            bucket = self._bucket(kind, keys[kind])
+            if bucket is not None:
+                buckets.append(bucket)
+        return buckets
+
+    def try_acquire(self, recipient: str, account: Optional[str] = None) -> float:
+        """Consomme un jeton dans chaque seau concerné si possible.
+
+        Renvoie 0 si l'envoi est autorisé, sinon le nombre de secondes à
+        attendre avant de réessayer (rien n'est consommé dans ce cas).
+        """
+        with self._lock:
+            now = time.time()
+            buckets = self._buckets_for(recipient, account)
+            wait = max((b.time_until(now) for b in buckets), default=0.0)
+            if wait > 0:
+                return wait
+            for bucket in buckets:
+                bucket.consume(now)
+            self.acquired += 1
+            self._maybe_save()
+            return 0.0
+
+    def record_wait(self, waited: float):
+        if waited > 0.001:
+            with self._lock:
+                self.waits += 1
+                self.total_wait += waited
+
+    def acquire(self, recipient: str, account: Optional[str] = None,
+                timeout: Optional[float] = None) -> float:
+        """Bloque jusqu'à ce que tous les seaux concernés autorisent l'envoi.
+
+        Renvoie le temps d'attente en secondes. Lève ``TimeoutError`` si
+        l'attente dépasserait ``timeout``.
+        """
+        started = time.monotonic()
+        while True:
+            wait = self.try_acquire(recipient, account)
+            if wait <= 0:
+                waited = time.monotonic() - started
+                self.record_wait(waited)
+                return waited
+            if timeout is not None and time.monotonic() - started + wait > timeout:
+                raise TimeoutError(f"Quota d'envoi atteint pour {recipient}")
+            time.sleep(wait)
+
+    def predict_completion(self, domain_counts: Dict[str, int],
+                           account: Optional[str] = None) -> datetime:
+        """Heure de fin estimée pour ``domain_counts`` envois (nombre par domaine destinataire)"""
+        domains = {d.lower(): n for d, n in domain_counts.items()}
+        total = sum(domains.values())
+        with self._lock:
+            now = time.time()
+            estimates = [0.0]
+            for kind, key, count in (
+                [('global', 'global', total)]
+                + [('domain', d, n) for d, n in domains.items()]
+                + ([('account', account, total)] if account else [])
+            ):
+                bucket = self._bucket(kind, key)
+                if bucket is not None:
+                    bucket.refill(now)
+                    estimates.append(bucket.time_for(count))
+        seconds = max(estimates)
+        if seconds == float('inf'):
+            return datetime.max
+        return datetime.now() + timedelta(seconds=seconds)
+
+    def stats(self) -> Dict:
+        return {
+            'acquired': self.acquired,
+            'waits': self.waits,
+            'total_wait_seconds': round(self.total_wait, 3),
+            'buckets': {
+                name: {'tokens': round(b.tokens, 3), 'rate_per_min': round(b.rate * 60, 3),
+                       'capacity': b.capacity}
+                for name, b in self._buckets.items()
+            }
+        }
+
+    def _load_state(self):
+        if not self.state_path or not self.state_path.exists():
+            return
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except Exception as e:
+            logger.warning(f"État des quotas illisible ({self.state_path}): {e}")
+            return
+        for name, saved in state.get('buckets', {}).items():
+            kind, _, key = name.partition(':')
+            bucket = self._bucket(kind, key or 'global')
+            if bucket is not None:
+                bucket.tokens = min(saved['tokens'], bucket.capacity)
+                bucket.updated = saved['updated']
+        logger.info(f"État des quotas restauré depuis {self.state_path}")
+
+    def _maybe_save(self):
+        if self.state_path and time.monotonic() - self._last_save >= self.save_interval:
+            self._write_state()
+
+    def _write_state(self):
+        state = {
+            'buckets': {
+                name: {'tokens': b.tokens, 'updated': b.updated}
+                for name, b in self._buckets.items()
+            }
+        }
+        tmp_path = self.state_path.with_suffix(self.state_path.suffix + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+        self._last_save = time.monotonic()
+
+    def save(self):
+        """Sauvegarde immédiate de l'état des seaux"""
+        if self.state_path:
+            with self._lock:
+                self._write_state()
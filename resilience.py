@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Résilience des appels externes: réessais avec backoff, disjoncteurs et file des lettres mortes
+"""
+
+import asyncio
+import json
+import logging
+import random
+import smtplib
+import socket
+import threading
+import time
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class TransientError(Exception):
+    """Erreur passagère (429, 5xx, coupure réseau): l'appel peut être réessayé.
+
+    ``retry_after`` reprend l'en-tête ``Retry-After`` du service s'il y en a un.
+    """
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Valeur de ``Retry-After`` en secondes (nombre de secondes ou date HTTP)"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def http_error(service: str, status: int, retry_after: Optional[str] = None) -> Exception:
+    """Exception adaptée à un statut HTTP en échec: passagère pour 408, 429 et 5xx"""
+    message = f"{service} HTTP {status}"
+    if status in (408, 429) or status >= 500:
+        return TransientError(message, parse_retry_after(retry_after))
+    return RuntimeError(message)
+
+
+def is_transient(exc: BaseException) -> bool:
+    """Vrai si l'échec vaut la peine d'être réessayé"""
+    if isinstance(exc, TransientError):
+        return True
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout,
+                        ConnectionError, TimeoutError, socket.timeout)):
+        return True
+    if isinstance(exc, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(exc, smtplib.SMTPRecipientsRefused):
+        # Réessai seulement si tous les refus sont temporaires (4xx)
+        return bool(exc.recipients) and all(
+            400 <= code < 500 for code, _ in exc.recipients.values()
+        )
+    if isinstance(exc, smtplib.SMTPResponseException):
+        return 400 <= exc.smtp_code < 500
+    return False
+
+
+class RetryPolicy:
+    """Backoff exponentiel avec jitter complet, borné par ``max_delay``.
+
+    Un ``Retry-After`` fourni par le service est respecté (jusqu'à
+    ``max_retry_after``) même s'il dépasse le backoff calculé.
+    """
+
+    def __init__(self, max_attempts: int = 4, base_delay: float = 1.0,
+                 max_delay: float = 60.0, max_retry_after: float = 300.0):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Attente avant la tentative ``attempt + 1`` (``attempt`` commence à 1)"""
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if retry_after is not None:
+            return max(backoff, min(retry_after, self.max_retry_after))
+        return backoff
+
+
+class CircuitBreaker:
+    """Disjoncteur d'un service externe.
+
+    Après ``failure_threshold`` échecs passagers consécutifs, le circuit
+    s'ouvre: les appelants attendent ``reset_timeout`` secondes au lieu
+    d'insister, ce qui met l'étage correspondant en pause. Ensuite une
+    seule requête d'essai passe (demi-ouvert); son succès referme le
+    circuit, son échec le rouvre. Un ``Retry-After`` ouvre le circuit pour
+    la durée demandée.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_until = 0.0
+        self.opens = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def wait_time(self) -> float:
+        """0 si un appel peut partir maintenant (et le réserve en demi-ouvert), sinon l'attente"""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == CLOSED:
+                return 0.0
+            if self.state == OPEN:
+                if now < self.opened_until:
+                    return self.opened_until - now
+                self.state = HALF_OPEN
+                self._probing = False
+            if self._probing:
+                # Une requête d'essai est déjà en cours
+                return 0.2
+            self._probing = True
+            return 0.0
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info(f"🟢 Circuit '{self.name}' refermé")
+            self.state = CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self, retry_after: Optional[float] = None):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if retry_after is not None or self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                pause = self.reset_timeout if retry_after is None else retry_after
+                until = time.monotonic() + pause
+                if self.state != OPEN or until > self.opened_until:
+                    self.opened_until = until
+                if self.state != OPEN:
+                    self.opens += 1
+                    logger.warning(f"🔴 Circuit '{self.name}' ouvert pour {pause:.1f}s")
+                self.state = OPEN
+
+    def stats(self) -> Dict:
+        return {
+            'state': self.state,
+            'consecutive_failures': self.failures,
+            'opens': self.opens
+        }
+
+
+class Endpoint:
+    """Politique de réessai, disjoncteur et compteurs d'un service (serper, openrouter, smtp)"""
+
+    def __init__(self, name: str, policy: RetryPolicy, breaker: CircuitBreaker):
+        self.name = name
+        self.policy = policy
+        self.breaker = breaker
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def _count(self, field: str):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def call(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Appelle ``func`` avec réessais; lève la dernière erreur une fois les essais épuisés"""
+        self._count('calls')
+        attempt = 1
+        while True:
+            wait = self.breaker.wait_time()
+            while wait > 0:
+                time.sleep(wait)
+                wait = self.breaker.wait_time()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                delay = self._after_failure(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            return result
+
+    async def acall(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Équivalent asyncio de ``call`` (``func`` renvoie une coroutine)"""
+        self._count('calls')
+        attempt = 1
+        while True:
+            wait = self.breaker.wait_time()
+            while wait > 0:
+                await asyncio.sleep(wait)
+                wait = self.breaker.wait_time()
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                delay = self._after_failure(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            return result
+
+    def _after_failure(self, exc: Exception, attempt: int) -> Optional[float]:
+        """Délai avant le prochain essai, ou None si l'erreur doit être propagée"""
+        if not is_transient(exc):
+            # Erreur propre à la requête (4xx, 5xx SMTP): le service, lui, répond
+            self.breaker.record_success()
+            self._count('failures')
+            return None
+        retry_after = getattr(exc, 'retry_after', None)
+        self.breaker.record_failure(retry_after)
+        if attempt >= self.policy.max_attempts:
+            self._count('failures')
+            logger.error(f"⛔ {self.name}: abandon après {attempt} tentatives: {exc}")
+            return None
+        self._count('retries')
+        delay = self.policy.delay(attempt, retry_after)
+        logger.warning(f"🔁 {self.name}: tentative {attempt}/{self.policy.max_attempts} échouée ({exc}), "
+                       f"nouvel essai dans {delay:.1f}s")
+        return delay
+
+    def stats(self) -> Dict:
+        return {
+            'calls': self.calls,
+            'retries': self.retries,
+            'failures': self.failures,
+            'breaker': self.breaker.stats()
+        }
+
+
+class DeadLetterQueue:
+    """Contacts abandonnés après épuisement des réessais, en JSONL.
+
+    Chaque ligne garde les champs du contact (``company_name``, ``email``,
+    ``Nom_ceo``, ``Titre``) au premier niveau: le fichier peut être relu
+    tel quel comme source de contacts pour une nouvelle tentative.
+    """
+
+    def __init__(self, path: str = "dead_letter.jsonl"):
+        self.path = path
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def add(self, contact: Dict, stage: str, error: str):
+        entry = {
+            'company_name': contact.get('company_name'),
+            'email': contact.get('email'),
+            'Nom_ceo': contact.get('Nom_ceo'),
+            'Titre': contact.get('Titre'),
+            'timezone': contact.get('timezone'),
+            'stage': stage,
+            'error': error,
+            'at': datetime.now().isoformat()
+        }
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.count += 1
+
+    def stats(self) -> Dict:
+        return {'path': self.path, 'count': self.count}
+
+
+class Resilience:
+    """Points d'entrée par service et file des lettres mortes, construits depuis ``resilience``.
+
+    Un nom de la forme ``service:clé`` (par exemple ``smtp:compte@domaine``)
+    crée à la demande un point d'entrée distinct, avec son propre
+    disjoncteur, réglé comme ``service``.
+    """
+
+    ENDPOINTS = ('serper', 'openrouter', 'smtp')
+
+    def __init__(self, config: Dict, dead_letters: DeadLetterQueue):
+        self.config = config
+        self.dead_letters = dead_letters
+        self.endpoints: Dict[str, Endpoint] = {}
+        self._lock = threading.Lock()
+        for name in self.ENDPOINTS:
+            self[name]
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict]) -> 'Resilience':
+        """``retry`` et ``breaker`` donnent les valeurs par défaut, surchargées par service
+        dans ``endpoints`` (par exemple ``{"smtp": {"max_attempts": 3}}``)"""
+        config = config or {}
+        return cls(config, DeadLetterQueue(config.get('dead_letter_path', "dead_letter.jsonl")))
+
+    def __getitem__(self, name: str) -> Endpoint:
+        with self._lock:
+            endpoint = self.endpoints.get(name)
+            if endpoint is None:
+                service = name.split(':', 1)[0]
+                options = {**self.config.get('retry', {}), **self.config.get('breaker', {}),
+                           **self.config.get('endpoints', {}).get(service, {})}
+                endpoint = self.endpoints[name] = Endpoint(
+                    name,
+                    RetryPolicy(options.get('max_attempts', 4), options.get('base_delay', 1.0),
+                                options.get('max_delay', 60.0), options.get('max_retry_after', 300.0)),
+                    CircuitBreaker(name, options.get('failure_threshold', 5),
+                                   options.get('reset_timeout', 30.0))
+                )
+            return endpoint
+
+    def stats(self) -> Dict:
+        return {
+            'endpoints': {name: endpoint.stats() for name, endpoint in self.endpoints.items()},
+            'dead_letters': self.dead_letters.stats()
+        }
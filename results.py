@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Résultats de campagne en flux: fichier JSONL en ajout seul, agrégats en mémoire constante, index de points de contrôle
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TopCounter:
+    """Compteurs des ``size`` clés les plus fréquentes (algorithme Space-Saving).
+
+    La mémoire est bornée quel que soit le nombre de clés distinctes; une
+    clé entrée tardivement hérite du compte de celle qu'elle évince (compte
+    surestimé d'au plus ce montant).
+    """
+
+    def __init__(self, size: int = 20, counts: Optional[Dict[str, int]] = None):
+        self.size = size
+        self.counts: Dict[str, int] = dict(counts or {})
+
+    def add(self, key: str, amount: int = 1):
+        if key in self.counts:
+            self.counts[key] += amount
+        elif len(self.counts) < self.size:
+            self.counts[key] = amount
+        else:
+            evicted = min(self.counts, key=self.counts.get)
+            self.counts[key] = self.counts.pop(evicted) + amount
+
+    def top(self, n: Optional[int] = None) -> Dict[str, int]:
+        ordered = sorted(self.counts.items(), key=lambda item: item[1], reverse=True)
+        return dict(ordered[:n])
+
+
+def _epoch(timestamp: Optional[str]) -> Optional[float]:
+    try:
+        return datetime.fromisoformat(timestamp).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class CampaignStats:
+    """Agrégats courants d'une campagne (taux de succès, débit, fin estimée, échecs par
+    domaine) mis à jour résultat par résultat, en mémoire constante"""
+
+    def __init__(self, expected: int = 0, started_at: Optional[float] = None):
+        self.expected = expected
+        self.started_at = time.time() if started_at is None else started_at
+        self.last_at: Optional[float] = None
+        self.sent = 0
+        self.failed = 0
+        self.failures_by_stage: Counter = Counter()
+        self.failing_domains = TopCounter(20)
+        self.errors = TopCounter(20)
+        self.recent_failures: deque = deque(maxlen=20)
+
+    @property
+    def total(self) -> int:
+        return self.sent + self.failed
+
+    def add(self, result: Dict):
+        at = _epoch(result.get('timestamp'))
+        if at is not None:
+            self.last_at = at if self.last_at is None else max(self.last_at, at)
+        if result.get('success'):
+            self.sent += 1
+            return
+        self.failed += 1
+        self.failures_by_stage[result.get('stage') or 'send'] += 1
+        self.failing_domains.add(result.get('email', '').rsplit('@', 1)[-1].lower())
+        self.errors.add((result.get('error') or '')[:120])
+        self.recent_failures.append({key: result.get(key) for key in ('company', 'email', 'stage', 'error')})
+
+    def summary(self) -> Dict:
+        elapsed = max(0.0, (self.last_at or self.started_at) - self.started_at)
+        rate = self.total / elapsed if elapsed else 0.0
+        remaining = max(0, self.expected - self.total)
+        eta = None
+        if remaining and rate:
+            eta = datetime.fromtimestamp((self.last_at or self.started_at) + remaining / rate)
+        return {
+            'total_emails': self.total,
+            'expected': self.expected,
+            'sent_successfully': self.sent,
+            'failed': self.failed,
+            'success_rate': f"{(self.sent / self.total * 100) if self.total else 0:.1f}%",
+            'started_at': datetime.fromtimestamp(self.started_at).isoformat(timespec='seconds'),
+            'elapsed_seconds': round(elapsed, 1),
+            'per_minute': round(rate * 60, 1),
+            'eta': eta.isoformat(timespec='seconds') if eta else None,
+            'failures_by_stage': dict(self.failures_by_stage),
+            'failing_domains': self.failing_domains.top(),
+            'top_errors': self.errors.top(5),
+            'recent_failures': list(self.recent_failures)
+        }
+
+    def to_dict(self) -> Dict:
+        """État complet, pour un point de contrôle de l'index"""
+        return {
+            'expected': self.expected,
+            'started_at': self.started_at,
+            'last_at': self.last_at,
+            'sent': self.sent,
+            'failed': self.failed,
+            'failures_by_stage': dict(self.failures_by_stage),
+            'failing_domains': self.failing_domains.counts,
+            'errors': self.errors.counts,
+            'recent_failures': list(self.recent_failures)
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'CampaignStats':
+        stats = cls(data.get('expected', 0), data.get('started_at'))
+        stats.last_at = data.get('last_at')
+        stats.sent = data.get('sent', 0)
+        stats.failed = data.get('failed', 0)
+        stats.failures_by_stage.update(data.get('failures_by_stage', {}))
+        stats.failing_domains = TopCounter(20, data.get('failing_domains'))
+        stats.errors = TopCounter(20, data.get('errors'))
+        stats.recent_failures.extend(data.get('recent_failures', []))
+        return stats
+
+
+class ResultsLog:
+    """Un résultat par contact, ajouté au fichier JSONL dès que le contact est terminé.
+
+    Le fichier est lisible pendant la campagne. Toutes les
+    ``checkpoint_every`` lignes, l'index ``<fichier>.idx`` reçoit un point
+    de contrôle (position dans le fichier, nombre de lignes, agrégats):
+    ``summarize`` repart du dernier et ne relit que la fin du fichier.
+    """
+
+    def __init__(self, path: str, expected: int = 0, checkpoint_every: int = 1000):
+        self.path = path
+        self.checkpoint_every = max(1, checkpoint_every)
+        self.stats = CampaignStats(expected)
+        self.lines = 0
+        self._lock = threading.Lock()
+        self._file = open(path, 'ab')
+        self._offset = self._file.tell()
+        self._index = open(index_path(path), 'a', encoding='utf-8')
+        self._checkpoint()
+
+    @classmethod
+    def open(cls, report_dir: str, expected: int = 0,
+             config: Optional[Dict] = None) -> 'ResultsLog':
+        """Nouveau fichier ``email_results_<horodatage>.jsonl`` dans ``report_dir``"""
+        config = config or {}
+        path = Path(report_dir) / f"email_results_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}.jsonl"
+        return cls(str(path), expected, config.get('checkpoint_every', 1000))
+
+    def append(self, result: Dict):
+        line = (json.dumps(result, ensure_ascii=False) + "\n").encode('utf-8')
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            self._offset += len(line)
+            self.lines += 1
+            self.stats.add(result)
+            if self.lines % self.checkpoint_every == 0:
+                self._checkpoint()
+                summary = self.stats.summary()
+                eta_msg = f", fin estimée {summary['eta']}" if summary['eta'] else ""
+                logger.info(f"📈 {self.stats.total}/{self.stats.expected or '?'} contacts "
+                            f"({summary['success_rate']} de succès), {summary['per_minute']}/min{eta_msg}")
+
+    def _checkpoint(self):
+        # Appelé sous self._lock (ou à la construction)
+        self._index.write(json.dumps({'offset': self._offset, 'lines': self.lines,
+                                      'stats': self.stats.to_dict()}, ensure_ascii=False) + "\n")
+        self._index.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file.closed:
+                return
+            self._checkpoint()
+            self._file.close()
+            self._index.close()
+
+
+def index_path(path: str) -> str:
+    return f"{path}.idx"
+
+
+def _last_checkpoint(path: str) -> Optional[Dict]:
+    """Dernier point de contrôle complet de l'index (None sans index)"""
+    try:
+        with open(index_path(path), 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            size = block = f.tell()
+            tail = b""
+            # Lecture à rebours: l'index grossit avec la campagne
+            while size > 0:
+                block = min(64 * 1024, size)
+                size -= block
+                f.seek(size)
+                tail = f.read(block) + tail
+                lines = tail.split(b"\n")
+                # Dernière ligne éventuellement incomplète (écriture interrompue)
+                for line in reversed(lines[1:-1] if size > 0 else lines[:-1]):
+                    try:
+                        return json.loads(line)
+                    except ValueError:
+                        continue
+    except FileNotFoundError:
+        return None
+    return None
+
+
+def summarize(path: str) -> Dict:
+    """Agrégats d'un fichier de résultats, même énorme ou en cours d'écriture.
+
+    Repart du dernier point de contrôle de l'index puis ne lit que les
+    lignes écrites depuis; sans index, tout le fichier est lu en flux.
+    """
+    checkpoint = _last_checkpoint(path) or {'offset': 0, 'lines': 0, 'stats': {}}
+    stats = CampaignStats.from_dict(checkpoint['stats'])
+    if not checkpoint['stats']:
+        stats.started_at = None
+    scanned = corrupt = 0
+    with open(path, 'rb') as f:
+        f.seek(checkpoint['offset'])
+        for line in f:
+            if not line.endswith(b"\n"):
+                # Ligne en cours d'écriture
+                break
+            try:
+                result = json.loads(line)
+            except ValueError:
+                # Ligne abîmée (écriture interrompue par un crash puis reprise à la suite)
+                corrupt += 1
+                continue
+            if stats.started_at is None:
+                stats.started_at = _epoch(result.get('timestamp'))
+            stats.add(result)
+            scanned += 1
+    if corrupt:
+        logger.warning(f"⚠️ {corrupt} lignes illisibles ignorées dans {path}")
+    if stats.started_at is None:
+        stats.started_at = stats.last_at or time.time()
+    return {
+        'path': path,
+        **stats.summary(),
+        'indexed_lines': checkpoint['lines'],
+        'scanned_lines': scanned,
+        'corrupt_lines': corrupt
+    }
+
+
+def tail(path: str, count: int = 20) -> List[Dict]:
+    """Derniers résultats du fichier, lus depuis la fin"""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        data = b""
+        while size > 0 and data.count(b"\n") <= count:
+            block = min(64 * 1024, size)
+            size -= block
+            f.seek(size)
+            data = f.read(block) + data
+    lines = data.split(b"\n")
+    # Sans la dernière ligne incomplète ni une première ligne coupée
+    complete = lines[:-1] if size == 0 else lines[1:-1]
+    results = []
+    for line in complete[-count:]:
+        try:
+            results.append(json.loads(line))
+        except ValueError:
+            # Ligne vide ou abîmée
+            continue
+    return results
+
+
+def latest(report_dir: str = ".") -> Optional[str]:
+    """Fichier de résultats le plus récent de ``report_dir``"""
+    files = sorted(Path(report_dir).glob("email_results_*.jsonl"), key=lambda p: p.stat().st_mtime)
+    return str(files[-1]) if files else None
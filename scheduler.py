@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Planificateur évènementiel: minuteurs persistants en tas, fenêtres d'envoi par fuseau horaire
+"""
+
+import heapq
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time as clock, timedelta
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+# Fuseau des destinataires sans indication (entreprises marocaines)
+DEFAULT_TIMEZONE = "Africa/Casablanca"
+
+
+class SendWindow:
+    """Plage d'envoi quotidienne, en heure locale du destinataire (``start`` + ``minutes``).
+
+    Le fuseau d'un destinataire est, dans l'ordre: celui du contact
+    (colonne ``timezone``), celui de son domaine ou de son extension dans
+    ``domain_timezones`` (``{"fr": "Europe/Paris"}``), puis ``timezone``.
+    """
+
+    def __init__(self, start: str = "08:00", minutes: float = 120.0,
+                 timezone: str = DEFAULT_TIMEZONE,
+                 domain_timezones: Optional[Dict[str, str]] = None):
+        hour, minute = (int(part) for part in start.split(':'))
+        self.start = clock(hour, minute)
+        self.minutes = max(0.0, minutes)
+        self.default = self._zone(timezone) or ZoneInfo("UTC")
+        self.domain_timezones = {key.lower().lstrip('.'): value
+                                 for key, value in (domain_timezones or {}).items()}
+        self._zones: Dict[str, ZoneInfo] = {}
+
+    @staticmethod
+    def _zone(name: str) -> Optional[ZoneInfo]:
+        try:
+            return ZoneInfo(name)
+        except (ZoneInfoNotFoundError, ValueError):
+            logger.warning(f"⚠️ Fuseau horaire inconnu: {name}")
+            return None
+
+    def zone(self, email: str, timezone: Optional[str] = None) -> ZoneInfo:
+        """Fuseau horaire du destinataire"""
+        if not timezone:
+            domain = email.rsplit('@', 1)[-1].lower()
+            timezone = self.domain_timezones.get(domain) or self.domain_timezones.get(domain.rsplit('.', 1)[-1])
+        if not timezone:
+            return self.default
+        zone = self._zones.get(timezone)
+        if zone is None:
+            zone = self._zones[timezone] = self._zone(timezone) or self.default
+        return zone
+
+    def next_window(self, zone: ZoneInfo, now: Optional[float] = None) -> Tuple[float, float]:
+        """Prochaine plage (début, fin) en secondes epoch; la plage en cours si elle n'est pas finie"""
+        now = time.time() if now is None else now
+        today = datetime.fromtimestamp(now, zone).date()
+        for day in (today, today + timedelta(days=1)):
+            start = datetime.combine(day, self.start, tzinfo=zone).timestamp()
+            end = start + self.minutes * 60
+            if end > now or (self.minutes == 0 and start >= now):
+                return max(start, now), end
+        # Inatteignable: la plage de demain est toujours dans le futur
+        return now, now
+
+    def spread(self, recipients: Iterable[Tuple[str, Optional[str]]],
+               now: Optional[float] = None) -> Iterator[float]:
+        """Heures d'envoi (epoch) des destinataires ``(email, fuseau)``, dans l'ordre donné.
+
+        Les destinataires d'un même fuseau sont répartis uniformément sur
+        leur plage pour éviter les rafales. ``recipients`` est parcouru deux
+        fois (comptage puis attribution): passer une liste ou un itérable
+        ré-itérable.
+        """
+        now = time.time() if now is None else now
+        counts: Counter = Counter(self.zone(email, timezone).key for email, timezone in recipients)
+        windows = {key: self.next_window(ZoneInfo(key), now) for key in counts}
+        positions: Counter = Counter()
+        for email, timezone in recipients:
+            key = self.zone(email, timezone).key
+            start, end = windows[key]
+            yield start + (end - start) * positions[key] / counts[key]
+            positions[key] += 1
+
+
+class Scheduler:
+    """Minuteurs persistants (SQLite) servis par un tas, sans scrutation.
+
+    Chaque minuteur appartient à une campagne et porte un type (``send``,
+    ``campaign``...) et une charge JSON passée au gestionnaire de ce type.
+    Un seul thread dort jusqu'à l'échéance la plus proche (réveil à la
+    fraction de seconde près, ou plus tôt si un minuteur plus proche est
+    ajouté) puis confie les minuteurs échus à un pool de ``workers``
+    threads: plusieurs campagnes avancent en parallèle.
+
+    Les minuteurs survivent aux redémarrages: au lancement, ceux en attente
+    sont rechargés. Ceux restés en cours sont repris s'ils appartenaient à ce
+    processus, à un processus disparu de cette machine, ou, pour une autre
+    machine, s'ils ont été réclamés il y a plus de ``stale_after`` secondes
+    (au gestionnaire de vérifier que le travail n'est pas déjà fait); ceux
+    d'un autre planificateur encore actif ne sont pas touchés.
+    Un minuteur n'est exécuté que par le processus qui le réclame en base,
+    et ceux ajoutés par un autre processus sont relus toutes les
+    ``refresh_interval`` secondes.
+    """
+
+    def __init__(self, path: str = "scheduler.sqlite", workers: int = 4,
+                 refresh_interval: float = 30.0, stale_after: float = 3600.0):
+        self.path = path
+        self.workers = max(1, workers)
+        self.refresh_interval = refresh_interval
+        self.stale_after = stale_after
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.fired = 0
+        self.failed = 0
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._heap: List[Tuple[float, int]] = []
+        self._known = set()
+        self._last_loaded = 0
+        self._running = 0
+        self._stopping = False
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS timers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                campaign TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                run_at REAL NOT NULL,
+                payload TEXT NOT NULL,
+                state TEXT NOT NULL,
+                owner TEXT,
+                claimed_at REAL,
+                error TEXT,
+                created_at REAL NOT NULL,
+                finished_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_timers_state ON timers(state, id);
+            CREATE INDEX IF NOT EXISTS idx_timers_campaign ON timers(campaign, state);
+        """)
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(timers)")}
+        if 'claimed_at' not in columns:
+            # Base créée avant la reprise des seuls minuteurs abandonnés
+            self._db.execute("ALTER TABLE timers ADD COLUMN claimed_at REAL")
+        self._db.commit()
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict]) -> Optional['Scheduler']:
+        """Construit le planificateur depuis la section ``scheduler`` (None si désactivé)"""
+        config = config or {}
+        if not config.get('enabled', True):
+            return None
+        return cls(
+            path=config.get('path', "scheduler.sqlite"),
+            workers=config.get('workers', 4),
+            refresh_interval=config.get('refresh_interval', 30.0),
+            stale_after=config.get('stale_after', 3600.0)
+        )
+
+    def add(self, campaign: str, kind: str, run_at: float, payload: Dict) -> int:
+        """Programme un minuteur (epoch ``run_at``); renvoie son identifiant"""
+        return self.add_many(campaign, kind, [(run_at, payload)])[0]
+
+    def add_many(self, campaign: str, kind: str, timers: Iterable[Tuple[float, Dict]],
+                 chunk_size: int = 1000) -> List[int]:
+        """Programme une série de minuteurs ``(run_at, charge)`` d'une campagne"""
+        ids: List[int] = []
+        chunk: List[Tuple[float, Dict]] = []
+
+        def flush():
+            now = time.time()
+            with self._lock:
+                with self._db:
+                    for run_at, payload in chunk:
+                        cursor = self._db.execute(
+                            "INSERT INTO timers (campaign, kind, run_at, payload, state, created_at) "
+                            "VALUES (?, ?, ?, ?, ?, ?)",
+                            (campaign, kind, run_at, json.dumps(payload, ensure_ascii=False), PENDING, now)
+                        )
+                        ids.append(cursor.lastrowid)
+            with self._wakeup:
+                for (run_at, _), timer_id in zip(chunk, ids[-len(chunk):]):
+                    self._push(run_at, timer_id)
+                self._wakeup.notify()
+            chunk.clear()
+
+        for timer in timers:
+            chunk.append(timer)
+            if len(chunk) >= chunk_size:
+                flush()
+        if chunk:
+            flush()
+        return ids
+
+    def _push(self, run_at: float, timer_id: int):
+        # Appelé sous self._wakeup
+        if timer_id not in self._known:
+            self._known.add(timer_id)
+            heapq.heappush(self._heap, (run_at, timer_id))
+
+    def cancel(self, campaign: str) -> int:
+        """Annule les minuteurs en attente d'une campagne; renvoie leur nombre"""
+        with self._lock:
+            with self._db:
+                cursor = self._db.execute(
+                    "UPDATE timers SET state = ?, finished_at = ? WHERE campaign = ? AND state = ?",
+                    (CANCELLED, time.time(), campaign, PENDING)
+                )
+        return cursor.rowcount
+
+    def _abandoned(self, owner: Optional[str], claimed_at: Optional[float], now: float) -> bool:
+        """Vrai si le minuteur en cours réclamé par ``owner`` (``hôte:pid``) n'a plus de processus"""
+        if not owner or owner == self.owner:
+            return True
+        host, _, pid = owner.rpartition(':')
+        if host == socket.gethostname() and pid.isdigit() and os.name == 'posix':
+            try:
+                os.kill(int(pid), 0)
+            except ProcessLookupError:
+                return True
+            except PermissionError:
+                # Processus d'un autre utilisateur: il existe
+                pass
+            return False
+        # Autre machine: on ne peut que juger l'ancienneté de la réclamation
+        return claimed_at is None or now - claimed_at > self.stale_after
+
+    def _load(self, recover: bool = False):
+        """Charge en tas les minuteurs en attente pas encore connus (``recover``: reprend aussi
+        ceux restés en cours dont le processus a disparu)"""
+        with self._lock:
+            with self._db:
+                if recover:
+                    now = time.time()
+                    running = self._db.execute(
+                        "SELECT id, owner, claimed_at FROM timers WHERE state = ?", (RUNNING,)
+                    ).fetchall()
+                    recovered = 0
+                    for timer_id, owner, claimed_at in running:
+                        if self._abandoned(owner, claimed_at, now):
+                            recovered += self._db.execute(
+                                "UPDATE timers SET state = ?, owner = NULL, claimed_at = NULL "
+                                "WHERE id = ? AND state = ? AND owner IS ?",
+                                (PENDING, timer_id, RUNNING, owner)
+                            ).rowcount
+                    if recovered:
+                        logger.warning(f"♻️ {recovered} minuteurs interrompus remis en attente")
+                rows = self._db.execute(
+                    "SELECT run_at, id FROM timers WHERE state = ? AND id > ? ORDER BY id",
+                    (PENDING, 0 if recover else self._last_loaded)
+                ).fetchall()
+        with self._wakeup:
+            for run_at, timer_id in rows:
+                self._push(run_at, timer_id)
+                self._last_loaded = max(self._last_loaded, timer_id)
+
+    def _claim(self, timer_id: int) -> Optional[Tuple[str, str, Dict]]:
+        """Réclame un minuteur échu; None s'il a été annulé ou pris par un autre processus"""
+        with self._lock:
+            with self._db:
+                claimed = self._db.execute(
+                    "UPDATE timers SET state = ?, owner = ?, claimed_at = ? WHERE id = ? AND state = ?",
+                    (RUNNING, self.owner, time.time(), timer_id, PENDING)
+                ).rowcount
+                if not claimed:
+                    return None
+                campaign, kind, payload = self._db.execute(
+                    "SELECT campaign, kind, payload FROM timers WHERE id = ?", (timer_id,)
+                ).fetchone()
+        return campaign, kind, json.loads(payload)
+
+    def _finish(self, timer_id: int, state: str, error: Optional[str] = None) -> int:
+        """Conclut un minuteur; renvoie le nombre de minuteurs restant dans sa campagne"""
+        with self._lock:
+            with self._db:
+                self._db.execute(
+                    "UPDATE timers SET state = ?, error = ?, finished_at = ? WHERE id = ?",
+                    (state, error, time.time(), timer_id)
+                )
+                return self._db.execute(
+                    "SELECT COUNT(*) FROM timers WHERE campaign = "
+                    "(SELECT campaign FROM timers WHERE id = ?) AND state IN (?, ?)",
+                    (timer_id, PENDING, RUNNING)
+                ).fetchone()[0]
+
+    def pending(self) -> int:
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM timers WHERE state IN (?, ?)", (PENDING, RUNNING)
+            ).fetchone()[0]
+
+    def next_run(self) -> Optional[float]:
+        """Échéance la plus proche parmi les minuteurs en attente"""
+        with self._lock:
+            return self._db.execute(
+                "SELECT MIN(run_at) FROM timers WHERE state = ?", (PENDING,)
+            ).fetchone()[0]
+
+    def campaigns(self) -> Dict[str, Dict]:
+        """État par campagne: minuteurs par état et prochaine échéance"""
+        summary: Dict[str, Dict] = {}
+        with self._lock:
+            for campaign, kind, state, count, next_run in self._db.execute(
+                "SELECT campaign, kind, state, COUNT(*), MIN(run_at) FROM timers "
+                "GROUP BY campaign, kind, state"
+            ):
+                entry = summary.setdefault(campaign, {'kind': kind, 'states': {}, 'next_run': None})
+                entry['states'][state] = count
+                if state == PENDING:
+                    entry['next_run'] = datetime.fromtimestamp(next_run).isoformat(timespec='seconds')
+        return summary
+
+    def stop(self):
+        """Demande l'arrêt de ``run`` (les minuteurs en cours se terminent)"""
+        with self._wakeup:
+            self._stopping = True
+            self._wakeup.notify_all()
+
+    def run(self, handlers: Dict[str, Callable[[Dict], None]], until_idle: bool = False,
+            on_campaign_done: Optional[Callable[[str], None]] = None) -> int:
+        """Exécute les minuteurs à leur échéance jusqu'à ``stop()`` (ou, avec ``until_idle``,
+        jusqu'à ce qu'il n'en reste plus). Renvoie le nombre de minuteurs exécutés."""
+        self._stopping = False
+        self._load(recover=True)
+        fired_before = self.fired
+        next_refresh = time.monotonic() + self.refresh_interval
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="scheduler")
+
+        def execute(timer_id: int, campaign: str, kind: str, payload: Dict):
+            try:
+                handlers[kind](payload)
+                state, error = DONE, None
+            except Exception as e:
+                logger.error(f"❌ Minuteur #{timer_id} ({kind}, {campaign}) en échec: {e}")
+                state, error = FAILED, str(e)
+            try:
+                remaining = self._finish(timer_id, state, error)
+                if state == FAILED:
+                    self.failed += 1
+                if not remaining and on_campaign_done is not None:
+                    on_campaign_done(campaign)
+            finally:
+                with self._wakeup:
+                    self._running -= 1
+                    self._wakeup.notify()
+
+        try:
+            while True:
+                due: List[int] = []
+                with self._wakeup:
+                    if self._stopping:
+                        break
+                    now = time.time()
+                    while self._heap and self._heap[0][0] <= now:
+                        due.append(heapq.heappop(self._heap)[1])
+                    if not due:
+                        if until_idle and not self._heap and not self._running:
+                            # Dernière relecture: un autre processus a pu en ajouter
+                            if not self.pending():
+                                break
+                        refresh_in = next_refresh - time.monotonic()
+                        timeout = refresh_in if not self._heap else min(self._heap[0][0] - now, refresh_in)
+                        if timeout > 0:
+                            self._wakeup.wait(timeout)
+                if not due:
+                    if time.monotonic() >= next_refresh:
+                        self._load()
+                        next_refresh = time.monotonic() + self.refresh_interval
+                    continue
+                for timer_id in due:
+                    with self._wakeup:
+                        self._known.discard(timer_id)
+                    claimed = self._claim(timer_id)
+                    if claimed is None:
+                        continue
+                    campaign, kind, payload = claimed
+                    if kind not in handlers:
+                        self._finish(timer_id, FAILED, f"type de minuteur inconnu: {kind}")
+                        continue
+                    with self._wakeup:
+                        self._running += 1
+                    self.fired += 1
+                    executor.submit(execute, timer_id, campaign, kind, payload)
+        finally:
+            executor.shutdown(wait=True)
+        return self.fired - fired_before
+
+    def stats(self) -> Dict:
+        return {'fired': self.fired, 'failed': self.failed, 'campaigns': self.campaigns()}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cache des résultats de recherche Serper (SQLite + mémoire, TTL et éviction LRU)
+"""
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(text: str) -> str:
+    """Normalise une requête: minuscules et espaces compactés"""
+    return " ".join(text.lower().split())
+
+
+def cache_key(query: str, location: str, gl: str) -> str:
+    """Clé de contenu: empreinte SHA-256 de la requête normalisée, de la location et du gl"""
+    payload = json.dumps(
+        [normalize_query(query), normalize_query(location or ""), (gl or "").lower()],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class SearchCache:
+    """Cache à deux niveaux pour ``search_company_info``.
+
+    - un niveau mémoire LRU (``memory_entries``) devant
+    - un niveau disque SQLite avec durée de vie (``ttl``) et un plafond
+      d'entrées (``max_entries``) appliqué par éviction LRU.
+
+    Les workers qui demandent la même requête en même temps partagent une
+    seule requête en vol au lieu d'appeler l'API chacun de leur côté.
+    """
+
+    def __init__(self, path: str = "search_cache.sqlite", ttl: float = 7 * 24 * 3600,
+                 max_entries: int = 10000, memory_entries: int = 256):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS search_cache (
+                key TEXT PRIMARY KEY,
+                query TEXT NOT NULL,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_search_cache_accessed ON search_cache(accessed_at)"
+        )
+        self._db.commit()
+        # Nombre d'entrées sur disque, tenu à jour à chaque écriture (pas de COUNT(*) par ajout)
+        self._entries = self._db.execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.expired = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict]) -> Optional['SearchCache']:
+        """Construit le cache depuis la section ``search_cache`` (None si désactivé)"""
+        config = config or {}
+        if not config.get('enabled', True):
+            return None
+        return cls(
+            path=config.get('path', "search_cache.sqlite"),
+            ttl=config.get('ttl_hours', 168) * 3600,
+            max_entries=config.get('max_entries', 10000),
+            memory_entries=config.get('memory_entries', 256)
+        )
+
+    def _memory_get(self, key: str, now: float) -> Optional[Dict]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        created_at, value = entry
+        if now - created_at > self.ttl:
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return value
+
+    def _memory_put(self, key: str, created_at: float, value: Dict):
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_get(self, key: str, now: float) -> Optional[tuple]:
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT value, created_at FROM search_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self._db.execute("DELETE FROM search_cache WHERE key = ?", (key,))
+                self._db.commit()
+                self._entries -= 1
+                self.expired += 1
+                return None
+            self._db.execute("UPDATE search_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self._db.commit()
+        return json.loads(row[0]), row[1]
+
+    def _disk_put(self, key: str, query: str, value: Dict, now: float):
+        with self._db_lock:
+            payload = json.dumps(value, ensure_ascii=False)
+            cursor = self._db.execute(
+                "UPDATE search_cache SET query = ?, value = ?, created_at = ?, accessed_at = ? WHERE key = ?",
+                (query, payload, now, now, key)
+            )
+            if cursor.rowcount == 0:
+                self._db.execute(
+                    "INSERT INTO search_cache (key, query, value, created_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, query, payload, now, now)
+                )
+                self._entries += 1
+            overflow = self._entries - self.max_entries
+            if overflow > 0:
+                # Éviction LRU: les entrées les moins récemment lues partent en premier
+                cursor = self._db.execute(
+                    "DELETE FROM search_cache WHERE key IN "
+                    "(SELECT key FROM search_cache ORDER BY accessed_at LIMIT ?)",
+                    (overflow,)
+                )
+                self._entries -= cursor.rowcount
+                self.evictions += cursor.rowcount
+            self._db.commit()
+
+    def lookup(self, query: str, location: str, gl: str) -> Optional[Dict]:
+        """Cherche en mémoire puis sur disque; renvoie None si absent ou expiré"""
+        key = cache_key(query, location, gl)
+        now = time.time()
+        with self._lock:
+            value = self._memory_get(key, now)
+            if value is not None:
+                self.memory_hits += 1
+                return value
+        cached = self._disk_get(key, now)
+        if cached is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        value, created_at = cached
+        with self._lock:
+            self.disk_hits += 1
+            self._memory_put(key, created_at, value)
+        return value
+
+    def store(self, query: str, location: str, gl: str, value: Dict):
+        """Enregistre un résultat frais en mémoire et sur disque"""
+        key = cache_key(query, location, gl)
+        now = time.time()
+        self._disk_put(key, query, value, now)
+        with self._lock:
+            self._memory_put(key, now, value)
+
+    def get_or_fetch(self, query: str, location: str, gl: str,
+                     fetch: Callable[[], Dict]) -> Dict:
+        """Renvoie le résultat en cache, ou appelle ``fetch`` une seule fois pour tous les demandeurs.
+
+        Les exceptions de ``fetch`` sont propagées à tous les demandeurs
+        concurrents et rien n'est mis en cache.
+        """
+        key = cache_key(query, location, gl)
+
+        with self._lock:
+            value = self._memory_get(key, time.time())
+            if value is not None:
+                self.memory_hits += 1
+                return value
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                owner = False
+            else:
+                future = self._inflight[key] = Future()
+                owner = True
+
+        if not owner:
+            return future.result()
+
+        try:
+            value = self.lookup(query, location, gl)
+            if value is None:
+                value = fetch()
+                self.store(query, location, gl, value)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def purge_expired(self) -> int:
+        """Supprime les entrées expirées du disque; renvoie le nombre supprimé"""
+        with self._db_lock:
+            cursor = self._db.execute(
+                "DELETE FROM search_cache WHERE created_at < ?", (time.time() - self.ttl,)
+            )
+            self._db.commit()
+            self._entries -= cursor.rowcount
+        self.expired += cursor.rowcount
+        return cursor.rowcount
+
+    def stats(self) -> Dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses + self.coalesced
+        hits = lookups - self.misses
+        with self._db_lock:
+            # Recalé sur le fichier, qu'un autre processus peut aussi alimenter
+            self._entries = self._db.execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+        return {
+            'entries': self._entries,
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'coalesced': self.coalesced,
+            'misses': self.misses,
+            'expired': self.expired,
+            'evictions': self.evictions,
+            'hit_rate': f"{(hits / lookups * 100) if lookups else 0:.1f}%"
+        }
+
+    def close(self):
+        with self._db_lock:
+            self._db.close()
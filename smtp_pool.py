@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pool de sessions SMTP persistantes et authentifiées
+"""
+
+import smtplib
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# Codes SMTP signifiant que le serveur ferme (ou va fermer) la session
+RECONNECT_CODES = (421,)
+
+
+class DeliveryUncertain(smtplib.SMTPException):
+    """Connexion perdue après le début de DATA: le serveur a peut-être accepté le message.
+
+    Jamais réessayé (ni par le pool, ni par ``Resilience``): un renvoi
+    risquerait un doublon chez le destinataire.
+    """
+
+
+class _TrackingSMTP(smtplib.SMTP):
+    """``smtplib.SMTP`` qui note si la commande DATA a été envoyée pour le message en cours"""
+
+    data_started = False
+
+    def data(self, msg):
+        self.data_started = True
+        return super().data(msg)
+
+
+class SMTPSession:
+    """Une connexion SMTP authentifiée réutilisable, avec ses compteurs"""
+
+    def __init__(self, session_id: int, host: str, port: int, username: str,
+                 password: str, use_tls: bool = True, timeout: float = 30):
+        self.session_id = session_id
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.timeout = timeout
+
+        self.server: Optional[smtplib.SMTP] = None
+        self.created_at = 0.0
+        self.last_used = 0.0
+        self.messages_in_session = 0
+
+        # Compteurs cumulés sur toute la vie de la session
+        self.messages_sent = 0
+        self.bytes_sent = 0
+        self.connections = 0
+        self.reconnects = 0
+        self.errors = 0
+
+    @property
+    def connected(self) -> bool:
+        return self.server is not None
+
+    def connect(self):
+        """Ouvre la connexion, négocie TLS et s'authentifie"""
+        server = _TrackingSMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls:
+                server.starttls()
+            if self.username:
+                server.login(self.username, self.password)
+        except Exception:
+            server.close()
+            raise
+        self.server = server
+        self.created_at = self.last_used = time.monotonic()
+        self.messages_in_session = 0
+        self.connections += 1
+        logger.debug(f"Session SMTP #{self.session_id} ouverte vers {self.host}:{self.port}")
+
+    def close(self):
+        """Ferme proprement la connexion (QUIT), sans lever d'erreur"""
+        if self.server is None:
+            return
+        try:
+            self.server.quit()
+        except Exception:
+            try:
+                self.server.close()
+            except Exception:
+                pass
+        self.server = None
+        logger.debug(f"Session SMTP #{self.session_id} fermée")
+
+    def reconnect(self):
+        self.close()
+        self.reconnects += 1
+        self.connect()
+
+    def is_expired(self, max_messages: int, idle_timeout: float) -> bool:
+        """Vrai si la session a atteint son quota de messages ou est restée inactive trop longtemps"""
+        if self.server is None:
+            return False
+        if max_messages and self.messages_in_session >= max_messages:
+            return True
+        if idle_timeout and time.monotonic() - self.last_used > idle_timeout:
+            return True
+        return False
+
+    @property
+    def data_started(self) -> bool:
+        """Vrai si le dernier envoi a atteint DATA (le message a pu être accepté)"""
+        return getattr(self.server, 'data_started', False)
+
+    def sendmail(self, from_addr: str, to_addrs: Union[str, List[str]],
+                 msg: Union[str, bytes]) -> Dict:
+        self.server.data_started = False
+        refused = self.server.sendmail(from_addr, to_addrs, msg)
+        self.last_used = time.monotonic()
+        self.messages_in_session += 1
+        self.messages_sent += 1
+        self.bytes_sent += len(msg)
+        return refused
+
+    def stats(self) -> Dict:
+        return {
+            'session_id': self.session_id,
+            'connected': self.connected,
+            'messages_sent': self.messages_sent,
+            'messages_in_session': self.messages_in_session,
+            'bytes_sent': self.bytes_sent,
+            'connections': self.connections,
+            'reconnects': self.reconnects,
+            'errors': self.errors
+        }
+
+
+class SMTPConnectionPool:
+    """Garde N sessions SMTP authentifiées ouvertes et les réutilise entre les messages.
+
+    Les sessions sont ouvertes à la demande et fermées après
+    ``max_messages_per_session`` messages (à leur retour dans le pool) ou
+    ``idle_timeout`` secondes d'inactivité (par un thread de ménage, avant
+    que le serveur ne coupe lui-même avec un 421). Sur une réponse 421
+    (message refusé), la session est reconnectée et le message renvoyé. Sur ``SMTPServerDisconnected``, il ne l'est que si DATA
+    n'avait pas commencé; sinon ``DeliveryUncertain`` est levée, au premier
+    essai comme après la reconnexion.
+    """
+
+    def __init__(self, host: str, port: int, username: str, password: str,
+                 size: int = 2, max_messages_per_session: int = 100,
+                 idle_timeout: float = 60.0, use_tls: bool = True,
+                 timeout: float = 30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.size = max(1, size)
+        self.max_messages_per_session = max_messages_per_session
+        self.idle_timeout = idle_timeout
+        self.use_tls = use_tls
+        self.timeout = timeout
+
+        self._sessions = [
+            SMTPSession(i, host, port, username, password, use_tls, timeout)
+            for i in range(self.size)
+        ]
+        self._idle = list(self._sessions)
+        self._cond = threading.Condition()
+        self._reaper: Optional[threading.Thread] = None
+        self._closed = threading.Event()
+
+    @classmethod
+    def from_config(cls, email_config: Dict) -> 'SMTPConnectionPool':
+        """Construit le pool depuis la section ``email`` de config.json"""
+        pool_config = email_config.get('pool', {})
+        return cls(
+            host=email_config['smtp_server'],
+            port=email_config['smtp_port'],
+            # "auth": false pour un relais local sans authentification
+            username=email_config['email'] if pool_config.get('auth', True) else '',
+            password=email_config['password'],
+            size=pool_config.get('size', 2),
+            max_messages_per_session=pool_config.get('max_messages_per_session', 100),
+            idle_timeout=pool_config.get('idle_timeout', 60.0),
+            use_tls=pool_config.get('use_tls', True),
+            timeout=pool_config.get('timeout', 30)
+        )
+
+    @contextmanager
+    def session(self, timeout: Optional[float] = None):
+        """Emprunte une session connectée et la rend au pool à la sortie"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._idle, timeout):
+                raise TimeoutError("Aucune session SMTP disponible")
+            session = self._idle.pop()
+
+        try:
+            if session.is_expired(self.max_messages_per_session, self.idle_timeout):
+                session.close()
+            if not session.connected:
+                session.connect()
+                self._start_reaper()
+            yield session
+        finally:
+            # Quota de messages atteint: fermée tout de suite plutôt qu'au prochain emprunt
+            if session.is_expired(self.max_messages_per_session, 0):
+                session.close()
+            with self._cond:
+                self._idle.append(session)
+                self._cond.notify()
+
+    def _start_reaper(self):
+        with self._cond:
+            if not self.idle_timeout or self._reaper is not None:
+                return
+            self._closed.clear()
+            self._reaper = threading.Thread(target=self._reap, name="smtp-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap(self):
+        """Ferme les sessions inactives depuis ``idle_timeout`` secondes (QUIT propre)"""
+        while not self._closed.wait(max(0.05, self.idle_timeout / 2)):
+            with self._cond:
+                expired = [session for session in self._idle
+                           if session.is_expired(0, self.idle_timeout)]
+                # Retirées du pool le temps du QUIT: aucun emprunt concurrent
+                for session in expired:
+                    self._idle.remove(session)
+            for session in expired:
+                logger.debug(f"Session SMTP #{session.session_id} inactive depuis {self.idle_timeout}s, fermeture")
+                session.close()
+            if expired:
+                with self._cond:
+                    self._idle.extend(expired)
+                    self._cond.notify_all()
+
+    def sendmail(self, from_addr: str, to_addrs: Union[str, List[str]],
+                 msg: Union[str, bytes]) -> Dict:
+        """Envoie un message via une session du pool, avec une reconnexion si le serveur a coupé"""
+        with self.session() as session:
+            try:
+                return session.sendmail(from_addr, to_addrs, msg)
+            except smtplib.SMTPServerDisconnected as e:
+                if session.data_started:
+                    session.errors += 1
+                    session.close()
+                    raise DeliveryUncertain(f"connexion perdue pendant DATA: {e}") from e
+                logger.info(f"🔄 Session SMTP #{session.session_id} déconnectée, reconnexion...")
+            except smtplib.SMTPResponseException as e:
+                if e.smtp_code not in RECONNECT_CODES:
+                    session.errors += 1
+                    raise
+                # Un code de réponse, même après DATA, signifie que le message a été refusé
+                logger.info(f"🔄 Session SMTP #{session.session_id}: {e.smtp_code}, reconnexion...")
+            except smtplib.SMTPRecipientsRefused:
+                # Refus du destinataire: la session reste utilisable
+                session.errors += 1
+                raise
+            except Exception:
+                # État de la connexion inconnu: on repart d'une session neuve au prochain message
+                session.errors += 1
+                session.close()
+                raise
+
+            session.errors += 1
+            try:
+                session.reconnect()
+                return session.sendmail(from_addr, to_addrs, msg)
+            except Exception as e:
+                # Même règle qu'au premier essai: jamais de renvoi une fois DATA commencé
+                uncertain = isinstance(e, smtplib.SMTPServerDisconnected) and session.data_started
+                session.close()
+                if uncertain:
+                    raise DeliveryUncertain(f"connexion perdue pendant DATA: {e}") from e
+                raise
+
+    def stats(self) -> List[Dict]:
+        """Compteurs par session"""
+        return [session.stats() for session in self._sessions]
+
+    def close(self):
+        """Ferme les sessions inactives (elles seront rouvertes à la demande) et arrête le ménage"""
+        self._closed.set()
+        with self._cond:
+            reaper, self._reaper = self._reaper, None
+            for session in self._idle:
+                session.close()
+        if reaper is not None and reaper is not threading.current_thread():
+            reaper.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
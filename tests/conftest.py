@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+Les modules du projet sont à la racine du dépôt; faux services locaux partagés par les tests
+"""
+
+import copy
+import csv
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dry_run import DEFAULT_CONFIG, DryRun  # noqa: E402
+
+
+@pytest.fixture
+def dry_run(tmp_path, monkeypatch):
+    """Faux Serper / OpenRouter / SMTP sans latence, fichiers d'état dans ``tmp_path``"""
+    # main.py journalise dans le répertoire courant
+    monkeypatch.chdir(tmp_path)
+    with DryRun(copy.deepcopy(DEFAULT_CONFIG), search_latency=0, llm_latency=0, smtp_latency=0,
+                jitter=0, workdir=str(tmp_path / "work")) as services:
+        yield services
+
+
+@pytest.fixture
+def make_system(dry_run):
+    """Construit un ``EmailAutomationSystem`` branché sur les faux services"""
+    def make():
+        from main import EmailAutomationSystem
+        return EmailAutomationSystem(dry_run.config_path)
+    return make
+
+
+def write_contacts(path, count: int) -> str:
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Nom_ceo', 'Titre', 'company_name', 'email'])
+        for i in range(count):
+            writer.writerow([f"Dirigeant {i}", "CEO", f"Entreprise {i}", f"contact{i}@domaine{i % 3}.test"])
+    return str(path)
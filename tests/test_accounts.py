@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Répartition entre comptes expéditeurs: une bascule n'a lieu que si l'autre compte est retenu
+"""
+
+from accounts import AccountScheduler, SenderAccount
+
+
+class FixedWaits:
+    """Planificateur de quotas factice: attente fixe par compte"""
+
+    def __init__(self, waits):
+        self.waits = waits
+
+    def try_acquire(self, recipient, account=None):
+        return self.waits[account]
+
+
+def make_scheduler(tmp_path) -> AccountScheduler:
+    accounts = [SenderAccount(f"{name}@x.test", name, None, {}) for name in ("a", "b")]
+    return AccountScheduler(accounts, str(tmp_path / "accounts.sqlite"), failover_after=60)
+
+
+def test_contact_keeps_account_when_alternative_is_slower(tmp_path):
+    senders = make_scheduler(tmp_path)
+    first = senders.assign("contact@y.test")
+    other = next(a for a in senders.accounts if a is not first)
+
+    account, wait = senders.try_acquire("contact@y.test", FixedWaits({first.email: 120, other.email: 300}))
+    assert (account, wait) == (first, 120)
+    assert senders.assign("contact@y.test") is first
+    assert senders.failovers == 0
+
+
+def test_contact_moves_when_alternative_sends_sooner(tmp_path):
+    senders = make_scheduler(tmp_path)
+    first = senders.assign("contact@y.test")
+    other = next(a for a in senders.accounts if a is not first)
+
+    account, wait = senders.try_acquire("contact@y.test", FixedWaits({first.email: 120, other.email: 0}))
+    assert (account, wait) == (other, 0)
+    assert senders.assign("contact@y.test") is other
+    assert senders.failovers == 1
+
+
+class CountingWaits(FixedWaits):
+    """Comme ``FixedWaits``, en comptant les jetons pris (attente nulle) par compte"""
+
+    def __init__(self, waits):
+        super().__init__(waits)
+        self.taken = {account: 0 for account in waits}
+
+    def try_acquire(self, recipient, account=None):
+        wait = super().try_acquire(recipient, account)
+        if wait <= 0:
+            self.taken[account] += 1
+        return wait
+
+
+def test_no_second_token_when_failover_after_is_zero(tmp_path):
+    accounts = [SenderAccount(f"{name}@x.test", name, None, {}) for name in ("a", "b")]
+    senders = AccountScheduler(accounts, str(tmp_path / "accounts.sqlite"), failover_after=0)
+    first = senders.assign("contact@y.test")
+    waits = CountingWaits({account.email: 0 for account in accounts})
+
+    assert senders.try_acquire("contact@y.test", waits) == (first, 0)
+    assert sum(waits.taken.values()) == 1
+    assert senders.failovers == 0
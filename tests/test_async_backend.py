@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Backend asyncio contre les faux services locaux (Serper, OpenRouter, SMTP):
+envoi complet, aucun appel bloquant sur la boucle, pas de doublon après DATA
+"""
+
+import asyncio
+import socket
+import threading
+
+import pytest
+
+aiosmtpd_controller = pytest.importorskip("aiosmtpd.controller")
+
+from async_backend import AsyncSMTPPool
+from conftest import write_contacts
+from smtp_pool import DeliveryUncertain
+
+
+def test_campaign_sends_every_contact(dry_run, make_system, tmp_path):
+    system = make_system()
+    contacts = write_contacts(tmp_path / "contacts.csv", 12)
+    asyncio.run(system.arun_email_campaign(contacts, delay_between_emails=0))
+    assert dry_run.smtp.stats()['messages'] == 12
+    assert dry_run.api.searches == 12
+    assert system.campaign_stats.summary()['sent_successfully'] == 12
+
+
+def test_blocking_calls_run_off_the_event_loop(make_system, tmp_path, monkeypatch):
+    system = make_system()
+    calls = []
+
+    def spy(owner, name):
+        original = getattr(owner, name)
+
+        def wrapper(*args, **kwargs):
+            calls.append((name, threading.current_thread() is threading.main_thread()))
+            return original(*args, **kwargs)
+        monkeypatch.setattr(owner, name, wrapper)
+
+    for name in ('_journal', '_stage_parse', '_begin_send', '_record_result', 'render_message'):
+        spy(system, name)
+    spy(system.senders, 'try_acquire')
+    spy(system.senders, 'record_sent')
+
+    contacts = write_contacts(tmp_path / "contacts.csv", 6)
+    # asyncio.run fait tourner la boucle sur le thread principal
+    asyncio.run(system.arun_email_campaign(contacts, delay_between_emails=0))
+    assert {name for name, _ in calls} == {'_journal', '_stage_parse', '_begin_send', '_record_result',
+                                           'render_message', 'try_acquire', 'record_sent'}
+    assert [name for name, on_loop in calls if on_loop] == []
+
+
+def test_cached_email_journaled_on_the_writer_thread(make_system, tmp_path, monkeypatch):
+    contacts = write_contacts(tmp_path / "contacts.csv", 4)
+    asyncio.run(make_system().arun_email_campaign(contacts, delay_between_emails=0))
+
+    # Deuxième campagne: les emails viennent du cache
+    system = make_system()
+    calls = []
+    journal = system._journal
+
+    def spy(job, state, *args, **kwargs):
+        calls.append((args[:1], threading.current_thread().name))
+        return journal(job, state, *args, **kwargs)
+    monkeypatch.setattr(system, '_journal', spy)
+    asyncio.run(system.arun_email_campaign(contacts, delay_between_emails=0))
+    assert [thread for note, thread in calls if note == ("cache",)] and \
+        all(thread.startswith("async-writer") for _, thread in calls)
+
+
+class DropDuringData:
+    """Coupe la connexion pendant DATA, après avoir reçu le message (``enabled`` à False: accepte)"""
+
+    def __init__(self, enabled: bool = True):
+        self.messages = []
+        self.enabled = enabled
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope.content)
+        if not self.enabled:
+            return "250 OK"
+        server.transport.close()
+        return None
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def test_async_pool_does_not_resend_after_data():
+    handler = DropDuringData()
+    controller = aiosmtpd_controller.Controller(handler, hostname="127.0.0.1", port=free_port())
+    controller.start()
+
+    async def send():
+        pool = AsyncSMTPPool("127.0.0.1", controller.port, "", "", size=1, use_tls=False, timeout=5)
+        try:
+            await pool.sendmail("me@x.test", "a@y.test", b"Subject: test\r\n\r\nbonjour\r\n")
+        finally:
+            await pool.close()
+
+    try:
+        with pytest.raises(DeliveryUncertain):
+            asyncio.run(send())
+    finally:
+        controller.stop()
+    assert len(handler.messages) == 1
+
+
+def test_async_pool_does_not_resend_after_data_on_reconnect():
+    handler = DropDuringData(enabled=False)
+    port = free_port()
+    controller = aiosmtpd_controller.Controller(handler, hostname="127.0.0.1", port=port)
+    controller.start()
+
+    async def send():
+        nonlocal controller
+        pool = AsyncSMTPPool("127.0.0.1", port, "", "", size=1, use_tls=False, timeout=5)
+        try:
+            await pool.sendmail("me@x.test", "a@y.test", b"Subject: test\r\n\r\nbonjour\r\n")
+            # Session morte avant DATA, puis la session reconnectée est coupée pendant DATA
+            controller.stop()
+            controller = aiosmtpd_controller.Controller(handler, hostname="127.0.0.1", port=port)
+            controller.start()
+            handler.enabled = True
+            await pool.sendmail("me@x.test", "b@y.test", b"Subject: test\r\n\r\nbonjour\r\n")
+        finally:
+            await pool.close()
+
+    try:
+        with pytest.raises(DeliveryUncertain):
+            asyncio.run(send())
+    finally:
+        controller.stop()
+    assert len(handler.messages) == 2
+
+
+def test_async_pool_closes_idle_sessions():
+    handler = DropDuringData(enabled=False)
+    controller = aiosmtpd_controller.Controller(handler, hostname="127.0.0.1", port=free_port())
+    controller.start()
+
+    async def send():
+        pool = AsyncSMTPPool("127.0.0.1", controller.port, "", "", size=1, use_tls=False,
+                             timeout=5, idle_timeout=0.2)
+        try:
+            await pool.sendmail("me@x.test", "a@y.test", b"Subject: test\r\n\r\nbonjour\r\n")
+            assert pool.stats()[0]['connected']
+            await asyncio.sleep(0.8)
+            assert not pool.stats()[0]['connected']
+            # Rouverte à la demande
+            await pool.sendmail("me@x.test", "b@y.test", b"Subject: test\r\n\r\nbonjour\r\n")
+            return pool.stats()[0]
+        finally:
+            await pool.close()
+
+    try:
+        stats = asyncio.run(send())
+    finally:
+        controller.stop()
+    assert stats['connections'] == 2
+    assert len(handler.messages) == 2
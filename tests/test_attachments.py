@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Pièces jointes: encodées une fois, ré-encodées seulement quand le fichier change vraiment
+"""
+
+import base64
+import os
+
+from attachments import Attachment, AttachmentRegistry
+
+
+def decoded(attachment: Attachment) -> bytes:
+    return base64.b64decode(attachment.part().get_payload())
+
+
+def test_encoded_once_then_reencoded_when_file_changes(tmp_path):
+    path = tmp_path / "cv.pdf"
+    path.write_bytes(b"%PDF version 1")
+    attachment = Attachment(str(path), check_interval=0)
+    first = attachment.part()
+    assert attachment.part() is first
+    assert decoded(attachment) == b"%PDF version 1"
+    assert attachment.encodings == 1
+
+    # Nouveau contenu, taille différente: relu et ré-encodé
+    path.write_bytes(b"%PDF version 2, plus longue")
+    assert decoded(attachment) == b"%PDF version 2, plus longue"
+    assert attachment.encodings == 2
+    assert attachment.part()['Content-Disposition'] == "attachment; filename= cv.pdf"
+
+
+def test_touched_file_with_same_content_keeps_encoding(tmp_path):
+    path = tmp_path / "cv.pdf"
+    path.write_bytes(b"%PDF identique")
+    attachment = Attachment(str(path), check_interval=0)
+    part = attachment.part()
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    # mtime changée mais empreinte identique: la même partie MIME est gardée
+    assert attachment.part() is part
+    assert attachment.encodings == 1
+
+
+def test_changes_detected_once_per_check_interval(tmp_path):
+    path = tmp_path / "cv.pdf"
+    path.write_bytes(b"avant")
+    attachment = Attachment(str(path), check_interval=3600)
+    path.write_bytes(b"apres, plus long")
+    assert decoded(attachment) == b"avant"
+    attachment._checked_at -= 3600
+    assert decoded(attachment) == b"apres, plus long"
+
+
+def test_missing_file_keeps_cached_version(tmp_path):
+    path = tmp_path / "cv.pdf"
+    path.write_bytes(b"contenu")
+    attachment = Attachment(str(path), check_interval=0)
+    path.unlink()
+    assert decoded(attachment) == b"contenu"
+
+
+def test_registry_resolves_first_existing_candidate_once(tmp_path):
+    path = tmp_path / "cv.pdf"
+    path.write_bytes(b"cv")
+    registry = AttachmentRegistry()
+    candidates = [None, str(tmp_path / "absent.pdf"), str(path)]
+    cv = registry.resolve(candidates, "CV.pdf")
+    assert cv is not None and cv.path == path and cv.filename == "CV.pdf"
+    assert registry.resolve(candidates, "CV.pdf") is cv
+    assert registry.resolve([str(tmp_path / "absent.pdf")], "CV.pdf") is None
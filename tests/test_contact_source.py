@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Source de contacts: dédoublonnage compact, une seule lecture, rejets dans le répertoire des rapports
+"""
+
+import json
+
+from conftest import write_contacts
+from contact_source import CompactSeenSet, ContactSource
+
+
+def test_compact_seen_set_is_exact():
+    # 16 tableaux seulement: plusieurs adresses par tableau
+    seen = CompactSeenSet(bits=4)
+    assert all(seen.add(f"contact{i}@x.test") for i in range(1000))
+    assert not any(seen.add(f"contact{i}@x.test") for i in range(1000))
+    assert len(seen) == 1000
+    assert all(bucket.itemsize == 8 for bucket in seen._buckets)
+
+
+def write_csv(path, emails):
+    path.write_text("company_name,email\n" + "".join(f"Acme,{email}\n" for email in emails),
+                    encoding='utf-8')
+    return str(path)
+
+
+def test_domain_counts_then_iteration_reads_file_once(tmp_path, monkeypatch):
+    csv_path = write_csv(tmp_path / "contacts.csv", ["a@x.test", "b@y.test", "A@x.test", "invalide"])
+    source = ContactSource.from_config(csv_path, None, str(tmp_path))
+    opened = []
+    original = source._open
+    monkeypatch.setattr(source, '_open', lambda: opened.append(1) or original())
+
+    assert source.domain_counts() == {'x.test': 1, 'y.test': 1}
+    assert [c['email'] for c in source] == ["a@x.test", "b@y.test"]
+    assert len(opened) == 1
+    assert source.stats()['rejected'] == {'doublon': 1, 'email invalide': 1}
+
+
+def test_streams_again_beyond_buffer_limit(tmp_path):
+    csv_path = write_csv(tmp_path / "contacts.csv", [f"c{i}@x.test" for i in range(5)])
+    source = ContactSource.from_config(csv_path, {'buffer_limit': 2}, str(tmp_path))
+    assert source.domain_counts() == {'x.test': 5}
+    assert len(list(source)) == 5
+    assert source.stats()['accepted'] == 5
+
+
+def test_rejects_written_to_report_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    reports = tmp_path / "rapports"
+    reports.mkdir()
+    csv_path = write_csv(tmp_path / "contacts.csv", ["invalide"])
+    list(ContactSource.from_config(csv_path, None, str(reports)))
+    assert (reports / "contacts.csv.rejects.jsonl").exists()
+    assert not (tmp_path / "contacts.csv.rejects.jsonl").exists()
+
+
+def test_campaign_streams_contacts_before_the_file_is_read(make_system, tmp_path):
+    system = make_system()
+    contacts = system._start_campaign(write_contacts(tmp_path / "contacts.csv", 50), None, 0, False)
+    assert next(contacts)['email'] == "contact0@domaine0.test"
+    # Total inconnu tant que la lecture n'est pas finie
+    assert system.contact_source.read < 50
+    assert system.expected_contacts == 0
+    assert len(list(contacts)) == 49
+    assert system.expected_contacts == 50
+
+
+def test_estimate_counts_contacts_first(dry_run, make_system, tmp_path):
+    with open(dry_run.config_path, encoding='utf-8') as f:
+        config = json.load(f)
+    config['contacts'] = {**config.get('contacts', {}), 'estimate': True}
+    with open(dry_run.config_path, 'w', encoding='utf-8') as f:
+        json.dump(config, f)
+    system = make_system()
+    contacts = system._start_campaign(write_contacts(tmp_path / "contacts.csv", 50), None, 0, False)
+    assert system.expected_contacts == 50
+    assert len(list(contacts)) == 50
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""
+Exécution à blanc: répertoire de travail créé à la demande, jamais le port /metrics réel
+"""
+
+import copy
+
+from dry_run import DEFAULT_CONFIG, DryRun
+
+
+def test_missing_workdir_is_created_and_metrics_port_is_free(tmp_path, monkeypatch):
+    # main.py journalise dans le répertoire courant
+    monkeypatch.chdir(tmp_path)
+    config = copy.deepcopy(DEFAULT_CONFIG)
+    config['metrics'] = {**config.get('metrics', {}), 'port': 9108}
+    workdir = tmp_path / "a" / "b"
+    with DryRun(config, search_latency=0, llm_latency=0, smtp_latency=0, jitter=0,
+                workdir=str(workdir)) as dry:
+        assert (workdir / "config.json").exists()
+        assert dry.config['metrics']['port'] == 0
+        from main import EmailAutomationSystem
+        system = EmailAutomationSystem(dry.config_path)
+        system.start_metrics_server()
+        try:
+            assert system.metrics_server.port not in (0, 9108)
+        finally:
+            system.metrics_server.close()
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Cache d'emails: plafond d'entrées et éviction LRU, expiration, ligne de commande
+"""
+
+import json
+
+import email_cache
+from conftest import write_contacts
+from email_cache import EmailCache
+
+
+def put(cache: EmailCache, key: str, company: str = "Acme"):
+    cache.put(key, company, "modele", "v1", f"objet {key}", f"corps {key}")
+
+
+def test_lru_eviction_with_running_count(tmp_path):
+    cache = EmailCache(str(tmp_path / "emails.sqlite"), max_entries=3)
+    for i in range(3):
+        put(cache, f"k{i}")
+    # k0 relu: k1 devient la moins récemment lue
+    assert cache.get("k0") == ("objet k0", "corps k0")
+    put(cache, "k3")
+    # Réécrire une entrée existante n'augmente pas le compte
+    put(cache, "k3")
+    assert cache.evictions == 1
+    assert cache.get("k1") is None
+    assert cache.get("k0") is not None and cache.get("k3") is not None
+    assert cache.stats()['entries'] == 3
+    cache.close()
+
+    reopened = EmailCache(str(tmp_path / "emails.sqlite"), max_entries=3)
+    put(reopened, "k4")
+    assert reopened.evictions == 1
+    assert reopened.stats()['entries'] == 3
+    reopened.close()
+
+
+def test_expired_entries_dropped(tmp_path):
+    cache = EmailCache(str(tmp_path / "emails.sqlite"), ttl=-1)
+    put(cache, "k0")
+    put(cache, "k1")
+    assert cache.get("k0") is None
+    assert cache.purge() == 1
+    assert cache.stats()['entries'] == 0
+    assert cache.expired == 2
+    cache.close()
+
+
+def write_config(tmp_path, path) -> str:
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps({'email_cache': {'path': str(path)}}), encoding='utf-8')
+    return str(config_path)
+
+
+def test_cli_stats_list_purge(tmp_path, capsys):
+    path = tmp_path / "emails.sqlite"
+    cache = EmailCache(str(path))
+    put(cache, "k0", "Acme")
+    put(cache, "k1", "Globex")
+    cache.close()
+    config = write_config(tmp_path, path)
+
+    assert email_cache.main(['--config', config, 'stats']) == 0
+    assert json.loads(capsys.readouterr().out)['entries'] == 2
+    assert email_cache.main(['--config', config, 'list', '--company', "Globex"]) == 0
+    assert [json.loads(line)['key'] for line in capsys.readouterr().out.splitlines()] == ["k1"]
+    assert email_cache.main(['--config', config, 'purge', '--company', "Acme"]) == 0
+    assert capsys.readouterr().out.startswith("1 ")
+    assert email_cache.main(['--config', config, 'purge', '--all']) == 0
+    assert capsys.readouterr().out.startswith("1 ")
+
+
+def test_cli_prewarm_fills_the_cache_without_sending(dry_run, tmp_path, capsys):
+    contacts = write_contacts(tmp_path / "contacts.csv", 5)
+    assert email_cache.main(['--config', dry_run.config_path, 'prewarm', contacts]) == 0
+    assert json.loads(capsys.readouterr().out)['entries'] == 5
+    assert dry_run.smtp.stats()['messages'] == 0
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+"""
+File de contacts: un contact abandonné après ``max_attempts`` baux expirés est signalé une fois
+"""
+
+import time
+
+from job_queue import FAILED, JobQueue, LeaseAbandoned
+
+
+def test_abandoned_contact_reported(tmp_path):
+    abandoned = []
+    queue = JobQueue(str(tmp_path / "queue.sqlite"), lease_seconds=0.01, max_attempts=1,
+                     on_abandoned=lambda item, error: abandoned.append((item, error)))
+    queue.enqueue("lot", [{'company_name': "Acme", 'email': "a@x.test"}])
+    assert len(queue.claim("lot")) == 1
+    time.sleep(0.05)
+
+    # Bail expiré, plus aucun essai: le contact n'est pas réattribué
+    assert queue.claim("lot") == []
+    assert queue.claim("lot") == []
+    assert len(abandoned) == 1
+    item, error = abandoned[0]
+    assert item['contact']['email'] == "a@x.test"
+    assert isinstance(error, LeaseAbandoned)
+    assert queue.summary("lot")['states'] == {FAILED: 1}
+    queue.close()
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Client LLM contre le faux OpenRouter local: connexions keep-alive réutilisées, lots
+"""
+
+import pytest
+
+from dry_run import Latency, MockAPIServer
+from llm_client import LLMClient
+
+
+@pytest.fixture
+def api():
+    server = MockAPIServer(Latency(), Latency(0.02))
+    connections = []
+    accept = server._server.get_request
+
+    def counting_accept():
+        request = accept()
+        connections.append(request[1])
+        return request
+    server._server.get_request = counting_accept
+    server.connections = connections
+    server.start()
+    yield server
+    server.stop()
+
+
+def make_client(api, **options) -> LLMClient:
+    return LLMClient(api.url, "cle", "modele", **options)
+
+
+def test_concurrent_batches_reuse_keep_alive_connections(api):
+    client = make_client(api, max_workers=4, pool_size=4)
+    for _ in range(3):
+        contents = client.complete_many("système", [f"demande {i}" for i in range(4)])
+        assert all(content.startswith("OBJET:") for content in contents)
+    assert api.completions == 12
+    # Au plus une connexion par requête simultanée, réutilisée d'un lot à l'autre
+    assert len(api.connections) <= 4
+    assert client.stats()['emails'] == 12
+
+
+def test_packed_batch_is_one_request(api):
+    client = make_client(api)
+    contents = client.complete_packed("système", [f"demande {i}" for i in range(5)])
+    assert api.completions == 1
+    assert len(contents) == 5 and all(content.startswith("OBJET:") for content in contents)
+    assert client.stats()['emails'] == 5
+
+
+def test_pool_sized_for_all_generation_workers():
+    config = {'base_url': "http://127.0.0.1", 'api_key': "cle", 'model': "modele", 'batch_size': 1}
+    client = LLMClient.from_config(config, workers=6)
+    assert client.max_workers == 1
+    assert client.pool_size == 6
+    client.ensure_pool(12)
+    assert client.pool_size == 12
+    assert client.session.get_adapter("http://127.0.0.1")._pool_maxsize == 12
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Gabarit MIME: mêmes octets que ``MIMEMultipart.as_bytes`` (en-têtes ASCII, accentués, repliés)
+"""
+
+import base64
+import re
+from email.mime.base import MIMEBase
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+import pytest
+
+from message_template import MessageTemplate
+
+BOUNDARY = "===============1234567890123456789=="
+BODY = "Bonjour,\n\nJe me permets de vous écrire au sujet d'un poste.\n" * 10
+SUBJECTS = [
+    "Candidature - Ingénieur IA/ML",
+    "Application",
+    "A plain ascii subject that is long enough to need folding at the seventy-eight column limit",
+    "Candidature spontanée pour un poste d'ingénieur en intelligence artificielle chez Société Générale Très Longue",
+]
+
+
+def pdf_part(filename: str = "CV.pdf") -> MIMEBase:
+    part = MIMEBase('application', 'pdf')
+    part.set_payload(base64.encodebytes(b"%PDF-1.4\n" + bytes(range(256)) * 8).decode('ascii'))
+    part['Content-Transfer-Encoding'] = 'base64'
+    part.add_header('Content-Disposition', f'attachment; filename= {filename}')
+    return part
+
+
+def legacy_bytes(from_header, to_email, subject, body, headers, parts, boundary=BOUNDARY) -> bytes:
+    msg = MIMEMultipart(boundary=boundary)
+    msg['From'] = from_header
+    msg['To'] = to_email
+    msg['Subject'] = subject
+    for name, value in headers:
+        msg[name] = value
+    msg.attach(MIMEText(body, 'plain', 'utf-8'))
+    for part in parts:
+        msg.attach(part)
+    return msg.as_bytes(policy=msg.policy.clone(linesep="\r\n"))
+
+
+@pytest.mark.parametrize('subject', SUBJECTS)
+@pytest.mark.parametrize('from_header', ["Jean Dupont <jean@x.test>", "Zoé Éléonore <zoe@x.test>"])
+@pytest.mark.parametrize('attachments', [0, 2])
+def test_render_matches_mimemultipart(subject, from_header, attachments):
+    parts = [pdf_part(f"piece{i}.pdf") for i in range(attachments)]
+    headers = [('Message-ID', "<1.abc@x.test>")]
+    rendered = MessageTemplate(from_header, parts, boundary=BOUNDARY).render("contact@y.test", subject,
+                                                                              BODY, headers)
+    assert rendered == legacy_bytes(from_header, "contact@y.test", subject, BODY, headers, parts)
+
+
+def test_system_render_matches_build_message(make_system, tmp_path):
+    cv_path = tmp_path / "cv.pdf"
+    cv_path.write_bytes(b"%PDF-1.4\n" + b"0" * 4096)
+    system = make_system()
+    for subject in SUBJECTS:
+        args = ("contact@y.test", "Entreprise Été", subject, BODY, str(cv_path))
+        msg, cv_attached = system.build_message(*args, message_id="<2.def@x.test>")
+        expected = msg.as_bytes(policy=msg.policy.clone(linesep="\r\n"))
+        data, _, rendered_cv = system.render_message(*args, message_id="<2.def@x.test>")
+        # Seule la frontière, tirée au hasard, diffère
+        boundary = re.search(rb'boundary="([^"]+)"', data).group(1)
+        assert data.replace(boundary, msg.get_boundary().encode('ascii')) == expected
+        assert cv_attached and rendered_cv
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+Métriques: exposition /metrics au format Prometheus, histogrammes, échantillonnage des logs
+"""
+
+import logging
+import urllib.error
+import urllib.request
+
+import pytest
+
+from metrics import Histogram, LogSampler, MetricsRegistry, MetricsServer, percentile
+
+
+def test_histogram_buckets_and_percentiles():
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+    # Bornes inclusives, la valeur au-delà de la dernière borne ne compte que dans +Inf
+    assert histogram.counts == [2, 1]
+    assert histogram.count == 4 and histogram.sum == pytest.approx(2.65)
+    assert percentile([3, 1, 2, 4], 50) == 2
+    assert percentile([], 99) == 0
+
+
+def test_metrics_endpoint_serves_prometheus_text():
+    registry = MetricsRegistry()
+    registry.describe('emails_total', "Contacts traités, par résultat")
+    registry.inc('emails_total', result='sent')
+    registry.inc('emails_total', 2, result='sent')
+    registry.observe('stage_duration_seconds', 0.003, stage='smtp')
+    registry.observe('stage_duration_seconds', 0.2, stage='smtp')
+    registry.register_collector(lambda: [('queue_depth', 'gauge', "Profondeur des files", {'stage': 'send'}, 4)])
+
+    server = MetricsServer(registry, port=0)
+    try:
+        url = f"http://127.0.0.1:{server.port}"
+        with urllib.request.urlopen(url + "/metrics", timeout=5) as response:
+            assert response.headers['Content-Type'].startswith("text/plain; version=0.0.4")
+            lines = response.read().decode('utf-8').splitlines()
+        with pytest.raises(urllib.error.HTTPError) as missing:
+            urllib.request.urlopen(url + "/autre", timeout=5)
+        assert missing.value.code == 404
+        missing.value.close()
+    finally:
+        server.close()
+
+    assert "# HELP emails_total Contacts traités, par résultat" in lines
+    assert "# TYPE emails_total counter" in lines
+    assert 'emails_total{result="sent"} 3' in lines
+    assert "# TYPE stage_duration_seconds histogram" in lines
+    # Compteurs cumulatifs par borne
+    assert 'stage_duration_seconds_bucket{le="0.001",stage="smtp"} 0' in lines
+    assert 'stage_duration_seconds_bucket{le="0.005",stage="smtp"} 1' in lines
+    assert 'stage_duration_seconds_bucket{le="0.25",stage="smtp"} 2' in lines
+    assert 'stage_duration_seconds_bucket{le="+Inf",stage="smtp"} 2' in lines
+    assert 'stage_duration_seconds_count{stage="smtp"} 2' in lines
+    assert "# TYPE queue_depth gauge" in lines
+    assert 'queue_depth{stage="send"} 4' in lines
+
+
+def test_log_sampler_levels():
+    sampler = LogSampler(every=3)
+    assert [sampler.level('sent') for _ in range(7)] == [logging.INFO, logging.DEBUG, logging.DEBUG,
+                                                         logging.INFO, logging.DEBUG, logging.DEBUG,
+                                                         logging.INFO]
+    # Compté par clé
+    assert sampler.level('quota') == logging.INFO
+    assert LogSampler(every=0).level('x') == logging.INFO
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""
+Outbox préparée et reprise de campagne: aucun contact n'est envoyé deux fois
+"""
+
+from conftest import write_contacts
+from journal import SENT
+
+
+def test_resume_after_prepare_leaves_prepared_contacts_to_the_outbox(dry_run, make_system, tmp_path):
+    contacts = write_contacts(tmp_path / "contacts.csv", 6)
+    batch = make_system().prepare_campaign(contacts)
+
+    # Reprise de la même campagne: les contacts déjà dans l'outbox ne sont pas retraités
+    make_system().run_email_campaign(contacts, delay_between_emails=0, resume=True)
+    assert dry_run.smtp.stats()['messages'] == 0
+
+    make_system().send_outbox(batch, delay_between_emails=0)
+    assert dry_run.smtp.stats()['messages'] == 6
+
+
+def test_send_outbox_skips_contacts_already_sent(dry_run, make_system, tmp_path):
+    contacts = write_contacts(tmp_path / "contacts.csv", 4)
+    system = make_system()
+    batch = system.prepare_campaign(contacts)
+    # Envoyé entre-temps par un autre chemin (campagne directe reprise, autre processus)
+    system.journal.record("contact0@domaine0.test", SENT, run_id=batch)
+
+    sender = make_system()
+    sender.send_outbox(batch, delay_between_emails=0)
+    assert dry_run.smtp.stats()['messages'] == 3
+    assert sender.outbox.stats(batch)['states'] == {'sent': 4}
+
+
+def test_message_is_claimed_once(dry_run, make_system, tmp_path):
+    contacts = write_contacts(tmp_path / "contacts.csv", 3)
+    system = make_system()
+    batch = system.prepare_campaign(contacts)
+    row = next(system.outbox.pending(batch))
+
+    # Un autre processus a lu la même ligne en attente et l'envoie déjà
+    assert make_system().outbox.claim(row['id'])
+    assert not system.outbox.claim(row['id'])
+    assert system._send_prepared(row, batch) is None
+    assert dry_run.smtp.stats()['messages'] == 0
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline par étages: fin de flux garantie même quand le traitement d'erreur échoue,
+éléments limités par les quotas mis de côté sans bloquer les workers
+"""
+
+import threading
+import time
+
+import pytest
+
+from pipeline import CampaignPipeline, Deferred, Stage
+
+
+def run_with_timeout(pipeline: CampaignPipeline, items, timeout: float = 10) -> int:
+    result = {}
+    thread = threading.Thread(target=lambda: result.setdefault('count', pipeline.run(items)), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "le pipeline ne s'est pas terminé"
+    return result['count']
+
+
+def fail(item):
+    raise ValueError(item)
+
+
+def test_failing_error_callback_does_not_hang_pipeline():
+    def on_error(stage, item, error):
+        raise RuntimeError("rappel en échec")
+
+    pipeline = CampaignPipeline([Stage('a', lambda x: x, 2), Stage('b', fail, 1)], queue_size=2,
+                                on_error=on_error)
+    assert run_with_timeout(pipeline, range(20)) == 20
+    assert pipeline.stats()['b']['errors'] == 20
+
+
+def test_failing_error_callback_in_batch_stage():
+    pipeline = CampaignPipeline([Stage('a', fail, 1, batch_size=4, batch_wait=0.01), Stage('b', lambda x: x)],
+                                on_error=lambda stage, item, error: 1 / 0)
+    assert run_with_timeout(pipeline, range(10)) == 10
+
+
+def test_errors_reported_once_per_item():
+    seen = []
+    pipeline = CampaignPipeline([Stage('a', lambda x: fail(x) if x % 2 else x, 3)],
+                                on_error=lambda stage, item, error: seen.append(item))
+    run_with_timeout(pipeline, range(10))
+    assert sorted(seen) == [1, 3, 5, 7, 9]
+
+
+def test_throttled_item_does_not_block_others():
+    ready_at = {'lent': 0.3}
+    calls = {}
+    done = []
+
+    def throttle(item):
+        calls[item] = calls.get(item, 0) + 1
+        return ready_at.get(item, 0) if calls[item] == 1 else 0
+
+    pipeline = CampaignPipeline([Stage('send', done.append, 1, throttle=throttle)])
+    assert run_with_timeout(pipeline, ['lent', 'a', 'b', 'c']) == 4
+    # Le contact bloqué est mis de côté puis envoyé en dernier, après la fin du flux d'entrée
+    assert done == ['a', 'b', 'c', 'lent']
+    assert pipeline.stats()['send']['deferrals'] == 1
+
+
+def test_throttled_stage_stops_reading_when_too_many_deferred():
+    calls = []
+
+    def throttle(item):
+        calls.append(item)
+        return 0.05 if calls.count(item) == 1 else 0
+
+    done = []
+    pipeline = CampaignPipeline([Stage('send', done.append, 1, throttle=throttle, max_deferred=2)],
+                                queue_size=1)
+    assert run_with_timeout(pipeline, range(6)) == 6
+    assert sorted(done) == list(range(6))
+    # Jamais plus de deux éléments mis de côté: 0 et 1 repassent avant que 2 ne soit lu
+    assert calls.index(2) > calls.index(0, 1)
+
+
+def test_throttled_queue_keeps_order_within_key():
+    from rate_limiter import RateScheduler
+    scheduler = RateScheduler.from_config({
+        'domain': {'rate': 1000, 'per': 1, 'burst': 1000},
+        'domains': {'lent.com': {'rate': 1, 'per': 0.1, 'burst': 1}}
+    })
+    done = []
+    pipeline = CampaignPipeline([Stage('send', done.append, 1, throttle=scheduler.try_acquire,
+                                       throttle_key=lambda email: email.rsplit('@', 1)[-1])])
+    emails = [f"a{i}@{'lent.com' if i < 4 else 'ok.com'}" for i in range(10)]
+    assert run_with_timeout(pipeline, emails) == 10
+    # Le domaine rapide n'attend pas le domaine limité, qui garde son ordre
+    assert done[:7] == ['a0@lent.com'] + emails[4:]
+    assert done[7:] == emails[1:4]
+
+
+def test_deferred_item_goes_back_through_throttle():
+    throttled = []
+    done = []
+    failed_over = set()
+
+    def send(item):
+        if item == 'bascule' and item not in failed_over:
+            # Compte de bascule sans quota: le worker ne dort pas, l'élément est remis en file
+            failed_over.add(item)
+            raise Deferred(0.2)
+        done.append(item)
+
+    def throttle(item):
+        throttled.append(item)
+        return 0
+
+    pipeline = CampaignPipeline([Stage('send', send, 1, throttle=throttle)])
+    started = time.monotonic()
+    assert run_with_timeout(pipeline, ['bascule', 'a', 'b']) == 3
+    assert done == ['a', 'b', 'bascule']
+    assert throttled.count('bascule') == 2
+    assert time.monotonic() - started >= 0.2
+    stats = pipeline.stats()['send']
+    assert (stats['deferrals'], stats['errors'], stats['processed']) == (1, 0, 3)
+
+
+def test_failover_without_quota_defers_instead_of_sleeping(tmp_path, monkeypatch):
+    # main.py journalise dans le répertoire courant
+    monkeypatch.chdir(tmp_path)
+    from main import EmailAutomationSystem
+
+    class NoQuota:
+        def try_acquire(self, recipient, account=None):
+            return 120.0
+
+        def acquire(self, recipient, account=None):
+            raise AssertionError("attente bloquante dans le worker d'envoi")
+
+    class Account:
+        def __init__(self, email):
+            self.email = email
+
+    system = EmailAutomationSystem.__new__(EmailAutomationSystem)
+    system.rate_scheduler = NoQuota()
+    alternative = Account("b@x.test")
+    system.failover_after = lambda to_email, sender, error: alternative
+
+    def send(account):
+        raise ConnectionError("421 trop d'envois")
+
+    with pytest.raises(Deferred) as raised:
+        system.send_with_failover("c@y.test", Account("a@x.test"), send, defer=True)
+    assert raised.value.delay == 120.0
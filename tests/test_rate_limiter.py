@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Seaux à jetons et planificateur de quotas: réservation sans attente, rien consommé si refusé
+"""
+
+import pytest
+
+from rate_limiter import RateScheduler, TokenBucket
+
+
+def test_token_bucket_refill_and_wait():
+    bucket = TokenBucket(rate=0.5, capacity=2, updated=100.0)
+    assert bucket.time_until(100.0) == 0
+    bucket.consume(100.0)
+    bucket.consume(100.0)
+    assert bucket.time_until(100.0) == pytest.approx(2.0)
+    # Un jeton regagné toutes les deux secondes, jamais au-delà de la capacité
+    assert bucket.time_until(101.0) == pytest.approx(1.0)
+    assert bucket.time_until(102.0) == 0
+    bucket.refill(1000.0)
+    assert bucket.tokens == 2
+    assert bucket.time_for(6) == pytest.approx(8.0)
+    assert TokenBucket(rate=0, capacity=1, tokens=0).time_until(0) == float('inf')
+
+
+def test_try_acquire_consumes_only_when_allowed():
+    scheduler = RateScheduler.from_config({
+        'domain': {'rate': 1, 'per': 60, 'burst': 1},
+        'accounts': {'a@x.test': {'rate': 1, 'per': 3600, 'burst': 2}}
+    })
+    assert scheduler.try_acquire("c1@lent.test", account="a@x.test") == 0
+    # Même domaine: refusé, avec l'attente avant le prochain jeton
+    assert 0 < scheduler.try_acquire("c2@lent.test", account="a@x.test") <= 60
+    # Autre domaine: le jeton du compte n'a pas été pris par le refus précédent
+    assert scheduler.try_acquire("c3@autre.test", account="a@x.test") == 0
+    assert scheduler.try_acquire("c4@encore.test", account="a@x.test") > 60
+    assert scheduler.acquired == 2
+
+
+def test_default_interval_sets_global_pace():
+    scheduler = RateScheduler.from_config(None, default_interval=10)
+    assert scheduler.try_acquire("a@x.test") == 0
+    assert 9 < scheduler.try_acquire("b@y.test") <= 10
+    assert RateScheduler.from_config(None).try_acquire("b@y.test") == 0
+
+
+def test_state_survives_restart(tmp_path):
+    config = {'global': {'rate': 1, 'per': 3600, 'burst': 1}, 'state_file': str(tmp_path / "etat.json")}
+    scheduler = RateScheduler.from_config(config)
+    assert scheduler.try_acquire("a@x.test") == 0
+    scheduler.save()
+    assert RateScheduler.from_config(config).try_acquire("b@x.test") > 3000
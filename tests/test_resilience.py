@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Résilience: classement des erreurs, disjoncteur, réessais et lettres mortes
+"""
+
+import json
+import smtplib
+import time
+
+import pytest
+import requests
+
+from contact_source import ContactSource
+from resilience import (CLOSED, HALF_OPEN, OPEN, CircuitBreaker, DeadLetterQueue, Endpoint,
+                        RetryPolicy, TransientError, http_error, is_transient)
+from smtp_pool import DeliveryUncertain
+
+
+@pytest.mark.parametrize('error, transient', [
+    (TransientError("429"), True),
+    (requests.ConnectionError(), True),
+    (requests.Timeout(), True),
+    (TimeoutError(), True),
+    (smtplib.SMTPServerDisconnected(), True),
+    (smtplib.SMTPResponseException(421, b"trop de connexions"), True),
+    (smtplib.SMTPResponseException(550, b"boite inconnue"), False),
+    (smtplib.SMTPRecipientsRefused({'a@x.test': (450, b"plus tard")}), True),
+    (smtplib.SMTPRecipientsRefused({'a@x.test': (450, b""), 'b@x.test': (550, b"")}), False),
+    # DATA commencé: le message a peut-être été accepté, jamais renvoyé
+    (DeliveryUncertain("connexion perdue pendant DATA"), False),
+    (ValueError("réponse illisible"), False),
+])
+def test_is_transient(error, transient):
+    assert is_transient(error) is transient
+
+
+def test_http_error_classification():
+    assert isinstance(http_error("Serper", 503), TransientError)
+    assert http_error("Serper", 429, "7").retry_after == 7
+    assert not isinstance(http_error("Serper", 401), TransientError)
+
+
+def test_breaker_opens_half_opens_and_closes():
+    breaker = CircuitBreaker("service", failure_threshold=2, reset_timeout=0.1)
+    breaker.record_failure()
+    assert breaker.state == CLOSED and breaker.wait_time() == 0
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert 0 < breaker.wait_time() <= 0.1
+
+    time.sleep(0.12)
+    # Une seule requête d'essai à la fois en demi-ouvert
+    assert breaker.wait_time() == 0
+    assert breaker.state == HALF_OPEN
+    assert breaker.wait_time() > 0
+    # Échec de l'essai: rouvert aussitôt, sans attendre le seuil
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+    time.sleep(0.12)
+    assert breaker.wait_time() == 0
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.failures == 0
+    assert breaker.stats()['opens'] == 2
+
+
+def test_retry_after_opens_breaker_for_requested_time():
+    breaker = CircuitBreaker("service", failure_threshold=5, reset_timeout=0.01)
+    breaker.record_failure(retry_after=30)
+    assert breaker.state == OPEN
+    assert breaker.wait_time() > 29
+
+
+def make_endpoint(max_attempts: int = 3) -> Endpoint:
+    return Endpoint("service", RetryPolicy(max_attempts, base_delay=0.001, max_delay=0.001),
+                    CircuitBreaker("service", failure_threshold=10))
+
+
+def test_endpoint_retries_transient_errors_only():
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise TransientError("503")
+        return "ok"
+
+    endpoint = make_endpoint()
+    assert endpoint.call(flaky) == "ok"
+    assert (endpoint.retries, endpoint.failures) == (2, 0)
+
+    def uncertain():
+        attempts.append(1)
+        raise DeliveryUncertain("connexion perdue pendant DATA")
+
+    attempts.clear()
+    with pytest.raises(DeliveryUncertain):
+        endpoint.call(uncertain)
+    assert len(attempts) == 1
+    assert endpoint.failures == 1
+
+
+def test_endpoint_gives_up_after_max_attempts():
+    def unavailable():
+        raise TransientError("503")
+
+    endpoint = make_endpoint(max_attempts=2)
+    with pytest.raises(TransientError):
+        endpoint.call(unavailable)
+    assert (endpoint.calls, endpoint.retries, endpoint.failures) == (1, 1, 1)
+
+
+def test_retry_policy_respects_retry_after():
+    policy = RetryPolicy(base_delay=1, max_delay=2, max_retry_after=10)
+    assert all(0 <= policy.delay(attempt) <= 2 for attempt in range(1, 10))
+    assert policy.delay(1, retry_after=5) >= 5
+    assert policy.delay(1, retry_after=60) == 10
+
+
+def test_dead_letters_persist_and_reload_as_contacts(tmp_path):
+    path = str(tmp_path / "dead_letter.jsonl")
+    DeadLetterQueue(path).add({'company_name': "Acme", 'email': "a@x.test", 'Nom_ceo': "Alice",
+                               'Titre': "CEO", 'subject': "ignoré"}, 'send', "refus")
+    # Nouvelle instance (nouveau processus): ajout à la suite, rien d'écrasé
+    queue = DeadLetterQueue(path)
+    queue.add({'company_name': "Globex", 'email': "b@x.test"}, 'generate', "échec")
+    assert queue.stats() == {'path': path, 'count': 1}
+
+    with open(path, encoding='utf-8') as f:
+        entries = [json.loads(line) for line in f]
+    assert [(e['email'], e['stage'], e['error']) for e in entries] == [
+        ("a@x.test", 'send', "refus"), ("b@x.test", 'generate', "échec")]
+    assert 'subject' not in entries[0]
+    # Relisible tel quel comme source de contacts
+    contacts = list(ContactSource(path))
+    assert [(c['company_name'], c['email']) for c in contacts] == [("Acme", "a@x.test"), ("Globex", "b@x.test")]
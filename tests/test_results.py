@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+"""
+Fichier de résultats: agrégats et dernières lignes malgré une ligne abîmée
+"""
+
+import json
+
+from results import summarize, tail
+
+
+def test_corrupt_lines_are_skipped(tmp_path):
+    path = tmp_path / "email_results.jsonl"
+    results = [{'email': "a@x.test", 'success': True, 'timestamp': "2026-01-01T10:00:00"},
+               {'email': "c@x.test", 'success': False, 'stage': 'send', 'timestamp': "2026-01-01T10:01:00"}]
+    with open(path, 'wb') as f:
+        f.write((json.dumps(results[0]) + "\n").encode('utf-8'))
+        # Écriture coupée par un crash, puis reprise à la suite
+        f.write(b'{"email": "b@x.te\n')
+        f.write((json.dumps(results[1]) + "\n").encode('utf-8'))
+
+    summary = summarize(str(path))
+    assert summary['corrupt_lines'] == 1
+    assert summary['scanned_lines'] == 2
+    assert summary['sent_successfully'] == 1 and summary['failed'] == 1
+    assert [result['email'] for result in tail(str(path))] == ["a@x.test", "c@x.test"]
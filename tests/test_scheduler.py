@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+Planificateur: au démarrage, seuls les minuteurs abandonnés sont repris
+"""
+
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from scheduler import PENDING, RUNNING, Scheduler
+
+
+def running_timer(scheduler: Scheduler, owner: str, claimed_at: float) -> int:
+    timer_id = scheduler.add("campagne", "send", time.time() + 3600, {})
+    with scheduler._db:
+        scheduler._db.execute("UPDATE timers SET state = ?, owner = ?, claimed_at = ? WHERE id = ?",
+                              (RUNNING, owner, claimed_at, timer_id))
+    return timer_id
+
+
+def state(scheduler: Scheduler, timer_id: int) -> str:
+    return scheduler._db.execute("SELECT state FROM timers WHERE id = ?", (timer_id,)).fetchone()[0]
+
+
+def test_recover_leaves_timers_of_live_schedulers(tmp_path):
+    scheduler = Scheduler(str(tmp_path / "scheduler.sqlite"), stale_after=60)
+    host = socket.gethostname()
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+
+    mine = running_timer(scheduler, scheduler.owner, time.time())
+    crashed = running_timer(scheduler, f"{host}:{dead.pid}", time.time())
+    alive = running_timer(scheduler, f"{host}:{os.getppid()}", time.time() - 7200)
+    remote = running_timer(scheduler, "autre-machine:42", time.time())
+    remote_stale = running_timer(scheduler, "autre-machine:43", time.time() - 120)
+
+    scheduler._load(recover=True)
+    assert state(scheduler, mine) == PENDING
+    assert state(scheduler, crashed) == PENDING
+    assert state(scheduler, alive) == RUNNING
+    assert state(scheduler, remote) == RUNNING
+    assert state(scheduler, remote_stale) == PENDING
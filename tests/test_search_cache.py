@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""
+Cache des recherches: comptage des défauts et plafond d'entrées
+"""
+
+from search_cache import SearchCache
+
+
+def test_miss_counted_on_lookup(tmp_path):
+    cache = SearchCache(str(tmp_path / "cache.sqlite"))
+    assert cache.lookup("acme", "Maroc", "ma") is None
+    assert cache.stats()['misses'] == 1
+    cache.store("acme", "Maroc", "ma", {'organic': []})
+    assert cache.stats()['misses'] == 1
+    assert cache.get_or_fetch("acme", "Maroc", "ma", lambda: 1 / 0) == {'organic': []}
+    assert cache.stats()['misses'] == 1
+    cache.close()
+
+
+def test_max_entries_with_running_count(tmp_path):
+    cache = SearchCache(str(tmp_path / "cache.sqlite"), max_entries=3, memory_entries=0)
+    for i in range(5):
+        cache.store(f"q{i}", "", "", {'i': i})
+    # Réécrire une entrée existante n'augmente pas le compte
+    cache.store("q4", "", "", {'i': 4})
+    assert cache.stats()['entries'] == 3
+    assert cache.evictions == 2
+    assert cache.lookup("q0", "", "") is None
+    assert cache.lookup("q4", "", "") == {'i': 4}
+    cache.close()
+
+    reopened = SearchCache(str(tmp_path / "cache.sqlite"), max_entries=3)
+    reopened.store("q5", "", "", {'i': 5})
+    assert reopened.stats()['entries'] == 3
+    reopened.close()
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Pool SMTP contre un serveur aiosmtpd local: réutilisation, reconnexion, pas de doublon après DATA
+"""
+
+import socket
+import time
+
+import pytest
+
+aiosmtpd_controller = pytest.importorskip("aiosmtpd.controller")
+
+from smtp_pool import DeliveryUncertain, SMTPConnectionPool
+
+
+class Recorder:
+    """Garde les messages reçus; ``drop_after_data`` coupe la connexion au lieu de répondre à DATA"""
+
+    def __init__(self):
+        self.messages = []
+        self.drop_after_data = False
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope.content)
+        if self.drop_after_data:
+            self.drop_after_data = False
+            server.transport.close()
+            return None
+        return "250 OK"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def server():
+    handler = Recorder()
+    controller = aiosmtpd_controller.Controller(handler, hostname="127.0.0.1", port=free_port())
+    controller.start()
+    controller.handler_obj = handler
+    yield controller
+    controller.stop()
+
+
+def make_pool(controller, **options) -> SMTPConnectionPool:
+    options = {'size': 1, 'use_tls': False, 'timeout': 5, **options}
+    return SMTPConnectionPool("127.0.0.1", controller.port, "", "", **options)
+
+
+MESSAGE = b"Subject: test\r\n\r\nbonjour\r\n"
+
+
+def test_session_reused_across_messages(server):
+    with make_pool(server) as pool:
+        for i in range(5):
+            pool.sendmail("me@x.test", f"to{i}@y.test", MESSAGE)
+        stats = pool.stats()[0]
+    assert len(server.handler_obj.messages) == 5
+    assert stats['connections'] == 1
+    assert stats['messages_sent'] == 5
+
+
+def test_session_recycled_after_message_quota(server):
+    with make_pool(server, max_messages_per_session=2) as pool:
+        for i in range(4):
+            pool.sendmail("me@x.test", f"to{i}@y.test", MESSAGE)
+        stats = pool.stats()[0]
+    assert stats['connections'] == 2
+    # Fermée dès son retour dans le pool, pas au prochain emprunt
+    assert not stats['connected']
+
+
+def test_idle_session_closed_by_reaper(server):
+    pool = make_pool(server, idle_timeout=0.2)
+    try:
+        pool.sendmail("me@x.test", "to@y.test", MESSAGE)
+        assert pool.stats()[0]['connected']
+        time.sleep(0.8)
+        assert not pool.stats()[0]['connected']
+        # Rouverte à la demande
+        pool.sendmail("me@x.test", "to@y.test", MESSAGE)
+        assert pool.stats()[0]['connections'] == 2
+    finally:
+        pool.close()
+
+
+def test_reconnects_when_server_dropped_connection_before_data():
+    handler = Recorder()
+    port = free_port()
+    controller = aiosmtpd_controller.Controller(handler, hostname="127.0.0.1", port=port)
+    controller.start()
+    pool = SMTPConnectionPool("127.0.0.1", port, "", "", size=1, use_tls=False, timeout=5)
+    try:
+        pool.sendmail("me@x.test", "a@y.test", MESSAGE)
+        # Redémarrage du serveur: la session ouverte est morte sans que le client le sache
+        controller.stop()
+        controller = aiosmtpd_controller.Controller(handler, hostname="127.0.0.1", port=port)
+        controller.start()
+        pool.sendmail("me@x.test", "b@y.test", MESSAGE)
+        stats = pool.stats()[0]
+    finally:
+        pool.close()
+        controller.stop()
+    assert len(handler.messages) == 2
+    assert stats['reconnects'] == 1
+
+
+def test_no_resend_when_connection_lost_during_data(server):
+    server.handler_obj.drop_after_data = True
+    with make_pool(server) as pool:
+        with pytest.raises(DeliveryUncertain):
+            pool.sendmail("me@x.test", "to@y.test", MESSAGE)
+        # La session suivante repart proprement
+        pool.sendmail("me@x.test", "other@y.test", MESSAGE)
+    assert len(server.handler_obj.messages) == 2
+
+
+def test_no_resend_when_reconnected_session_loses_data():
+    handler = Recorder()
+    port = free_port()
+    controller = aiosmtpd_controller.Controller(handler, hostname="127.0.0.1", port=port)
+    controller.start()
+    pool = SMTPConnectionPool("127.0.0.1", port, "", "", size=1, use_tls=False, timeout=5)
+    try:
+        pool.sendmail("me@x.test", "a@y.test", MESSAGE)
+        # Session morte avant DATA, puis la session reconnectée est coupée pendant DATA
+        controller.stop()
+        controller = aiosmtpd_controller.Controller(handler, hostname="127.0.0.1", port=port)
+        controller.start()
+        handler.drop_after_data = True
+        with pytest.raises(DeliveryUncertain):
+            pool.sendmail("me@x.test", "b@y.test", MESSAGE)
+    finally:
+        pool.close()
+        controller.stop()
+    assert len(handler.messages) == 2
+    assert pool.stats()[0]['reconnects'] == 1